@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the ASCII reply parser of the Keithley 27XX driver
+
+The parser is fed with synthetic FETCH? replies of 10 to 400 readings, generated in the format of a 2701 fitted with a
+7702 card (READ,TST,RNUM elements, units attached). Run it with:
+
+    python -m pymodaq_plugins_keithley.benchmarks.bench_27XX_parser [--json results.json]
+"""
+import argparse
+import json
+import random
+import timeit
+
+import numpy as np
+
+from pymodaq_plugins_keithley import __version__
+from pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_VISADriver import parse_ascii_answer
+
+READINGS = [10, 40, 80, 200, 400]
+# Units reported by the 27XX (4-wire OHM4W is left out: the legacy parser chokes on its digit)
+UNITS = ['VDC', 'VAC', 'ADC', 'AAC', 'OHM', 'HZ', 'C']
+
+
+def synthetic_answer(n_readings, seed=0):
+    """Build a FETCH? reply of n_readings random readings, in the format sent by the instrument"""
+    rand = random.Random(seed)
+    elements = []
+    for ind in range(n_readings):
+        elements.append('{:+.8E}{}'.format(rand.uniform(-10, 100), UNITS[ind % len(UNITS)]))
+        elements.append('{:+09.3f}SECS'.format(0.021 * ind))
+        elements.append('{:+06d}RDNG#'.format(ind))
+    return ','.join(elements)
+
+
+def legacy_parse(str_answer):
+    """Reference parser of releases up to 1.2.0, stripping units one character at a time"""
+    list_split_answer = str_answer.split(",")
+    list_measurements = list_split_answer[::3]
+    list_times = list_split_answer[1::3]
+    str_measurements = []
+    str_times = []
+    for measurement, time in zip(list_measurements, list_times):
+        for strings, element in ((str_measurements, measurement), (str_times, time)):
+            for ind in range(len(element)):
+                if element[-(ind + 1)].isdigit():
+                    strings.append(element if ind == 0 else element[:-ind])
+                    break
+    return np.array(str_measurements, dtype=float), np.array(str_times, dtype=float)
+
+
+def bench(parser, n_readings, repeat=5):
+    """Return the best time (s) spent by parser on a reply of n_readings readings"""
+    answer = synthetic_answer(n_readings)
+    number = max(1, 20000 // n_readings)
+    return min(timeit.repeat(lambda: parser(answer), number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--json', help='Path of the json file where results are written')
+    parser.add_argument('--legacy', action='store_true', help='Also time the parser of releases up to 1.2.0')
+    args = parser.parse_args()
+
+    results = {'version': __version__, 'parsers': {}}
+    parsers = {'parse_ascii_answer': lambda answer: parse_ascii_answer(answer)}
+    if args.legacy:
+        parsers['legacy'] = legacy_parse
+    for name, func in parsers.items():
+        results['parsers'][name] = {}
+        for n_readings in READINGS:
+            duration = bench(func, n_readings)
+            results['parsers'][name][n_readings] = {'time_s': duration, 'readings_per_s': n_readings / duration}
+            print('{:<20} {:>4} readings: {:10.1f} us  {:12.0f} readings/s'.format(
+                name, n_readings, duration * 1e6, n_readings / duration))
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Acquisition throughput benchmark of the Keithley drivers and plugins
+
+The hot acquisition paths (27XX data(), 2100/2110 read(), 2100 read_burst(), Pico grab_data, 2400 move_Abs and
+sweep) are driven against the simulated instruments running on a virtual clock, so that the instrument and bus
+timings are modelled without waiting for them. For each configuration, it reports:
+
+- readings_per_s: readings acquired per second of instrument time (integration, triggers and bus transfers)
+- latency_p50_ms / latency_p99_ms: instrument time per grab
+- bytes_per_grab: bytes written to and read from the instrument for each grab
+- cpu_us_per_reading: Python CPU time spent per reading, in the drivers and the simulator
+
+Run it with:
+
+    python -m pymodaq_plugins_keithley.benchmarks.bench_acquisition [--json results.json] [--grabs 50] [--statistics]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from pymodaq_plugins_keithley import __version__, config
+from pymodaq_plugins_keithley.hardware.simulator import SimulatedResourceManager
+from pymodaq_plugins_keithley.hardware.visa_resources import SIMULATOR_BACKEND, open_session
+from pymodaq_plugins_keithley.hardware.instrumentation import instrumentation
+
+RESOURCES = {'27XX': 'TCPIP0::192.168.1.101::1394::SOCKET',
+             '2100': 'USB0::0x05E6::0x2100::1149087::INSTR',
+             '2110': 'USB0::0x05E6::0x2110::8001234::INSTR',
+             'Pico': 'GPIB0::14::INSTR',
+             '2400': 'GPIB0::24::INSTR'}
+CHANNELS = [1, 10, 40, 80]
+DATA_FORMATS = ['ASCII', 'SREAL']
+NAVERAGES = [1, 10, 100]
+SWEEP_POINTS = 500
+NPLC = 1
+
+
+def use_simulator():
+    """Switch the drivers and plugins of the process to simulated instruments running on a virtual clock
+
+    The configuration is only changed in memory. Called by main, so that importing the module has no side effect.
+    """
+    config["Keithley", "simulator", "enabled"] = True
+    config["Keithley", "simulator", "realtime"] = False
+    rm = SimulatedResourceManager(realtime=False)
+    for resource in RESOURCES.values():
+        rm.instrument(resource)
+
+
+def scan_channels(n_channels):
+    """First n_channels voltage channels of the two 7702 cards of the simulated 2701"""
+    channels = list(range(101, 141)) + list(range(201, 241))
+    return channels[:n_channels]
+
+
+def measure(grab, session, n_grabs, readings_per_grab):
+    """Call grab n_grabs times and return the throughput, latency, bytes and CPU statistics"""
+    instrument = session.instrument
+    grab()  # warm up
+    latencies = []
+    nbytes = session.bytes_written + session.bytes_read
+    cpu_start = time.process_time()
+    for ind in range(n_grabs):
+        start = instrument.now()
+        grab()
+        latencies.append(instrument.now() - start)
+    cpu = time.process_time() - cpu_start
+    n_readings = n_grabs * readings_per_grab
+    return {'readings_per_grab': readings_per_grab,
+            'readings_per_s': n_readings / sum(latencies),
+            'latency_p50_ms': 1e3 * float(np.percentile(latencies, 50)),
+            'latency_p99_ms': 1e3 * float(np.percentile(latencies, 99)),
+            'bytes_per_grab': (session.bytes_written + session.bytes_read - nbytes) / n_grabs,
+            'cpu_us_per_reading': 1e6 * cpu / n_readings}
+
+
+def bench_27XX(n_grabs):
+    from pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_VISADriver import Keithley27XXVISADriver
+    results = {}
+    driver = Keithley27XXVISADriver(RESOURCES['27XX'])
+    # The configuration file is bypassed: the channels are configured below
+    driver._instr = open_session(RESOURCES['27XX'], SIMULATOR_BACKEND, write_termination='\n',
+                                 read_termination='\n')
+    driver._instr.timeout = 100000
+    for data_format in DATA_FORMATS:
+        for n_channels in [0] + CHANNELS:
+            driver.reset()
+            driver.set_data_format(data_format)
+            if n_channels == 0:
+                name = 'front/{}'.format(data_format)
+                driver.set_mode('VOLT:DC')
+            else:
+                name = 'rear_{}ch/{}'.format(n_channels, data_format)
+                channels = scan_channels(n_channels)
+                driver._instr.write("FUNC 'VOLT:DC',(@{})".format(','.join(str(chan) for chan in channels)))
+                driver._instr.write("VOLT:DC:NPLC {}".format(NPLC))
+                driver.modes_channels_dict = {'VOLT:DC': channels}
+                driver.set_mode('SCAN_VOLT:DC')
+            results[name] = measure(lambda: driver.data(return_answer=False), driver._instr, n_grabs,
+                                    driver.samp_count)
+    return results
+
+
+def bench_2100(n_grabs):
+    from pymodaq_plugins_keithley.hardware.keithley2100.keithley2100_VISADriver import Keithley2100VISADriver
+    driver = Keithley2100VISADriver(RESOURCES['2100'])
+    driver.init_hardware(SIMULATOR_BACKEND)
+    driver.set_mode('VDC')
+    results = {'VDC': measure(driver.read, driver._instr, n_grabs, 1)}
+    # Naverage=100 lasts about 20 s at the default NPLC
+    driver._instr.timeout = 100000
+    for naverage in NAVERAGES[1:]:
+        results['burst_{}'.format(naverage)] = measure(lambda: driver.read_burst(naverage), driver._instr, n_grabs,
+                                                       naverage)
+    return results
+
+
+def bench_2110(n_grabs):
+    from pymodaq_plugins_keithley.hardware.keithley2110.keithley2110_VISADriver import Keithley2110VISADriver
+    driver = Keithley2110VISADriver(RESOURCES['2110'], SIMULATOR_BACKEND)
+    driver.set_mode('VDC')
+    return {'VDC': measure(driver.read, driver._instr, n_grabs, 1)}
+
+
+def bench_pico(n_grabs):
+    from pymodaq_plugins_keithley.daq_viewer_plugins.plugins_0D.daq_0Dviewer_Keithley_Pico import \
+        DAQ_0DViewer_Keithley_Pico
+    results = {}
+    viewer = DAQ_0DViewer_Keithley_Pico(None, None)
+    viewer.settings.child('VISA_ressources').setValue(RESOURCES['Pico'])
+    viewer.ini_detector()
+    # Naverage=100 lasts about 12 s at the default NPLC
+    viewer.controller.timeout = 100000
+    for naverage in NAVERAGES:
+        results['Naverage_{}'.format(naverage)] = measure(lambda: viewer.grab_data(Naverage=naverage),
+                                                          viewer.controller, n_grabs, naverage)
+    viewer.close()
+    return results
+
+
+def bench_2400(n_grabs):
+    from pymodaq_plugins_keithley.daq_move_plugins.daq_move_Keithley2400 import DAQ_Move_Keithley2400
+    mover = DAQ_Move_Keithley2400(None, None)
+    mover.settings.child('adapter').setValue('Simulator')
+    mover.settings.child('visa_ressource').setValue(RESOURCES['2400'])
+    mover.settings.child('source_mode').setValue('Voltage')
+    mover.ini_stage()
+    mover.enable_source(True)
+    positions = iter(np.tile(np.linspace(0, 1, 11), n_grabs + 1))
+    # Simulated session behind the InstrumentedAdapter
+    session = mover.controller.adapter.adapter.connection
+    results = {'move_abs': measure(lambda: mover.move_Abs(next(positions)), session, n_grabs, 1)}
+    levels = np.linspace(0, 1, SWEEP_POINTS)
+    results['sweep_{}'.format(SWEEP_POINTS)] = measure(lambda: mover.sweep(levels), session, n_grabs, SWEEP_POINTS)
+    return results
+
+
+BENCHES = {'27XX': bench_27XX, '2100': bench_2100, '2110': bench_2110, 'Pico': bench_pico, '2400': bench_2400}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--json', help='Path of the json file where results are written')
+    parser.add_argument('--grabs', type=int, default=50, help='Number of grabs per configuration')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHES), default=list(BENCHES),
+                        help='Instruments to benchmark')
+    parser.add_argument('--statistics', action='store_true',
+                        help='Record and print the statistics of each SCPI command (Python time, not instrument time)')
+    args = parser.parse_args()
+    use_simulator()
+    instrumentation.enabled = args.statistics
+
+    results = {'version': __version__, 'grabs': args.grabs, 'instruments': {}}
+    for instrument in args.only:
+        results['instruments'][instrument] = BENCHES[instrument](args.grabs)
+        for name, result in results['instruments'][instrument].items():
+            print('{:<6} {:<16} {:12.0f} readings/s  p50 {:9.2f} ms  p99 {:9.2f} ms  {:9.0f} B/grab  '
+                  '{:7.1f} us CPU/reading'.format(instrument, name, result['readings_per_s'],
+                                                  result['latency_p50_ms'], result['latency_p99_ms'],
+                                                  result['bytes_per_grab'], result['cpu_us_per_reading']))
+    if args.statistics:
+        print(instrumentation.report())
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,19 +3,21 @@ from pymeasure.instruments.keithley import Keithley2400
 from pymeasure.adapters import VISAAdapter, PrologixAdapter
 
 from pymodaq.control_modules.move_utility_classes import DAQ_Move_base  # base class
-from pymodaq.control_modules.move_utility_classes import comon_parameters, main  # common set of parameters for all actuators
+from pymodaq.control_modules.move_utility_classes import comon_parameters_fun, main  # common set of parameters for all actuators
 from pymodaq.utils.daq_utils import ThreadCommand, getLineInfo
 from pymodaq.utils.logger import set_logger, get_module_name  # object used to send info back to the main thread
 from pymodaq.utils.parameter.utils import iter_children
-from pyvisa import ResourceManager
+from pymodaq_plugins_keithley.hardware.visa_resources import list_resources, LazyParams
+from pymodaq_plugins_keithley.hardware.simulator.pymeasure_adapter import SimulatedAdapter
+from pymodaq_plugins_keithley.hardware.keithley2400 import list_sweep
+from pymodaq_plugins_keithley.hardware.instrumentation import (InstrumentedAdapter, statistics_params,
+                                                                  commit_statistics_settings,
+                                                                  update_statistics_settings)
 
 
 logger = set_logger(get_module_name(__file__))
 
-rm = ResourceManager()
-
-VISA_RESSOURCES = rm.list_resources()
-ADAPTERS = dict(VISA=VISAAdapter, Prologix=PrologixAdapter)
+ADAPTERS = dict(VISA=VISAAdapter, Prologix=PrologixAdapter, Simulator=SimulatedAdapter)
 SOURCE_MODES = ['Current', 'Voltage']
 EPSILON_CURRENT = 1e-5
 EPSILON_VOLTAGE = 1e-3
@@ -35,8 +37,11 @@ class DAQ_Move_Keithley2400(DAQ_Move_base):
     stage_names = []  # "list of strings of the multiaxes
     _epsilon = 1e-5
 
-    params = [   {'title': 'Adapter:', 'name': 'adapter', 'type': 'list', 'limits': list(ADAPTERS.keys())},
-                 {'title': 'VISA Ressources:', 'name': 'visa_ressource', 'type': 'list', 'limits': VISA_RESSOURCES},
+    params = LazyParams(lambda: [
+                 {'title': 'Adapter:', 'name': 'adapter', 'type': 'list', 'limits': list(ADAPTERS.keys())},
+                 {'title': 'VISA Ressources:', 'name': 'visa_ressource', 'type': 'list',
+                  'limits': list(list_resources())},
+                 {'title': 'Refresh VISA:', 'name': 'refresh_ressources', 'type': 'bool_push', 'label': 'Refresh'},
                  {'title': 'Info:', 'name': 'info', 'type': 'str', 'value': '', 'readonly': True},
                  {'title': 'Source Mode:', 'name': 'source_mode', 'type': 'list', 'limits': SOURCE_MODES},
                  {'title': 'Enabled:', 'name': 'enabled', 'type': 'led_push', 'value': False},
@@ -49,15 +54,9 @@ class DAQ_Move_Keithley2400(DAQ_Move_base):
                       'max': 210.},
                      {'title': 'Compliance Current:', 'name': 'current_compliance', 'type': 'float',
                       'value': 5e-1, 'min': 0.}]},
-
-                 {'title': 'MultiAxes:', 'name': 'multiaxes', 'type': 'group', 'visible': is_multiaxes, 'children': [
-                     {'title': 'is Multiaxes:', 'name': 'ismultiaxes', 'type': 'bool', 'value': is_multiaxes,
-                      'default': False},
-                     {'title': 'Status:', 'name': 'multi_status', 'type': 'list', 'value': 'Master',
-                      'limits': ['Master', 'Slave']},
-                     {'title': 'Axis:', 'name': 'axis', 'type': 'list', 'limits': stage_names},
-
-                 ]}] + comon_parameters
+                 statistics_params(),
+                 ] + comon_parameters_fun(DAQ_Move_Keithley2400.is_multiaxes,
+                                          axis_names=DAQ_Move_Keithley2400.stage_names))
 
     def __init__(self, parent=None, params_state=None):
         """
@@ -140,6 +139,8 @@ class DAQ_Move_Keithley2400(DAQ_Move_base):
         return range, compliance
 
     def commit_settings(self, param):
+        if commit_statistics_settings(self.settings, param, self.settings.child('visa_ressource').value()):
+            return
         if param.name() == "source_mode" or \
             param.name() in iter_children(self.settings.child('current_mode'), []) or \
                 param.name() in iter_children(self.settings.child('voltage_mode'), []):
@@ -159,6 +160,8 @@ class DAQ_Move_Keithley2400(DAQ_Move_base):
 
         elif param.name() == 'enabled':
             self.enable_source(param.value())
+        elif param.name() == 'refresh_ressources':
+            self.settings.child('visa_ressource').setLimits(list(list_resources(refresh=True)))
 
     def ini_stage(self, controller=None):
         """Actuator communication initialization
@@ -191,8 +194,9 @@ class DAQ_Move_Keithley2400(DAQ_Move_base):
                     self.controller = controller
             else:  # Master stage
 
-                adapter = \
-                    ADAPTERS[self.settings.child('adapter').value()](self.settings.child('visa_ressource').value())
+                resource_name = self.settings.child('visa_ressource').value()
+                adapter = InstrumentedAdapter(ADAPTERS[self.settings.child('adapter').value()](resource_name),
+                                              resource_name)
                 self.controller = Keithley2400(adapter)  # when writing your own plugin replace this line
                 self.commit_settings(self.settings.child('source_mode'))
 
@@ -236,6 +240,31 @@ class DAQ_Move_Keithley2400(DAQ_Move_base):
 
         self.target_position = position
         self.current_position = self.target_position #bypass checking
+        update_statistics_settings(self.settings, self.settings.child('visa_ressource').value())
+
+    def sweep(self, positions, delay=0.001):
+        """Batched scan steps: source all the positions with a single trigger (hardware list sweep)
+
+        The levels are uploaded at once as a source list and all the source/measure pairs are read back in a single
+        transfer, instead of one move_Abs and one measurement per position. The source must be enabled.
+
+        Parameters
+        ----------
+        positions: (list of float) absolute targets, at most 2500
+        delay: (float) source delay (s) before each measurement
+
+        Returns
+        -------
+        numpy array: the measured values (voltages in current mode, currents in voltage mode)
+        """
+        if not self.enabled:
+            raise RuntimeError('The source must be enabled to perform a sweep')
+        source_mode = self.settings.child('source_mode').value()
+        levels = [self.set_position_with_scaling(self.check_bound(position)) for position in positions]
+        voltages, currents = list_sweep(self.controller, levels, source_mode, delay)
+        # The source is back to its fixed level, set to the last position of the sweep
+        self.move_Abs(positions[-1])
+        return voltages if source_mode == 'Current' else currents
 
     def move_Rel(self, position):
         """ Move the actuator to the relative target actuator value defined by position
@@ -1,8 +1,11 @@
+import numpy as np
 from pymodaq.utils.daq_utils import ThreadCommand
 from pymodaq.utils.data import DataFromPlugins, DataToExport
 from pymodaq.control_modules.viewer_utility_classes import (DAQ_Viewer_base, comon_parameters,main,)
 from pymodaq.utils.parameter import Parameter
 from pymodaq_plugins_keithley.hardware.keithley2100.keithley2100_VISADriver import Keithley2100VISADriver as Keithley
+from pymodaq_plugins_keithley.hardware.instrumentation import (statistics_params, commit_statistics_settings,
+                                                                  update_statistics_settings)
 from pymodaq.utils.logger import set_logger, get_module_name
 
 logger = set_logger(get_module_name(__file__))
@@ -28,6 +31,7 @@ class DAQ_0DViewer_Keithley2100(DAQ_Viewer_base):
             "type": "str",
             "value": "USB0::0x05E6::0x2100::1149087::INSTR",
         },
+        {"title": "Timeout (ms)", "name": "timeout", "type": "int", "value": 10000, "default": 10000, "min": 2000},
         {
             "title": "Keithley2100 Parameters",
             "name": "K2100Params",
@@ -41,8 +45,16 @@ class DAQ_0DViewer_Keithley2100(DAQ_Viewer_base):
                     "limits": ["VDC", "VAC", "R2W", "R4W", "IDC", "IAC"], 
                     "value": "VDC",
                 },
+                {"title": "Export std:", "name": "export_std", "type": "bool", "value": False,
+                 "tip": "Export the standard deviation of the averaged readings as a second channel"},
+                {"title": "Filter:", "name": "filter", "type": "list", "limits": ["OFF", "REP", "MOV"], "value": "OFF",
+                 "tip": "Digital filter of the selected mode (repeating or moving average), overridden by Naverage"},
+                {"title": "Filter count:", "name": "filter_count", "type": "int", "value": 10, "min": 2, "max": 100},
+                {"title": "Monitoring:", "name": "monitoring", "type": "bool", "value": False,
+                 "tip": "Free running instrument: each grab reads its latest reading, without averaging"},
             ],
         },
+        statistics_params(),
     ]
 
     def __init__(self, parent=None, params_state=None):
@@ -51,6 +63,8 @@ class DAQ_0DViewer_Keithley2100(DAQ_Viewer_base):
     def ini_attributes(self):
         """Attributes init when DAQ_0DViewer_Keithley class is instanced"""
         self.controller: Keithley = None
+        # Naverage readings are averaged by the digital filter of the instrument (or acquired in a single burst)
+        self.hardware_averaging = True
 
     def commit_settings(self, param: Parameter):
         """Apply the consequences of a change of value in the detector settings
@@ -61,9 +75,22 @@ class DAQ_0DViewer_Keithley2100(DAQ_Viewer_base):
             A given parameter (within detector_settings) whose value has been changed by the user
         """
 
+        if commit_statistics_settings(self.settings, param, self.settings["resources"]):
+            return
         if param.name() == "mode":
             self.controller.set_mode(param.value())
             logger.info("mode changed to {}".format(param.value()))
+            # Filter of the new mode
+            filter_type, count = self.controller.filters.get(self.controller.function, ("OFF", 10))
+            self.settings.child("K2100Params", "filter").setValue(filter_type)
+            self.settings.child("K2100Params", "filter_count").setValue(count)
+        elif param.name() in ["filter", "filter_count"]:
+            self.controller.set_filter(self.settings["K2100Params", "filter"],
+                                       self.settings["K2100Params", "filter_count"])
+        elif param.name() == "timeout":
+            self.controller._instr.timeout = param.value()
+        elif param.name() == "monitoring":
+            self.controller.set_monitoring(param.value())
 
 
     def ini_detector(self, controller=None):
@@ -81,6 +108,9 @@ class DAQ_0DViewer_Keithley2100(DAQ_Viewer_base):
         if self.is_master:
             self.controller = Keithley(self.settings["resources"])
             self.controller.init_hardware()
+            self.controller._instr.timeout = self.settings["timeout"]
+            if self.settings["K2100Params", "monitoring"]:
+                self.controller.set_monitoring()
             txt = self.controller.get_idn()
             self.settings.child("K2100Params", "ID").setValue(txt)
 
@@ -103,18 +133,32 @@ class DAQ_0DViewer_Keithley2100(DAQ_Viewer_base):
 
         =============== ======== ===============================================
         **Parameters**  **Type**  **Description**
-        *Naverage*      int       specify the threshold of the mean calculation
+        *Naverage*      int       Number of readings averaged by the instrument
         =============== ======== ===============================================
 
+        Readings are averaged by the repeating filter of the instrument, or acquired in a single burst when their
+        standard deviation is exported or when they exceed the filter count.
         """
-        data = self.controller.read()
+        burst = self.settings["K2100Params", "export_std"] or Naverage > self.controller.max_filter_count
+        self.controller.set_averaging(1 if burst else Naverage)
+        if Naverage > 1 and burst and not self.controller.monitoring:
+            readings = self.controller.read_burst(Naverage)
+            data = [np.array([readings.mean()])]
+            std = np.array([readings.std()])
+        else:
+            data = [np.array([self.controller.read()])]
+            std = np.array([0.])
+        labels = ["Amplitude"]
+        if self.settings["K2100Params", "export_std"]:
+            data.append(std)
+            labels.append("Std")
         dte = DataToExport(
             name="K2100",
             data=[
-                DataFromPlugins(name="K2100", data=data, dim="Data0D", labels=["Amplitude"])
+                DataFromPlugins(name="K2100", data=data, dim="Data0D", labels=labels)
             ],
         )
-
+        update_statistics_settings(self.settings, self.settings["resources"])
         self.dte_signal.emit(dte)
 
     def stop(self):
@@ -3,13 +3,16 @@ from pymodaq.utils.data import DataFromPlugins
 from easydict import EasyDict as edict
 from collections import OrderedDict
 from ...hardware.keithley2110.keithley2110_VISADriver import Keithley2110VISADriver as Keithley2110
+from ...hardware.instrumentation import statistics_params, commit_statistics_settings, update_statistics_settings
+from pymodaq.utils.logger import set_logger, get_module_name
+logger = set_logger(get_module_name(__file__))
 
 
 class DAQ_0DViewer_Keithley2110(DAQ_Viewer_base):
     """
         Naive implementation of a DAQ 0D Viewer using the Keithley 2110 as data source
-        This DAQ0D Viewer plugin only supports measurement mode selection and a simple data read acquisition mechanism
-        with no averaging supported
+        This DAQ0D Viewer plugin only supports measurement mode selection, the digital filter of the instrument and a
+        simple data read acquisition mechanism, Naverage readings being averaged by the repeating filter
         =============== =================
         **Attributes**  **Type**
         *params*        dictionnary list
@@ -19,15 +22,19 @@ class DAQ_0DViewer_Keithley2110(DAQ_Viewer_base):
     """
     params = comon_parameters+[
         {'title': 'Keithley2210 Parameters',  'name': 'K2110Params', 'type': 'group', 'children': [
-            {'title': 'Mode', 'name': 'mode', 'type': 'list', 'limits': ['VDC', 'VAC', 'R2W', 'R4W'], 'value': 'VDC'}
-
-        ]}
+            {'title': 'Mode', 'name': 'mode', 'type': 'list', 'limits': ['VDC', 'VAC', 'R2W', 'R4W'], 'value': 'VDC'},
+            {'title': 'Filter', 'name': 'filter', 'type': 'list', 'limits': ['OFF', 'REP', 'MOV'], 'value': 'OFF',
+             'tip': 'Digital filter of the selected mode (repeating or moving average), overridden by Naverage'},
+            {'title': 'Filter count', 'name': 'filter_count', 'type': 'int', 'value': 10, 'min': 2, 'max': 100},
+        ]},
+        statistics_params(),
     ]
 
     def __init__(self, parent=None, params_state=None): # init_params is a list of tuple where each tuple contains info on a 1D channel (Ntps,amplitude, width, position and noise)
         super(DAQ_0DViewer_Keithley2110, self).__init__(parent, params_state)
         self.x_axis = None
         self.ind_data = 0
+        self.hardware_averaging = True
 
 
     def commit_settings(self, param):
@@ -37,9 +44,18 @@ class DAQ_0DViewer_Keithley2110(DAQ_Viewer_base):
             *param*        child node  could be the following setting parameter: 'mode'
             ============== ========= =================
         """
+        if commit_statistics_settings(self.settings, param, 'K2110'):
+            return
         if param.name() == 'mode':
             """Updates the newly selected measurement mode"""
             self.controller.set_mode(param.value())
+            # Filter of the new mode
+            filter_type, count = self.controller.filters.get(self.controller.function, ('OFF', 10))
+            self.settings.child('K2110Params', 'filter').setValue(filter_type)
+            self.settings.child('K2110Params', 'filter_count').setValue(count)
+        elif param.name() in ['filter', 'filter_count']:
+            self.controller.set_filter(self.settings.child('K2110Params', 'filter').value(),
+                                       self.settings.child('K2110Params', 'filter_count').value())
 
     def ini_detector(self, controller=None):
         """
@@ -87,12 +103,18 @@ class DAQ_0DViewer_Keithley2110(DAQ_Viewer_base):
 
             =============== ======== ===============================================
             **Parameters**  **Type**  **Description**
-            *Naverage*      int       specify the threshold of the mean calculation
+            *Naverage*      int       number of readings averaged by the repeating filter of the instrument (up to 100)
             =============== ======== ===============================================
 
         """
+        count = min(Naverage, self.controller.max_filter_count)
+        if count < Naverage and self.controller.averaging != count:
+            logger.warning("{} readings cannot be averaged by the repeating filter, {} are averaged"
+                           .format(Naverage, count))
+        self.controller.set_averaging(count)
         data = self.controller.read()
-        self.data_grabed_signal.emit([utils.DataFromPlugins(name='K2110', data=[[data]], dim='Data0D',)])
+        update_statistics_settings(self.settings, 'K2110')
+        self.data_grabed_signal.emit([DataFromPlugins(name='K2110', data=[[data]], dim='Data0D',)])
         self.ind_data += 1
 
     def stop(self):
@@ -5,6 +5,10 @@ from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, como
 from pymodaq.utils.parameter import Parameter
 from pymodaq_plugins_keithley import config
 from pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_VISADriver import Keithley27XXVISADriver as Keithley
+from pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_worker import Keithley27XXScanWorker
+from pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_logger import Keithley27XXHDF5Logger, default_path
+from pymodaq_plugins_keithley.hardware.instrumentation import (statistics_params, commit_statistics_settings,
+                                                                  update_statistics_settings)
 from pymodaq.utils.logger import set_logger, get_module_name
 logger = set_logger(get_module_name(__file__))
 
@@ -26,6 +30,10 @@ class DAQ_0DViewer_Keithley27XX(DAQ_Viewer_base):
     panel: str
     channels_in_selected_mode: str
     resources_list = []
+
+    # Dictionary linking channel's modes to physical quantities
+    dict_label_mode = {'VOLT:DC': 'Voltage', 'VOLT:AC': 'Voltage', 'CURR:DC': 'Current', 'CURR:AC': 'Current',
+                       'RES': 'Resistance', 'FRES': 'Resistance', 'FREQ': 'Frequency', 'TEMP': 'Temperature'}
     
     # Read configuration file
     for instr in config["Keithley", "27XX"].keys():
@@ -40,6 +48,25 @@ class DAQ_0DViewer_Keithley27XX(DAQ_Viewer_base):
             {'title': 'Panel', 'name': 'panel', 'type': 'list', 'limits': ['select panel to use', 'FRONT', 'REAR'],
              'value': 'select panel to use'},
             {'title': 'ID', 'name': 'ID', 'type': 'text', 'value': ''},
+            {'title': 'Data format', 'name': 'data_format', 'type': 'list', 'limits': ['ASCII', 'SREAL', 'DREAL'],
+             'value': 'ASCII'},
+            {'title': 'Monitoring', 'name': 'monitoring', 'type': 'bool', 'value': False,
+             'tip': 'Free running instrument: each grab reads its latest scan (readings are skipped), the continuous '
+                    'acquisition and the logging are not used'},
+            {'title': 'Continuous acquisition', 'name': 'continuous', 'type': 'group', 'children': [
+                {'title': 'Enabled', 'name': 'continuous_enabled', 'type': 'bool', 'value': False},
+                {'title': 'Buffer length (scans)', 'name': 'buffer_length', 'type': 'int', 'value': 100, 'min': 1},
+                {'title': 'Overruns', 'name': 'overruns', 'type': 'int', 'value': 0, 'readonly': True},
+            ]},
+            {'title': 'HDF5 logging', 'name': 'logging', 'type': 'group', 'children': [
+                {'title': 'Enabled', 'name': 'logging_enabled', 'type': 'bool', 'value': False,
+                 'tip': 'Stream all the scans to an HDF5 file, only the most recent one is displayed'},
+                {'title': 'File', 'name': 'logging_path', 'type': 'browsepath', 'value': '', 'filetype': 'save',
+                 'tip': 'Created or appended to, a timestamped file of the local PyMoDAQ folder if empty'},
+                {'title': 'Buffer (scans)', 'name': 'logging_buffer', 'type': 'int', 'value': 100, 'min': 1},
+                {'title': 'Flush interval (s)', 'name': 'flush_interval', 'type': 'float', 'value': 10., 'min': 0.},
+                {'title': 'Logged scans', 'name': 'logged_scans', 'type': 'int', 'value': 0, 'readonly': True},
+            ]},
             {'title': 'FRONT panel', 'name': 'frontpanel', 'visible': False, 'type': 'group', 'children': [
                 {'title': 'Mode', 'name': 'frontmode', 'type': 'list',
                  'limits': ['VOLT:DC', 'VOLT:AC', 'CURR:DC', 'CURR:AC', 'RES', 'FRES', 'FREQ', 'TEMP'],
@@ -51,6 +78,7 @@ class DAQ_0DViewer_Keithley27XX(DAQ_Viewer_base):
                  'value': 'SCAN_LIST'}
             ]},
         ]},
+        statistics_params(),
     ]
 
     def __init__(self, parent=None, params_state=None):
@@ -63,9 +91,15 @@ class DAQ_0DViewer_Keithley27XX(DAQ_Viewer_base):
         self.rsrc_name = None
         self.panel = None
         self.instr = None
+        self.worker: Keithley27XXScanWorker = None
+        self.outputs = []
+        # Naverage conversions are averaged by the digital filter of the instrument
+        self.hardware_averaging = True
 
     def commit_settings(self, param: Parameter):
         """Apply the consequences of a change of value in the detector settings"""
+        if commit_statistics_settings(self.settings, param, self.rsrc_name):
+            return
         if param.name() == 'panel':
             for limit in ['REAR', 'FRONT']:
                 if not limit == param.value():
@@ -75,22 +109,33 @@ class DAQ_0DViewer_Keithley27XX(DAQ_Viewer_base):
                     else:
                         self.settings.child('Keithley_Params', param.value().lower() + param.name()).show()
                         self.settings.child('Keithley_Params', limit.lower() + param.name()).hide()
+        if param.name() in ['data_format', 'monitoring', 'continuous_enabled', 'buffer_length', 'logging_enabled', 'logging_path',
+                            'logging_buffer', 'flush_interval'] or 'mode' in param.name():
+            # The worker (or the logger) owns the instrument communication, it is restarted by the next grab if still
+            # enabled
+            self.stop_worker()
+        if param.name() == 'data_format':
+            self.controller.set_data_format(param.value())
+        if param.name() == 'monitoring':
+            self.controller.set_monitoring(param.value())
         if 'mode' in param.name():
             """Updates the newly selected measurement mode"""
             # Read the configuration file to determine which mode to use and send corresponding instruction to driver
             if self.panel == 'FRONT':
                 value = param.value()
+                self.controller.current_mode = value
                 self.controller.set_mode(value)
             elif self.panel == 'REAR':
                 value = 'SCAN_' + param.value()
                 self.channels_in_selected_mode = self.controller.set_mode(value)
+            self.update_outputs()
             current_error = self.controller.get_error()
             if current_error != '0,"No error"':
                 logger.error("The following error has been raised by the Keithley:\
                         {} => Please refer to the User Manual to correct it\n\
                         Note: To make sure channels are well configured in the .toml file,\
                         refer to section 15 'SCPI Reference Tables', Table 15-5" .format(current_error))
-        if 'CURR' in param.value():
+        if 'mode' in param.name() and 'CURR' in param.value():
             """Verify if the switching modules support current measurement"""
             if self.controller.non_amp_module["MODULE01"] and self.controller.non_amp_module["MODULE02"]:
                 logger.info("Both modules don't support current measurement")
@@ -138,6 +183,7 @@ class DAQ_0DViewer_Keithley27XX(DAQ_Viewer_base):
         self.controller.init_hardware()
         txt = self.controller.get_idn()
         self.settings.child('Keithley_Params', 'ID').setValue(txt)
+        self.controller.set_data_format(self.settings.child('Keithley_Params', 'data_format').value())
 
         # Initialize detector communication and set the default value (SCAN_LIST)
         if self.panel == 'FRONT':
@@ -152,6 +198,9 @@ class DAQ_0DViewer_Keithley27XX(DAQ_Viewer_base):
             value = 'SCAN_' + self.settings.child('Keithley_Params', 'rearpanel', 'rearmode').value()
             self.channels_in_selected_mode = self.controller.set_mode(value)
             logger.info("Channels to plot : {}" .format(self.channels_in_selected_mode))
+        if self.settings.child('Keithley_Params', 'monitoring').value():
+            self.controller.set_monitoring()
+        self.update_outputs()
         logger.info("DAQ_viewer command sent to keithley visa driver : {}" .format(value))
 
         self.status.initialized = True
@@ -161,68 +210,149 @@ class DAQ_0DViewer_Keithley27XX(DAQ_Viewer_base):
 
     def close(self):
         """Terminate the communication protocol"""
+        self.stop_worker()
         self.controller.close()
         logger.info("communication ended successfully")
 
     def grab_data(self, Naverage=1, **kwargs):
         """Start a grab from the detector
 
-        :param Naverage: Number of hardware averaging (if hardware averaging is possible,
-            self.hardware_averaging should be set to True in class preamble, and you should code this implementation)
+        :param Naverage: Number of conversions averaged by the repeating filter of the instrument for each reading (up
+            to 100, see Keithley27XXVISADriver.set_averaging)
         :type Naverage: int
 
         :param kwargs: others optionals arguments
         :type kwargs: dict
         """
+        if self.worker is not None and self.worker.stopping and not self.stop_worker():
+            self.emit_status(ThreadCommand('Update_Status', ['The previous acquisition is still running', 'log']))
+            return
+        if self.worker is None:
+            # A running worker owns the instrument, the averaging is changed when it is restarted
+            count = min(Naverage, self.controller.max_filter_count)
+            if count < Naverage and self.controller.averaging != count:
+                logger.warning("{} conversions cannot be averaged by the repeating filter, {} are averaged"
+                               .format(Naverage, count))
+            self.controller.set_averaging(count)
         # ACQUISITION OF DATA
-        if self.panel == 'FRONT':
-            data_tot = self.controller.data()
-            data_measurement = data_tot[1]
-        elif self.panel == 'REAR':
-            channels_in_selected_mode = self.channels_in_selected_mode[1:-1].replace('@', '')
-            chan_to_plot = []
-            data_tot = self.controller.data()
-            data_measurement = data_tot[1]
-            for i in range(len(channels_in_selected_mode.split(','))):
-                chan_to_plot.append('Channel ' + str(channels_in_selected_mode.split(',')[i]))
-            # Affect each value to the corresponding channel
-            dict_chan_value = dict(zip(channels_in_selected_mode.split(','), data_measurement))
-        # Dictionary linking channel's modes to physical quantities
-        dict_label_mode = {'VOLT:DC': 'Voltage', 'VOLT:AC': 'Voltage', 'CURR:DC': 'Current', 'CURR:AC': 'Current',
-                           'RES': 'Resistance', 'FRES': 'Resistance', 'FREQ': 'Frequency', 'TEMP': 'Temperature'}
-        # EMISSION OF DATA
-        # When reading the scan_list, data are displayed and exported grouped by mode
-        if not self.controller.reading_scan_list:
-            label = dict_label_mode[self.controller.current_mode]
+        if self.controller.monitoring:
+            # Latest scan of the free running instrument
+            data_measurement = self.controller.data(return_answer=False)[1]
+        elif self.settings.child('Keithley_Params', 'logging', 'logging_enabled').value():
+            data_measurement = self.grab_logging()
+            if data_measurement is None:
+                return
+        elif self.settings.child('Keithley_Params', 'continuous', 'continuous_enabled').value():
+            data_measurement = self.grab_continuous()
+            if data_measurement is None:
+                return
+        else:
+            data_measurement = self.controller.data(return_answer=False)[1]
+        self.emit_data(data_measurement)
+
+    def grab_continuous(self):
+        """Drain the scans acquired by the background worker, started if needed
+
+        :return: The readings of the most recent scan, None if no scan could be acquired
+        :rtype: numpy array
+        """
+        if not isinstance(self.worker, Keithley27XXScanWorker):
+            if not self.stop_worker():
+                return None
+            self.worker = Keithley27XXScanWorker(
+                self.controller, self.settings.child('Keithley_Params', 'continuous', 'buffer_length').value())
+            self.worker.start()
+        if not self.worker.buffer.wait(self.controller._instr.timeout / 1000):
+            if self.worker.error is not None:
+                self.emit_status(ThreadCommand('Update_Status', ['Continuous acquisition stopped: {}'.format(
+                    self.worker.error), 'log']))
+                self.stop_worker()
+            else:
+                self.emit_status(ThreadCommand('Update_Status', ['No scan acquired within the timeout', 'log']))
+            return None
+        scans = self.worker.buffer.drain()
+        overruns = self.settings.child('Keithley_Params', 'continuous', 'overruns')
+        if self.worker.overruns != overruns.value():
+            self.emit_status(ThreadCommand('Update_Status', ['{} scans lost by the continuous acquisition'.format(
+                self.worker.overruns - overruns.value()), 'log']))
+            overruns.setValue(self.worker.overruns)
+        return scans[-1]
+
+    def grab_logging(self):
+        """Get the most recent scan streamed to the HDF5 file by the background logger, started if needed
+
+        :return: The readings of the most recent scan, None if no scan could be acquired
+        :rtype: numpy array
+        """
+        if not isinstance(self.worker, Keithley27XXHDF5Logger):
+            if not self.stop_worker():
+                return None
+            logging = self.settings.child('Keithley_Params', 'logging')
+            path = logging.child('logging_path').value() or default_path()
+            self.worker = Keithley27XXHDF5Logger(self.controller, path, logging.child('logging_buffer').value(),
+                                                 logging.child('flush_interval').value())
+            self.worker.start()
+            self.emit_status(ThreadCommand('Update_Status', ['Logging the scans to {}'.format(path), 'log']))
+        if not self.worker.buffer.wait(self.controller._instr.timeout / 1000):
+            if self.worker.error is not None:
+                self.emit_status(ThreadCommand('Update_Status', ['HDF5 logging stopped: {}'.format(
+                    self.worker.error), 'log']))
+                self.stop_worker()
+            else:
+                self.emit_status(ThreadCommand('Update_Status', ['No scan acquired within the timeout', 'log']))
+            return None
+        self.settings.child('Keithley_Params', 'logging', 'logged_scans').setValue(self.worker.scans)
+        return self.worker.buffer.drain()[-1]
+
+    def update_outputs(self):
+        """Precompute, for the current mode, the name, the labels and the readings indexes of each exported group
+
+        Called on each mode change, so that a grab only has to index the readings of the scan.
+        """
+        self.outputs = []
+        for mode, channels, indexes in self.controller.scan_groups():
             if self.panel == 'FRONT':
-                labels = 'Front input'
-            elif self.panel == 'REAR':
-                labels = [chan_to_plot[i] for i in range(len(chan_to_plot))]
-            dte = DataToExport(name='keithley',
-                               data=[DataFromPlugins(name=label,
-                                                     data=[np.array([data_measurement[i]]) for i in
-                                                           range(len(data_measurement))],
-                                                     dim='Data0D',
-                                                     labels=labels)])
-
-        # Reading only channels configured in the selected mode
-        elif self.controller.reading_scan_list:
-            dte = DataToExport(name='keithley',
-                               data=[DataFromPlugins(name=dict_label_mode[key],
-                                                     data=[np.array([dict_chan_value[str(chan)]]) for chan in
-                                                           self.controller.modes_channels_dict.get(key)],
-                                                     dim='Data0D',
-                                                     labels=['Channel ' + str(chan) for chan in
-                                                             self.controller.modes_channels_dict.get(key)]
-                                                     ) for key in self.controller.modes_channels_dict.keys() if
-                                     self.controller.modes_channels_dict.get(key) != []])
+                labels = ['Front input']
+            else:
+                labels = ['Channel ' + str(channel) for channel in channels]
+            self.outputs.append((self.dict_label_mode[mode], labels, np.array(indexes)))
+
+    def emit_data(self, data_measurement):
+        """Emit the readings of one scan, labelled by channel and grouped by mode (see update_outputs)
+
+        :param data_measurement: Readings of the channels in the selected mode
+        :type data_measurement: numpy array
+        """
+        # When reading the scan_list, data are displayed and exported grouped by mode
+        dte = DataToExport(name='keithley',
+                           data=[DataFromPlugins(name=name, data=list(data_measurement[indexes].reshape(-1, 1)),
+                                                 dim='Data0D', labels=labels)
+                                 for name, labels, indexes in self.outputs])
+        update_statistics_settings(self.settings, self.rsrc_name)
         self.dte_signal.emit(dte)
 
     def stop(self):
         """Stop the current grab hardware wise if necessary"""
+        self.stop_worker()
         self.emit_status(ThreadCommand('Update_Status', ['Acquisition stopped']))
         return ''
 
+    def stop_worker(self):
+        """Stop the continuous acquisition worker or the HDF5 logger, if any, once its current scan is over
+
+        A worker still running after the timeout keeps its reference: it still uses the instrument, and no other
+        acquisition is started until it has exited.
+
+        :return: True if no worker is running anymore
+        :rtype: bool
+        """
+        if self.worker is not None:
+            if not self.worker.stop(self.controller._instr.timeout / 1000):
+                logger.warning("Continuous acquisition worker still running after timeout")
+                return False
+            self.worker = None
+        return True
+
 
 if __name__ == '__main__':
     main(__file__)
@@ -1,25 +1,26 @@
-from collections import OrderedDict
-
-
 from easydict import EasyDict as edict
 import numpy as np
-from pyvisa import ResourceManager
 from qtpy.QtCore import Signal
 
 from pymodaq.utils.daq_utils import ThreadCommand, getLineInfo
 from pymodaq.utils.data import  DataFromPlugins, DataToExport
 from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, main, comon_parameters
 from pymodaq.utils.enums import BaseEnum
+from pymodaq_plugins_keithley.hardware.visa_resources import list_resources, open_session, LazyParams
+from pymodaq_plugins_keithley.hardware.instrumentation import (statistics_params, commit_statistics_settings,
+                                                                  update_statistics_settings)
 
 
+def com_ports(refresh=False):
+    """VISA resources (alias if defined, name otherwise), enumerated when first needed then cached"""
+    com_ports = []
+    for name, rinfo in list_resources(info=True, refresh=refresh).items():
+        if rinfo.alias is not None:
+            com_ports.append(rinfo.alias)
+        else:
+            com_ports.append(name)
+    return com_ports
 
-VISA_rm = ResourceManager()
-COM_PORTS = []
-for name, rinfo in VISA_rm.list_resources_info().items():
-    if rinfo.alias is not None:
-        COM_PORTS.append(rinfo.alias)
-    else:
-        COM_PORTS.append(name)
 
 class DAQ_0DViewer_Keithley_Pico_type(BaseEnum):
     """
@@ -42,8 +43,6 @@ class DAQ_0DViewer_Keithley_Pico(DAQ_Viewer_base):
         ==================== ========================
         **Attributes**        **Type**
         *data_grabed_signal*  instance of Signal
-        *VISA_rm*             ResourceManager
-        *com_ports*           
         *params*              dictionnary list
         *keithley*
         *settings*
@@ -56,21 +55,52 @@ class DAQ_0DViewer_Keithley_Pico(DAQ_Viewer_base):
 #    import serial.tools.list_ports;
 #    com_ports=[comport.device for comport in serial.tools.list_ports.comports()]
 
-    params = comon_parameters + [
-        {'title': 'VISA:', 'name': 'VISA_ressources', 'type': 'list', 'limits': COM_PORTS},
+    params = LazyParams(lambda: comon_parameters + [
+        {'title': 'VISA:', 'name': 'VISA_ressources', 'type': 'list', 'limits': com_ports()},
+        {'title': 'Refresh VISA:', 'name': 'refresh_ressources', 'type': 'bool_push', 'label': 'Refresh'},
         {'title': 'Keithley Type:', 'name': 'keithley_type', 'type': 'list',
          'limits': DAQ_0DViewer_Keithley_Pico_type.names()},
         {'title': 'Id:', 'name': 'id', 'type': 'text', 'value': ""},
         {'title': 'Timeout (ms):', 'name': 'timeout', 'type': 'int', 'value': 10000, 'default': 10000, 'min': 2000},
+        {'title': 'Transactions/grab:', 'name': 'transactions', 'type': 'int', 'value': 0, 'readonly': True,
+         'tip': 'Bus transactions (writes and queries) of the last grab'},
         {'title': 'Configuration:', 'name': 'config', 'type': 'group', 'children': [
             {'title': 'Meas. type:', 'name': 'meas_type', 'type': 'list', 'value': 'CURR', 'default': 'CURR',
              'limits': ['CURR', 'VOLT', 'RES', 'CHAR']},
 
         ]},
-    ]
+        statistics_params(),
+    ])
+
+    def format_commands(self):
+        """Format of the readings: values only, in ASCII"""
+        return [':FORM:ELEM READ', ':FORM:DATA ASC']
+
+    def trigger_commands(self, Naverage):
+        """Format, arm and trigger commands needed to acquire Naverage readings per READ?, only those changing the
+        instrument state
+
+        The state is known from the settings shadow of the session, shared by all the plugins and drivers of the
+        instrument (see SettingsShadow): the call must be made with the session lock held, until the commands are sent.
 
-    def ini_attributes(self):
-        pass
+        :param Naverage: Number of readings per READ?
+        :type Naverage: int
+        :return: The commands to send
+        :rtype: list of string
+        """
+        return self.controller.shadow.changed(*self.format_commands() + [
+            ':ARM:SOUR IMM', ':ARM:COUN 1', ':ARM:OUTP NONE', ':TRIG:SOUR IMM', ':TRIG:COUN {:d}'.format(Naverage)])
+
+    def read(self, Naverage=1):
+        """Acquire Naverage readings, the changes of the instrument state are sent in the same message as READ?
+
+        :param Naverage: Number of readings
+        :type Naverage: int
+        :return: The readings
+        :rtype: list of float
+        """
+        with self.controller.lock:
+            return self.controller.query_ascii_values(';'.join(self.trigger_commands(Naverage) + [':READ?']))
 
     def ini_detector(self, controller=None):
         """
@@ -88,8 +118,8 @@ class DAQ_0DViewer_Keithley_Pico(DAQ_Viewer_base):
 
         self.controller = self.ini_detector_init(old_controller=controller,
                                                  new_controller=
-                                                 VISA_rm.open_resource(
-                                                     self.settings['VISA_ressources'], read_termination='\r'))
+                                                 open_session(self.settings['VISA_ressources'],
+                                                              read_termination='\r'))
 
         self.controller.timeout = self.settings['timeout']
 
@@ -97,12 +127,8 @@ class DAQ_0DViewer_Keithley_Pico(DAQ_Viewer_base):
         txt = self.controller.query('*IDN?')
         self.settings.child(('id')).setValue(txt)
         self.controller.write('CONF:' + self.settings.child('config', 'meas_type').value())
-        self.controller.write(':FORM:ELEM READ;DATA ASC;')
-        self.controller.write('ARM:SOUR IMM;')
-        self.controller.write('ARM:COUNt 1;')
-        self.controller.write('TRIG:SOUR IMM;')
         # %%
-        data = self.controller.query_ascii_values('READ?')
+        data = self.read()
 
         self.status.initialized = True
         self.status.controller = self.controller
@@ -123,10 +149,15 @@ class DAQ_0DViewer_Keithley_Pico(DAQ_Viewer_base):
             daq_utils.ThreadCommand
         """
         try:
-            if param.name() == 'timeout':
+            if commit_statistics_settings(self.settings, param, self.settings['VISA_ressources']):
+                pass
+            elif param.name() == 'timeout':
                 self.controller.timeout = self.settings.child(('timeout')).value()
             elif param.name() == 'meas_type':
+                # CONF resets the arm and trigger layers, which the settings shadow of the session records
                 self.controller.write('CONF:' + param.value())
+            elif param.name() == 'refresh_ressources':
+                self.settings.child('VISA_ressources').setLimits(com_ports(refresh=True))
 
 
         except Exception as e:
@@ -150,12 +181,10 @@ class DAQ_0DViewer_Keithley_Pico(DAQ_Viewer_base):
             *Naverage*      int       Number of values to average
             =============== ======== ===============================================
         """
-        data_tot = []
-        self.controller.write('ARM:SOUR IMM;')
-        self.controller.write('ARM:COUNt 1;')
-        self.controller.write('TRIG:SOUR IMM;')
-        self.controller.write('TRIG:COUN {:};'.format(Naverage))
-        data_tot = self.controller.query_ascii_values('READ?')
+        transactions = self.controller.transactions
+        data_tot = self.read(Naverage)
+        self.settings.child('transactions').setValue(self.controller.transactions - transactions)
+        update_statistics_settings(self.settings, self.settings['VISA_ressources'])
         # for ind in range(Naverage):
         #    data_tot.append(self.controller.query_ascii_values('READ?')[0])
         dwa = DataFromPlugins(name='Keithley', data=[np.array([np.mean(np.array(data_tot))])])
@@ -0,0 +1,146 @@
+import numpy as np
+from pymeasure.instruments.keithley import Keithley2400
+
+from pymodaq.utils.daq_utils import ThreadCommand, getLineInfo
+from pymodaq.utils.data import Axis, DataFromPlugins, DataToExport
+from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, comon_parameters, main
+from pymodaq.utils.parameter import Parameter
+from pymodaq_plugins_keithley.daq_move_plugins.daq_move_Keithley2400 import ADAPTERS, SOURCE_MODES
+from pymodaq_plugins_keithley.hardware.keithley2400 import list_sweep, linear_sweep
+from pymodaq_plugins_keithley.hardware.instrumentation import (InstrumentedAdapter, statistics_params,
+                                                                  commit_statistics_settings,
+                                                                  update_statistics_settings)
+from pymodaq_plugins_keithley.hardware.visa_resources import list_resources, LazyParams
+from pymodaq.utils.logger import set_logger, get_module_name
+logger = set_logger(get_module_name(__file__))
+
+UNITS = {'Voltage': 'V', 'Current': 'A'}
+
+
+class DAQ_1DViewer_Keithley2400(DAQ_Viewer_base):
+    """Keithley 2400 SourceMeter plugin class for a 1D viewer: IV curves acquired as hardware sweeps.
+
+    The source levels (linear staircase or list) are uploaded to the instrument and the sweep is triggered once, all the
+    source/measure pairs are then read back in a single transfer. The measured quantity is displayed versus the source
+    one. The output is enabled for the duration of the sweep.
+
+    :param params: Parameters displayed in the daq_viewer interface
+    :type params: dictionary list
+    """
+    params = LazyParams(lambda: comon_parameters + [
+        {'title': 'Adapter:', 'name': 'adapter', 'type': 'list', 'limits': list(ADAPTERS.keys())},
+        {'title': 'VISA Ressources:', 'name': 'visa_ressource', 'type': 'list', 'limits': list(list_resources())},
+        {'title': 'Refresh VISA:', 'name': 'refresh_ressources', 'type': 'bool_push', 'label': 'Refresh'},
+        {'title': 'Info:', 'name': 'info', 'type': 'str', 'value': '', 'readonly': True},
+        {'title': 'Source Mode:', 'name': 'source_mode', 'type': 'list', 'limits': SOURCE_MODES,
+         'value': 'Voltage'},
+        {'title': 'Range:', 'name': 'range', 'type': 'float', 'value': 10, 'min': 0.,
+         'tip': 'Source range (V or A)'},
+        {'title': 'Compliance:', 'name': 'compliance', 'type': 'float', 'value': 1e-2, 'min': 0.,
+         'tip': 'Compliance of the measured quantity (A or V)'},
+        {'title': 'Sweep:', 'name': 'sweep', 'type': 'group', 'children': [
+            {'title': 'Type:', 'name': 'sweep_type', 'type': 'list', 'limits': ['Linear', 'List'], 'value': 'Linear'},
+            {'title': 'Start:', 'name': 'start', 'type': 'float', 'value': 0.},
+            {'title': 'Stop:', 'name': 'stop', 'type': 'float', 'value': 1.},
+            {'title': 'Points:', 'name': 'n_points', 'type': 'int', 'value': 101, 'min': 2, 'max': 2500},
+            {'title': 'Levels:', 'name': 'levels', 'type': 'str', 'value': '0, 0.5, 1',
+             'tip': 'Comma separated source levels of a list sweep'},
+            {'title': 'Source delay (s):', 'name': 'delay', 'type': 'float', 'value': 0.001, 'min': 0.},
+        ]},
+        statistics_params(),
+    ])
+
+    def ini_attributes(self):
+        self.controller: Keithley2400 = None
+
+    def set_source(self):
+        """Configure the source and the measured quantity from the settings"""
+        if self.settings['source_mode'] == 'Current':
+            self.controller.apply_current(current_range=self.settings['range'],
+                                          compliance_voltage=self.settings['compliance'])
+            self.controller.measure_voltage()
+        else:
+            self.controller.apply_voltage(voltage_range=self.settings['range'],
+                                          compliance_current=self.settings['compliance'])
+            self.controller.measure_current()
+
+    def commit_settings(self, param: Parameter):
+        """Apply the consequences of a change of value in the detector settings
+
+        :param param: A given parameter (within detector_settings) whose value has been changed by the user
+        :type param: Parameter
+        """
+        try:
+            if commit_statistics_settings(self.settings, param, self.settings['visa_ressource']):
+                pass
+            elif param.name() in ('source_mode', 'range', 'compliance'):
+                self.set_source()
+            elif param.name() == 'refresh_ressources':
+                self.settings.child('visa_ressource').setLimits(list(list_resources(refresh=True)))
+        except Exception as e:
+            self.emit_status(ThreadCommand('Update_Status', [getLineInfo() + str(e), 'log']))
+
+    def ini_detector(self, controller=None):
+        """Detector communication initialization
+
+        :param controller: Custom object of a PyMoDAQ plugin (Slave case). None if one actuator/detector by controller.
+        :type controller: object
+
+        :return: Initialization status, false if it failed otherwise True
+        :rtype: bool
+        """
+        self.ini_detector_init(slave_controller=controller)
+        if self.is_master:
+            adapter = InstrumentedAdapter(ADAPTERS[self.settings['adapter']](self.settings['visa_ressource']),
+                                          self.settings['visa_ressource'])
+            self.controller = Keithley2400(adapter)
+            self.set_source()
+        info = self.controller.id
+        self.settings.child('info').setValue(info)
+        return info, True
+
+    def close(self):
+        """Terminate the communication protocol"""
+        self.controller.shutdown()
+
+    def sweep(self):
+        """Perform the sweep defined in the settings
+
+        :return: The voltages and the currents
+        :rtype: tuple of numpy arrays
+        """
+        source_mode = self.settings['source_mode']
+        delay = self.settings['sweep', 'delay']
+        if self.settings['sweep', 'sweep_type'] == 'List':
+            levels = [float(level) for level in self.settings['sweep', 'levels'].split(',') if level.strip()]
+            return list_sweep(self.controller, levels, source_mode, delay)
+        return linear_sweep(self.controller, self.settings['sweep', 'start'], self.settings['sweep', 'stop'],
+                            self.settings['sweep', 'n_points'], source_mode, delay)
+
+    def grab_data(self, Naverage=1, **kwargs):
+        """Acquire an IV curve
+
+        :param Naverage: Number of hardware averaging (not used)
+        :type Naverage: int
+        """
+        self.controller.enable_source()
+        try:
+            voltages, currents = self.sweep()
+        finally:
+            self.controller.disable_source()
+        if self.settings['source_mode'] == 'Current':
+            source, measure, source_label, label = currents, voltages, 'Current', 'Voltage'
+        else:
+            source, measure, source_label, label = voltages, currents, 'Voltage', 'Current'
+        dwa = DataFromPlugins(name='IV', data=[measure], dim='Data1D', labels=[label],
+                              axes=[Axis(source_label, units=UNITS[source_label], data=source, index=0)])
+        update_statistics_settings(self.settings, self.settings['visa_ressource'])
+        self.dte_signal.emit(DataToExport('Keithley2400', data=[dwa]))
+
+    def stop(self):
+        """Stop the current grab hardware wise if necessary"""
+        return ''
+
+
+if __name__ == '__main__':
+    main(__file__, init=False)
@@ -0,0 +1,99 @@
+from pymodaq.utils.data import Axis, DataFromPlugins, DataToExport
+from pymodaq.control_modules.viewer_utility_classes import main
+from pymodaq_plugins_keithley.daq_viewer_plugins.plugins_0D.daq_0Dviewer_Keithley27XX import DAQ_0DViewer_Keithley27XX
+from pymodaq_plugins_keithley.hardware.instrumentation import update_statistics_settings
+from pymodaq.utils.logger import set_logger, get_module_name
+logger = set_logger(get_module_name(__file__))
+
+
+class DAQ_1DViewer_Keithley27XX(DAQ_0DViewer_Keithley27XX):
+    """ Keithley plugin class for a 1D viewer.
+
+    Buffered acquisition of several scans: the scans are armed at once, fill the instrument's internal buffer at the
+    instrument's own scan rate and are transferred by chunks. Each channel is displayed as a reading versus time trace.
+    The connection and the measurement modes are handled as in the DAQ_0DViewer_Keithley27XX plugin.
+
+    :param controller: The particular object that allow the communication with the keithley27XX_VISADriver.
+    :type  controller:  object
+
+    :param params: Parameters displayed in the daq_viewer interface
+    :type params: dictionary list
+    """
+    params = DAQ_0DViewer_Keithley27XX.params + [
+        {'title': 'Buffered acquisition', 'name': 'buffered', 'type': 'group', 'children': [
+            {'title': 'Number of scans', 'name': 'n_scans', 'type': 'int', 'value': 10, 'min': 1},
+            {'title': 'Chunk size (readings)', 'name': 'chunk_size', 'type': 'int', 'value': 1000, 'min': 1},
+            {'title': 'Poll interval (s)', 'name': 'poll_interval', 'type': 'float', 'value': 0.1, 'min': 0.},
+        ]},
+    ]
+
+    def ini_attributes(self):
+        """Attributes init when DAQ_1DViewer_Keithley class is instanced"""
+        super().ini_attributes()
+        # The buffered scans are not averaged: Naverage is handled by the viewer
+        self.hardware_averaging = False
+
+    def channels_to_plot(self):
+        """Return the channels read in the selected mode, in the order of the scan"""
+        if self.panel == 'FRONT':
+            return []
+        return [int(chan) for chan in self.channels_in_selected_mode[2:-1].split(',')]
+
+    def grab_data(self, Naverage=1, **kwargs):
+        """Start a buffered acquisition of several scans
+
+        :param Naverage: Number of hardware averaging (not used)
+        :type Naverage: int
+
+        :param kwargs: others optionals arguments
+        :type kwargs: dict
+        """
+        data_measurement, data_times = self.controller.data_buffered(
+            self.settings['buffered', 'n_scans'],
+            chunk_size=self.settings['buffered', 'chunk_size'],
+            poll_interval=self.settings['buffered', 'poll_interval'])
+        if data_measurement.shape[0] == 0:
+            # Stopped before the end of the first scan
+            return
+        # Time axis given by the timestamp of the first channel of each scan
+        axis = Axis('Time', units='s', data=data_times[:, 0], index=0)
+        channels = self.channels_to_plot()
+
+        # EMISSION OF DATA
+        if not self.controller.reading_scan_list:
+            label = self.dict_label_mode[self.controller.current_mode]
+            if self.panel == 'FRONT':
+                labels = ['Front input']
+            else:
+                labels = ['Channel ' + str(chan) for chan in channels]
+            dte = DataToExport(name='keithley',
+                               data=[DataFromPlugins(name=label,
+                                                     data=[data_measurement[:, i] for i in
+                                                           range(data_measurement.shape[1])],
+                                                     dim='Data1D',
+                                                     labels=labels,
+                                                     axes=[axis])])
+
+        # When reading the scan_list, data are displayed and exported grouped by mode
+        else:
+            dte = DataToExport(name='keithley',
+                               data=[DataFromPlugins(name=self.dict_label_mode[key],
+                                                     data=[data_measurement[:, channels.index(chan)] for chan in
+                                                           self.controller.modes_channels_dict.get(key)],
+                                                     dim='Data1D',
+                                                     labels=['Channel ' + str(chan) for chan in
+                                                             self.controller.modes_channels_dict.get(key)],
+                                                     axes=[axis]
+                                                     ) for key in self.controller.modes_channels_dict.keys() if
+                                     self.controller.modes_channels_dict.get(key) != []])
+        update_statistics_settings(self.settings, self.rsrc_name)
+        self.dte_signal.emit(dte)
+
+    def stop(self):
+        """Stop the current buffered acquisition"""
+        self.controller.stop_requested = True
+        return super().stop()
+
+
+if __name__ == '__main__':
+    main(__file__)
@@ -0,0 +1,127 @@
+import numpy as np
+
+from pymodaq.utils.daq_utils import ThreadCommand, getLineInfo
+from pymodaq.utils.data import Axis, DataFromPlugins, DataToExport
+from pymodaq.control_modules.viewer_utility_classes import main
+from pymodaq_plugins_keithley.daq_viewer_plugins.plugins_0D.daq_0Dviewer_Keithley_Pico import \
+    DAQ_0DViewer_Keithley_Pico
+from pymodaq_plugins_keithley.hardware.visa_resources import LazyParams
+from pymodaq_plugins_keithley.hardware.instrumentation import update_statistics_settings
+from pymodaq.utils.logger import set_logger, get_module_name
+logger = set_logger(get_module_name(__file__))
+
+
+class DAQ_1DViewer_Keithley_Pico(DAQ_0DViewer_Keithley_Pico):
+    """Keithley picoammeter/electrometer plugin class for a 1D viewer.
+
+    Buffered acquisition: the readings are stored in the instrument's trace buffer at its own rate, with their
+    timestamps, then transferred at once as a binary block and displayed as a reading versus time trace. When only
+    the mean and standard deviation are needed, they can be computed by the instrument (CALC3) instead of transferring
+    the trace. The connection and the measurement type are handled as in the DAQ_0DViewer_Keithley_Pico plugin.
+
+    :param params: Parameters displayed in the daq_viewer interface
+    :type params: dictionary list
+    """
+    params = LazyParams(lambda: DAQ_0DViewer_Keithley_Pico.params + [
+        {'title': 'Buffered acquisition:', 'name': 'buffered', 'type': 'group', 'children': [
+            {'title': 'Number of readings:', 'name': 'n_points', 'type': 'int', 'value': 100, 'min': 2, 'max': 2048},
+            {'title': 'Statistics only (CALC3):', 'name': 'statistics', 'type': 'bool', 'value': False,
+             'tip': 'Export the mean and standard deviation computed by the instrument instead of the trace'},
+        ]},
+    ])
+
+    data_formats = {'ASC': None, 'SRE': 'f'}
+
+    def ini_detector(self, controller=None):
+        """Initialize the connection as the 0D plugin does, then the trace buffer and the readings format"""
+        # The test reading of the 0D plugin is parsed as ASCII
+        self.data_format = 'ASC'
+        status = super().ini_detector(controller)
+        self.controller.write(':TRAC:CLE')
+        self.set_data_format()
+        return status
+
+    def set_data_format(self):
+        """The trace is transferred in single precision binary format, the statistics in ASCII
+
+        The format is sent with the next acquisition, see format_commands.
+        """
+        self.data_format = 'ASC' if self.settings['buffered', 'statistics'] else 'SRE'
+
+    def format_commands(self):
+        """Format of the readings: values and timestamps, in the selected data format (little endian if binary)"""
+        return [':FORM:ELEM READ,TIME', ':FORM:DATA ' + self.data_format, ':FORM:BORD SWAP']
+
+    def commit_settings(self, param):
+        """Activate the parameters changes in the hardware, see DAQ_0DViewer_Keithley_Pico.commit_settings"""
+        try:
+            if param.name() == 'statistics':
+                self.set_data_format()
+            else:
+                super().commit_settings(param)
+        except Exception as e:
+            self.emit_status(ThreadCommand('Update_Status', [getLineInfo() + str(e), 'log']))
+
+    def acquire_buffer(self, n_points):
+        """Fill the trace buffer with n_points readings and wait for the end of the acquisition
+
+        The trigger, buffer and initiation commands are sent in a single message, completed by *OPC?.
+
+        :param n_points: Number of readings
+        :type n_points: int
+        """
+        with self.controller.lock:
+            commands = self.trigger_commands(n_points) + [':TRAC:CLE', ':TRAC:FEED SENS',
+                                                          ':TRAC:POIN {:d}'.format(n_points), ':TRAC:FEED:CONT NEXT',
+                                                          ':INIT', '*OPC?']
+            self.controller.query(';'.join(commands))
+
+    def fetch_buffer(self, n_points):
+        """Transfer the trace buffer in a single binary block
+
+        :param n_points: Number of readings stored in the buffer
+        :type n_points: int
+        :return: The readings and their timestamps (s, relative to the first reading)
+        :rtype: tuple of numpy arrays
+        """
+        block = self.controller.query_binary_values(':TRAC:DATA?',
+                                                    datatype=self.data_formats[self.data_format],
+                                                    is_big_endian=False,
+                                                    container=np.array,
+                                                    data_points=2 * n_points)
+        values, times = block[::2].astype(float), block[1::2].astype(float)
+        return values, times - times[0]
+
+    def statistics(self):
+        """Mean and standard deviation of the buffer readings, computed by the instrument
+
+        :rtype: tuple of float
+        """
+        return tuple(float(self.controller.query(':CALC3:FORM {};:CALC3:DATA?'.format(statistic)))
+                     for statistic in ('MEAN', 'SDEV'))
+
+    def grab_data(self, Naverage=1, **kwargs):
+        """Start a buffered acquisition and emit the trace, or its statistics
+
+        :param Naverage: Number of hardware averaging (not used)
+        :type Naverage: int
+        """
+        n_points = self.settings['buffered', 'n_points']
+        transactions = self.controller.transactions
+        self.acquire_buffer(n_points)
+        label = self.settings['config', 'meas_type']
+        if self.settings['buffered', 'statistics']:
+            mean, std = self.statistics()
+            dwa = DataFromPlugins(name='Keithley', data=[np.array([mean]), np.array([std])], dim='Data0D',
+                                  labels=[label, label + ' std'])
+        else:
+            values, times = self.fetch_buffer(n_points)
+            dwa = DataFromPlugins(name='Keithley', data=[values], dim='Data1D', labels=[label],
+                                  axes=[Axis('Time', units='s', data=times, index=0)])
+        self.settings.child('transactions').setValue(self.controller.transactions - transactions)
+        update_statistics_settings(self.settings, self.settings['VISA_ressources'])
+        self.dte_signal.emit(DataToExport('Keithley', data=[dwa]))
+
+
+if __name__ == '__main__':
+    main(__file__, init=False)
@@ -0,0 +1,130 @@
+import numpy as np
+from pymodaq.utils.data import Axis, DataFromPlugins, DataToExport
+from pymodaq.control_modules.viewer_utility_classes import main
+from pymodaq.utils.parameter import Parameter
+from pymodaq_plugins_keithley import config
+from pymodaq_plugins_keithley.daq_viewer_plugins.plugins_1D.daq_1Dviewer_Keithley27XX import DAQ_1DViewer_Keithley27XX
+from pymodaq_plugins_keithley.hardware.instrumentation import update_statistics_settings
+from pymodaq_plugins_keithley.utils import RollingWindow
+from pymodaq.utils.logger import set_logger, get_module_name
+logger = set_logger(get_module_name(__file__))
+
+
+class DAQ_2DViewer_Keithley27XX(DAQ_1DViewer_Keithley27XX):
+    """ Keithley plugin class for a 2D viewer.
+
+    The scans of a buffered acquisition (see DAQ_1DViewer_Keithley27XX) are assembled into one image per measurement
+    mode, either:
+    - a channels x scans matrix holding the last scans (rolling window, time along the x axis)
+    - a spatial grid holding the last scan, each channel being placed in the cell given by its x and y keys in the
+      configuration file (channels without position are not displayed)
+
+    The images are preallocated on each mode change and updated in place by the grabs, which emit copies of them.
+
+    :param controller: The particular object that allow the communication with the keithley27XX_VISADriver.
+    :type  controller:  object
+
+    :param params: Parameters displayed in the daq_viewer interface
+    :type params: dictionary list
+    """
+    params = DAQ_1DViewer_Keithley27XX.params + [
+        {'title': 'Image', 'name': 'image', 'type': 'group', 'children': [
+            {'title': 'Layout', 'name': 'layout', 'type': 'list', 'limits': ['Channels x scans', 'Spatial grid'],
+             'value': 'Channels x scans'},
+            {'title': 'Window (scans)', 'name': 'window', 'type': 'int', 'value': 100, 'min': 1},
+        ]},
+    ]
+
+    def ini_attributes(self):
+        """Attributes init when DAQ_2DViewer_Keithley class is instanced"""
+        super().ini_attributes()
+        self.times: RollingWindow = None
+        self.images = []
+
+    def commit_settings(self, param: Parameter):
+        """Apply the consequences of a change of value in the detector settings"""
+        super().commit_settings(param)
+        # The images are allocated by ini_detector once connected
+        if param.name() in ['layout', 'window'] and self.controller is not None:
+            self.update_outputs()
+
+    def channel_positions(self):
+        """Return the (x, y) grid cell of each channel having both keys in the configuration file"""
+        positions = {}
+        for module in self.controller.configured_modules:
+            channels = config["Keithley", "27XX", self.instr, module, "CHANNELS"]
+            for key in channels.keys():
+                channel_config = channels[key]
+                if isinstance(channel_config, dict) and 'x' in channel_config and 'y' in channel_config:
+                    positions[int(key)] = (int(channel_config['x']), int(channel_config['y']))
+        return positions
+
+    def update_outputs(self):
+        """Allocate the image of each exported group of the current mode (see DAQ_0DViewer_Keithley27XX.update_outputs)
+
+        For the channels x scans layout, each image is a rolling window of the readings of its channels. For the spatial
+        grid layout, each image is a grid (NaN where no channel is placed), filled through the (rows, columns, readings
+        indexes) of its placed channels.
+        """
+        super().update_outputs()
+        self.images = []
+        if self.settings['image', 'layout'] == 'Spatial grid':
+            positions = self.channel_positions() if self.panel == 'REAR' else {}
+            shape = (max([y for _, y in positions.values()], default=0) + 1,
+                     max([x for x, _ in positions.values()], default=0) + 1)
+            for _, channels, indexes in self.controller.scan_groups():
+                placed = [(positions[channel][1], positions[channel][0], index)
+                          for channel, index in zip(channels, indexes) if channel in positions]
+                rows, columns, readings = np.array(placed, dtype=int).reshape(-1, 3).T
+                self.images.append((np.full(shape, np.nan), (rows, columns, readings)))
+            if not positions:
+                logger.warning("No channel placed on the grid, the x and y keys of the channels are missing")
+        else:
+            window = self.settings['image', 'window']
+            self.times = RollingWindow(1, window)
+            for _, channels, indexes in self.controller.scan_groups():
+                # Channel axis given by the channel numbers (0 for the front input)
+                axis = Axis('Channel', data=np.array([0. if channel == 'front' else float(channel)
+                                                      for channel in channels]), index=0)
+                self.images.append((RollingWindow(len(indexes), window), np.array(indexes), axis))
+
+    def grab_data(self, Naverage=1, **kwargs):
+        """Start a buffered acquisition of several scans and update the images with them
+
+        :param Naverage: Number of hardware averaging (not used)
+        :type Naverage: int
+
+        :param kwargs: others optionals arguments
+        :type kwargs: dict
+        """
+        data_measurement, data_times = self.controller.data_buffered(
+            self.settings['buffered', 'n_scans'],
+            chunk_size=self.settings['buffered', 'chunk_size'],
+            poll_interval=self.settings['buffered', 'poll_interval'])
+        if data_measurement.shape[0] == 0:
+            # Stopped before the end of the first scan
+            return
+
+        # EMISSION OF DATA
+        if self.settings['image', 'layout'] == 'Spatial grid':
+            data = []
+            for (name, _, _), (grid, (rows, columns, readings)) in zip(self.outputs, self.images):
+                grid[rows, columns] = data_measurement[-1, readings]
+                # The grid is updated in place by the next grabs, the emitted image is a copy
+                data.append(DataFromPlugins(name=name, data=[grid.copy()], dim='Data2D', labels=[name]))
+        else:
+            # Time axis given by the timestamp of the first channel of each scan, the scans not yet acquired being
+            # left out until the window is filled. The windows are updated in place: copies are emitted
+            self.times.append(data_times[:, :1].T)
+            axis = Axis('Time', units='s', data=self.times.filled[0].copy(), index=1)
+            data = []
+            for (name, _, _), (window, indexes, channel_axis) in zip(self.outputs, self.images):
+                window.append(data_measurement[:, indexes].T)
+                data.append(DataFromPlugins(name=name, data=[window.filled.copy()], dim='Data2D', labels=[name],
+                                            axes=[channel_axis, axis]))
+        update_statistics_settings(self.settings, self.rsrc_name)
+        self.dte_signal.emit(DataToExport(name='keithley', data=data))
+
+
+if __name__ == '__main__':
+    main(__file__)
@@ -0,0 +1,107 @@
+"""
+asyncio interface of the Keithley VISA drivers
+
+Every method of a wrapped driver (Keithley27XXVISADriver, Keithley2100VISADriver, Keithley2110VISADriver...) can
+be awaited. The blocking calls of each instrument run one at a time in a worker thread of its own, so that a single
+event loop overlaps the waits of many instruments::
+
+    k2700 = AsyncDriver(Keithley27XXVISADriver('ASRL1::INSTR'), deadline=30.)
+    k2100 = AsyncDriver(Keithley2100VISADriver('USB0::0x05E6::0x2100::1149087::INSTR'))
+    await asyncio.gather(k2700.init_hardware(), k2100.init_hardware())
+    await k2700.configuration_sequence()
+    await k2700.set_mode('SCAN_SCAN_LIST')
+    (_, values, times), reading = await asyncio.gather(k2700.data(return_answer=False), k2100.read(deadline=2.))
+
+Each call can be given a deadline (s), the deadline keyword being reserved: the VISA timeout of the call is then
+bounded by the remaining time, so that an overdue call both raises asyncio.TimeoutError and releases the instrument
+(its output buffer being cleared). A call cancelled before it started is never sent. A call cancelled while running cannot be interrupted: it ends with
+its current VISA transaction (bounded by the deadline, if any), while the stop_requested flag of the driver, if any,
+is set to end the acquisition loops (see Keithley27XXVISADriver.data_buffered).
+"""
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pyvisa as visa
+from pyvisa.constants import StatusCode
+
+from pymodaq.utils.logger import set_logger, get_module_name
+logger = set_logger(get_module_name(__file__))
+
+
+class AsyncDriver:
+    """Awaitable counterpart of a blocking VISA driver
+
+    :param driver: The driver instance, not necessarily initialized
+    :type driver: object
+    :param deadline: Default deadline (s) of the calls, None for no deadline other than the VISA timeout
+    :type deadline: float
+    """
+    def __init__(self, driver, deadline=None):
+        self.driver = driver
+        self.deadline = deadline
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='AsyncDriver')
+
+    def __repr__(self):
+        return '<AsyncDriver({!r})>'.format(self.driver)
+
+    def __getattr__(self, name):
+        attr = getattr(self.driver, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, deadline=None, **kwargs):
+            return await self.call(attr, *args, deadline=deadline, **kwargs)
+        return method
+
+    def _run(self, function, args, kwargs, end):
+        """Call function in the worker thread, its VISA timeout bounded by the time left before end"""
+        session = getattr(self.driver, '_instr', None)
+        if end is None or session is None:
+            return function(*args, **kwargs)
+        timeout = session.timeout
+        left = end - time.monotonic()
+        if left <= 0:
+            raise asyncio.TimeoutError('Deadline expired before the call to {}'.format(function.__name__))
+        bounded = max(1, min(timeout, int(1000 * left)))
+        session.timeout = bounded
+        try:
+            return function(*args, **kwargs)
+        except visa.errors.VisaIOError as err:
+            if err.error_code != StatusCode.error_timeout or bounded == timeout:
+                raise
+            # The reply may still come: the device clear discards it, so that it is not read by the next call
+            session.clear()
+            raise asyncio.TimeoutError('Deadline expired during the call to {}'.format(function.__name__)) from err
+        finally:
+            # A timeout set by the call itself (absolute value, e.g. the scan timeout of a 27XX) is kept
+            if session.timeout == bounded:
+                session.timeout = timeout
+
+    async def call(self, function, *args, deadline=None, **kwargs):
+        """Await a blocking function of the instrument, called in its worker thread
+
+        :param function: Function to call, usually a method of the driver
+        :type function: callable
+        :param deadline: Maximum duration (s) of the call, the default deadline if None
+        :type deadline: float
+        :raises asyncio.TimeoutError: if the call is not over within the deadline
+        """
+        deadline = self.deadline if deadline is None else deadline
+        end = None if deadline is None else time.monotonic() + deadline
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._run, function, args, kwargs, end)
+        try:
+            return await asyncio.wait_for(future, deadline)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if hasattr(self.driver, 'stop_requested'):
+                self.driver.stop_requested = True
+            raise
+
+    async def close(self, deadline=None):
+        """Close the driver, then stop the worker thread"""
+        try:
+            await self.call(self.driver.close, deadline=deadline)
+        finally:
+            self._executor.shutdown(wait=False)
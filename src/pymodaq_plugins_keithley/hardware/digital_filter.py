@@ -0,0 +1,72 @@
+"""
+Digital filter of the Keithley 2100 and 2110 multimeters
+
+Both instruments filter the readings of each measurement function with the same SCPI subsystem
+(<function>:AVER:TCON REP|MOV, <function>:AVER:COUN and <function>:AVER:STAT), configured by DigitalFilterMixin.
+"""
+
+
+class DigitalFilterMixin:
+    """Digital filter of the measurement functions of a multimeter driver
+
+    The driver holds the session in _instr and sets the current measurement function ('VOLT:DC', 'RES'...) in the
+    function attribute, calling apply_filter whenever it changes. The filters and averaging attributes must be
+    initialized by the driver, as done by init_filter.
+    """
+    # Maximum count of the digital filter
+    max_filter_count = 100
+
+    def init_filter(self):
+        # Measurement function (set by *RST), configured filter of each function (see set_filter) and readings
+        # averaged by the repeating filter (see set_averaging)
+        self.function = 'VOLT:DC'
+        self.filters = {}
+        self.averaging = 1
+
+    def set_filter(self, filter_type='REP', count=10, function=None):
+        """Configure the digital filter of a measurement function, applied whenever the function is selected
+
+        :param filter_type: 'REP' (repeating filter, count readings averaged per reading), 'MOV' (moving average) or
+         'OFF'
+        :type filter_type: string
+        :param count: Number of averaged readings (2 to max_filter_count)
+        :type count: int
+        :param function: Measurement function ('VOLT:DC', 'RES'...), the current one by default
+        :type function: string
+        """
+        filter_type = filter_type.upper()
+        if filter_type not in ('REP', 'MOV', 'OFF'):
+            raise ValueError("Filter type {} not supported, should be 'REP', 'MOV' or 'OFF'".format(filter_type))
+        if not 2 <= count <= self.max_filter_count:
+            raise ValueError("Filter count {} out of range (2 to {})".format(count, self.max_filter_count))
+        function = function or self.function
+        self.filters[function] = (filter_type, int(count))
+        if function == self.function:
+            self.apply_filter()
+
+    def set_averaging(self, count):
+        """Average count readings per reading in the instrument, with the repeating filter
+
+        The filter configured by set_filter is overridden until the count is set back to 1. The session timeout must
+        cover the count integrations.
+
+        :param count: Number of averaged readings (1 to max_filter_count)
+        :type count: int
+        """
+        if not 1 <= count <= self.max_filter_count:
+            raise ValueError("Filter count {} out of range (1 to {})".format(count, self.max_filter_count))
+        self.averaging = count
+        self.apply_filter()
+
+    def apply_filter(self):
+        # Filter of the current function: repeating filter of the averaging count, or the configured filter
+        if self.averaging > 1:
+            filter_type, count = 'REP', self.averaging
+        else:
+            filter_type, count = self.filters.get(self.function, ('OFF', 10))
+        prefix = ":{}:AVER:".format(self.function)
+        if filter_type == 'OFF':
+            self._instr.write_settings(prefix + "STAT OFF")
+        else:
+            self._instr.write_settings(prefix + "TCON " + filter_type, prefix + "COUN " + str(count),
+                                       prefix + "STAT ON")
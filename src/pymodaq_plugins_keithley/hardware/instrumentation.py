@@ -0,0 +1,283 @@
+"""
+Per command timing instrumentation of the SCPI traffic
+
+When enabled, every I/O call made through a shared VISA session (see visa_resources.SharedSession) or through an
+InstrumentedAdapter (pymeasure) is recorded: call count, latency histogram and bytes written and read, per resource
+and per command header. The recording is enabled for all the resources, or for a single one (the switch of the plugin
+settings). When disabled, the cost of a call is a single dictionary lookup.
+
+Usage::
+
+    from pymodaq_plugins_keithley.hardware.instrumentation import instrumentation
+    instrumentation.enabled = True                       # or instrumentation.enable('GPIB0::14::INSTR')
+    ...
+    print(instrumentation.report('GPIB0::14::INSTR'))
+
+pymeasure is only imported with InstrumentedAdapter, the drivers using pyvisa alone do not need it.
+"""
+import bisect
+import threading
+import time
+
+import numpy as np
+
+from pymodaq_plugins_keithley import config
+
+# Latency histogram bins: 4 per decade from 1 us to 100 s
+LATENCY_EDGES = list(np.logspace(-6, 2, 33))
+
+
+def command_key(message):
+    """Headers of a (compound) SCPI message, without their arguments: 'TRIG:COUN 5;:READ?' gives 'TRIG:COUN;:READ?'"""
+    if isinstance(message, bytes):
+        message = message.decode('ascii', errors='replace')
+    return ';'.join(part.strip().split(' ')[0] for part in message.strip().split(';') if part.strip())
+
+
+def payload_size(value, termination=None):
+    """Number of bytes of a message or a reply, None if it cannot be known"""
+    if isinstance(value, str):
+        return len(value) + len(termination or '')
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return None
+
+
+class CommandStatistics:
+    """Call count, latency histogram and byte counts of a command"""
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.
+        self.max_time = 0.
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.histogram = [0] * (len(LATENCY_EDGES) + 1)
+
+    def add(self, duration, bytes_written=0, bytes_read=0):
+        self.count += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        self.bytes_written += bytes_written or 0
+        self.bytes_read += bytes_read or 0
+        self.histogram[bisect.bisect(LATENCY_EDGES, duration)] += 1
+
+    def percentile(self, q):
+        """Upper edge (s) of the histogram bin holding the q percentile of the latencies"""
+        rank = q / 100 * self.count
+        cumulated = 0
+        for index, count in enumerate(self.histogram):
+            cumulated += count
+            if count and cumulated >= rank:
+                return LATENCY_EDGES[index] if index < len(LATENCY_EDGES) else self.max_time
+        return 0.
+
+    def as_dict(self):
+        return {'count': self.count,
+                'total_s': self.total_time,
+                'mean_ms': 1e3 * self.total_time / self.count if self.count else 0.,
+                'p50_ms': 1e3 * self.percentile(50),
+                'p99_ms': 1e3 * self.percentile(99),
+                'max_ms': 1e3 * self.max_time,
+                'bytes_written': self.bytes_written,
+                'bytes_read': self.bytes_read,
+                'histogram': list(self.histogram)}
+
+
+class Instrumentation:
+    """Statistics of the SCPI commands, per resource name and command
+
+    Replies read by a separate read call are attributed to the last command written on the same handle, with a
+    ' (read)' suffix.
+
+    The enabled attribute is the default of all the resources, overridden per resource by enable.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._statistics = {}
+        self._resources = {}
+
+    def enable(self, resource_name, enabled=True):
+        """Enable or disable the recording of the commands of a resource, whatever the enabled attribute"""
+        self._resources[resource_name] = enabled
+
+    def records(self, resource_name):
+        """Whether the commands of a resource are recorded"""
+        return self._resources.get(resource_name, self.enabled)
+
+    def record(self, resource_name, command, duration, bytes_written=0, bytes_read=0):
+        with self._lock:
+            key = (resource_name, command)
+            if key not in self._statistics:
+                self._statistics[key] = CommandStatistics()
+            self._statistics[key].add(duration, bytes_written, bytes_read)
+
+    def statistics(self, resource_name=None):
+        """Statistics of the recorded commands
+
+        :param resource_name: Resource whose commands are returned, all the resources if None
+        :type resource_name: string
+        :return: {resource name: {command: statistics dict}}, the latencies in ms
+        :rtype: dict
+        """
+        with self._lock:
+            items = [(key, stats.as_dict()) for key, stats in self._statistics.items()
+                     if resource_name is None or key[0] == resource_name]
+        statistics = {}
+        for (resource, command), stats in items:
+            statistics.setdefault(resource, {})[command] = stats
+        return statistics
+
+    def report(self, resource_name=None):
+        """Statistics as a text table, the commands sorted by total time"""
+        lines = []
+        for resource, commands in self.statistics(resource_name).items():
+            lines.append(resource)
+            for command, stats in sorted(commands.items(), key=lambda item: -item[1]['total_s']):
+                lines.append('  {:<32} {:6d} calls  mean {:8.2f} ms  p50 <{:8.2f} ms  p99 <{:8.2f} ms  {:8d} B out  '
+                             '{:9d} B in'.format(command[:32], stats['count'], stats['mean_ms'], stats['p50_ms'],
+                                                  stats['p99_ms'], stats['bytes_written'], stats['bytes_read']))
+        return '\n'.join(lines)
+
+    def reset(self, resource_name=None):
+        with self._lock:
+            for key in [key for key in self._statistics if resource_name is None or key[0] == resource_name]:
+                del self._statistics[key]
+
+    def call(self, resource_name, name, method, args, kwargs, last_command, write_termination, read_termination):
+        """Perform an I/O call and record it
+
+        :param name: Name of the called method (write, query, read_raw...)
+        :param last_command: Last command written on the handle, attributed to the replies of read calls
+        :return: The result of the call and the command key
+        """
+        message = args[0] if args and isinstance(args[0], (str, bytes)) else None
+        command = command_key(message) if message is not None else '{} (read)'.format(last_command)
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        duration = time.perf_counter() - start
+        bytes_written = payload_size(message, write_termination) if message is not None else 0
+        bytes_read = 0 if name.startswith('write') else payload_size(result, read_termination)
+        self.record(resource_name, command, duration, bytes_written, bytes_read)
+        return result, command
+
+
+def enabled_in_config():
+    try:
+        return bool(config['Keithley', 'instrumentation', 'enabled'])
+    except KeyError:
+        return False
+
+
+instrumentation = Instrumentation(enabled_in_config())
+
+
+def _instrumented_adapter_class():
+    from pymeasure.adapters import Adapter
+
+    class InstrumentedAdapter(Adapter):
+        """pymeasure adapter recording the commands sent through another adapter, see Instrumentation
+
+        :param adapter: The adapter connected to the instrument
+        :type adapter: pymeasure.adapters.Adapter
+        :param resource_name: Name under which the commands are recorded
+        :type resource_name: string
+        """
+        def __init__(self, adapter, resource_name, **kwargs):
+            super().__init__(**kwargs)
+            self.adapter = adapter
+            self.resource_name = resource_name
+            self.last_command = ''
+
+        def __repr__(self):
+            return '<InstrumentedAdapter({!r})>'.format(self.adapter)
+
+        @property
+        def connection(self):
+            return self.adapter.connection
+
+        def close(self):
+            self.adapter.close()
+
+        def _call(self, name, method, *args, **kwargs):
+            if not instrumentation.records(self.resource_name):
+                return method(*args, **kwargs)
+            result, command = instrumentation.call(self.resource_name, name, method, args, kwargs, self.last_command,
+                                                   None, None)
+            if name.startswith('write'):
+                self.last_command = command
+            return result
+
+        def _write(self, command, **kwargs):
+            self._call('write', self.adapter._write, command, **kwargs)
+
+        def _write_bytes(self, content, **kwargs):
+            self._call('write_bytes', self.adapter._write_bytes, content, **kwargs)
+
+        def _read(self, **kwargs):
+            return self._call('read', self.adapter._read, **kwargs)
+
+        def _read_bytes(self, count, break_on_termchar=False, **kwargs):
+            return self._call('read_bytes', self.adapter._read_bytes, count, break_on_termchar, **kwargs)
+
+        def flush_read_buffer(self):
+            self.adapter.flush_read_buffer()
+
+    return InstrumentedAdapter
+
+
+def __getattr__(name):
+    # InstrumentedAdapter is built on first import, so that pymeasure is only required by the pymeasure drivers
+    if name == 'InstrumentedAdapter':
+        globals()[name] = _instrumented_adapter_class()
+        return globals()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def statistics_params():
+    """Read-only group of the plugins settings displaying the statistics of their instrument"""
+    return {'title': 'SCPI statistics:', 'name': 'scpi_statistics', 'type': 'group', 'expanded': False, 'children': [
+        {'title': 'Enabled:', 'name': 'enabled', 'type': 'bool', 'value': instrumentation.enabled,
+         'tip': 'Record the latency and bytes of each command of the instrument (shared by the plugins of the same '
+                'resource)'},
+        {'title': 'Reset:', 'name': 'reset', 'type': 'bool_push', 'label': 'Reset'},
+        {'title': 'Commands:', 'name': 'commands', 'type': 'text', 'value': '', 'readonly': True},
+    ]}
+
+
+def commit_statistics_settings(settings, param, resource_name):
+    """Handle the changes of the statistics settings
+
+    :return: Whether param belongs to the statistics group
+    :rtype: bool
+    """
+    if param.name() == 'enabled' and param.parent().name() == 'scpi_statistics':
+        instrumentation.enable(resource_name, param.value())
+    elif param.name() == 'reset' and param.parent().name() == 'scpi_statistics':
+        instrumentation.reset(resource_name)
+        update_statistics_settings(settings, resource_name, force=True)
+    else:
+        return False
+    return True
+
+
+def update_statistics_settings(settings, resource_name, force=False, min_interval=1.):
+    """Display the statistics of an instrument in its plugin settings, at most once per min_interval (s)
+
+    The enabled switch is updated when the recording of the resource was switched by another plugin.
+    """
+    enabled = instrumentation.records(resource_name)
+    if settings.child('scpi_statistics', 'enabled').value() != enabled:
+        settings.child('scpi_statistics', 'enabled').setValue(enabled)
+    if not (enabled or force):
+        return
+    now = time.perf_counter()
+    if not force and now - _last_updates.get(id(settings), -min_interval) < min_interval:
+        return
+    _last_updates[id(settings)] = now
+    settings.child('scpi_statistics', 'commands').setValue(instrumentation.report(resource_name))
+
+
+_last_updates = {}
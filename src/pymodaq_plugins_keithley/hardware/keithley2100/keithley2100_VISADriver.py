@@ -1,9 +1,12 @@
+import numpy as np
 import pyvisa as visa
+from pymodaq_plugins_keithley.hardware.digital_filter import DigitalFilterMixin
+from pymodaq_plugins_keithley.hardware.visa_resources import open_session
 from pymodaq.utils.logger import set_logger, get_module_name
 logger = set_logger(get_module_name(__file__))
 
 
-class Keithley2100VISADriver:
+class Keithley2100VISADriver(DigitalFilterMixin):
     """VISA class driver for the Keithley 2100 Multimeter/Switch System
 
     This class relies on pyvisa module to communicate with the instrument via VISA protocol.
@@ -18,17 +21,20 @@ class Keithley2100VISADriver:
         """
         self._instr = None
         self.rsrc_name = rsrc_name
+        # Free running instrument, read without triggering (see set_monitoring)
+        self.monitoring = False
+        self.init_filter()
 
-    def init_hardware(self):
+    def init_hardware(self, pyvisa_backend=''):
         """Initialize the selected VISA resource
         
-        :param pyvisa_backend: Expects a pyvisa backend identifier or a path to the visa backend dll (ref. to pyvisa)
+        :param pyvisa_backend: Expects a pyvisa backend identifier or a path to the visa backend dll (ref. to pyvisa),
+         '@keithley_sim' for the simulated instruments
         :type pyvisa_backend: string
         """
-        rm = visa.highlevel.ResourceManager()
-        self._instr = rm.open_resource(self.rsrc_name,
-                                           write_termination="\n",
-                                           )    
+        self._instr = open_session(self.rsrc_name, pyvisa_backend,
+                                   write_termination="\n",
+                                   )
        
 
     def clear_buffer(self):
@@ -76,8 +82,75 @@ class Keithley2100VISADriver:
         self._instr.write("*CLS")
         self._instr.write("*RST")
 
+    def read_command(self, n):
+        """READ? command acquiring n samples per trigger, prefixed by the sample count only when it changes
+
+        The sample count is known from the settings shadow of the session (see SettingsShadow): the session lock must
+        be held until the command is sent.
+
+        :param n: Number of samples
+        :type n: int
+        :rtype: string
+        """
+        return ';:'.join(self._instr.shadow.changed("SAMP:COUN {:d}".format(n)) + ["READ?"])
+
     def read(self):
-        return float(self._instr.query("READ?"))
+        if self.monitoring:
+            return self.read_latest()
+        with self._instr.lock:
+            return float(self._instr.query(self.read_command(1)))
+
+    def read_latest(self):
+        """Latest reading of the free running instrument, without triggering (see set_monitoring)
+
+        The same reading is returned until a newer one is available.
+        """
+        return float(self._instr.query("DATA:LAT?"))
+
+    def read_burst(self, n):
+        """Acquire n readings with a single trigger and a single READ? transaction
+
+        The instrument returns all the readings at once (comma separated), the session timeout must cover the n
+        integrations.
+
+        :param n: Number of readings (1 to 50000)
+        :type n: int
+        :return: The readings
+        :rtype: numpy array
+        """
+        with self._instr.lock:
+            return self._instr.query_ascii_values(self.read_command(n), container=np.array)
+
+    def arm_burst(self, n, trigger_source='EXT'):
+        """Initiate a burst of n readings started by a single trigger, the readings being got by fetch_burst
+
+        The monitoring mode is left. Call set_mode to come back to immediate triggering.
+
+        :param n: Number of readings (1 to 50000)
+        :type n: int
+        :param trigger_source: 'BUS' for *TRG, 'EXT' for the external trigger input
+        :type trigger_source: string
+        """
+        if self.monitoring:
+            self.set_monitoring(False)
+        self._instr.write_settings("SAMP:COUN {:d}".format(n), "TRIG:SOUR " + trigger_source, "TRIG:COUN 1")
+        self._instr.write("INIT")
+
+    def wait_burst(self):
+        """Wait for the end of the burst initiated by arm_burst"""
+        self._instr.query("*OPC?")
+
+    def fetch_burst(self, wait=True):
+        """Get the readings of the burst initiated by arm_burst
+
+        :param wait: Whether the end of the burst should be waited for, False if wait_burst was called
+        :type wait: bool
+        :return: The readings
+        :rtype: numpy array
+        """
+        if wait:
+            self.wait_burst()
+        return self._instr.query_ascii_values("FETC?", container=np.array)
 
     def set_mode(self, mode, **kwargs):
         """
@@ -108,6 +181,7 @@ class Keithley2100VISADriver:
             cmd += "CURR:DC"
         elif mode == "IAC".lower():
             cmd += "CURR:AC"
+        self.function = cmd[len(':CONF:'):]
 
         if 'range' in kwargs.keys():
             cmd += ' ' + str(kwargs['range'])
@@ -116,7 +190,31 @@ class Keithley2100VISADriver:
         elif 'resolution' in kwargs.keys():
             cmd += ' DEF,' + str(kwargs['resolution'])
 
-        self._instr.write(cmd)
+        # Skipped when the instrument is already in this configuration (see SharedSession.write_settings)
+        self._instr.write_settings(cmd)
+        self.apply_filter()
+        # CONF sets the one-shot trigger model
+        if self.monitoring:
+            self.set_monitoring()
+
+    def set_monitoring(self, enabled=True):
+        """Let the instrument measure continuously, the latest reading being read by read without triggering
+
+        The measurements are initiated continuously (INIT:CONT ON) and triggered immediately, so that a read is a
+        single short query whatever the integration time. Readings are skipped between two reads, and read_burst is
+        not available in this mode. The mode is kept by set_mode.
+
+        :param enabled: True for the monitoring mode, False to come back to one reading per READ?
+        :type enabled: bool
+        """
+        self.monitoring = enabled
+        if enabled:
+            self._instr.write_settings("SAMP:COUN 1", "TRIG:SOUR IMM", "TRIG:COUN INF", "INIT:CONT ON")
+        else:
+            self._instr.write_settings("INIT:CONT OFF")
+            # Stop the free running measurements (infinite trigger count)
+            self._instr.write("ABOR")
+            self._instr.write_settings("TRIG:COUN 1")
 
     def user_command(self):
         command = input('Enter here a command you want to send directly to the Keithley [if None, press enter]: ')
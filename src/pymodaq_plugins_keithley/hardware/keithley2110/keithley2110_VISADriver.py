@@ -1,25 +1,28 @@
 import pyvisa as visa
+from pymodaq_plugins_keithley.hardware.digital_filter import DigitalFilterMixin
+from pymodaq_plugins_keithley.hardware.visa_resources import open_session
 
 
-class Keithley2110VISADriver:
+class Keithley2110VISADriver(DigitalFilterMixin):
     """
         VISA class driver for the Keithley 2110  5 1/2 Digit DMM
         This class relies on pyvisa module to communicate with the instrument via VISA protocol
         Please refer to the instrument reference manual available at:
         https://download.tek.com/manual/2110-901-01(C-Aug2013)(Ref).pdf
     """
-    def __init__(self, rsrc_name, pyvisa_backend='@ni'):
+    def __init__(self, rsrc_name, pyvisa_backend=''):
         """
         Parameters
         ----------
         rsrc_name   (string)        VISA Resource name
-        pyvisa_backend  (string)    Expects a pyvisa backend identifier or a path to the visa backend dll (ref. to pyvisa)
+        pyvisa_backend  (string)    Expects a pyvisa backend identifier or a path to the visa backend dll (ref. to pyvisa),
+                                    '@keithley_sim' for the simulated instruments
         """
-        rm = visa.highlevel.ResourceManager(pyvisa_backend)
-        self._instr = rm.open_resource(rsrc_name)
-
-        self._instr.read_termination = '\n'
-        self._instr.write_termination = '\n'
+        self._instr = open_session(rsrc_name, pyvisa_backend,
+                                   read_termination='\n',
+                                   write_termination='\n',
+                                   )
+        self.init_filter()
 
     def close(self):
         self._instr.close()
@@ -63,6 +66,7 @@ class Keithley2110VISADriver:
             cmd += "CURR:DC"
         elif mode == "IAC".lower():
             cmd += "CURR:AC"
+        self.function = cmd[len(':CONF:'):]
 
         if 'range' in kwargs.keys():
             cmd += ' ' + str(kwargs['range'])
@@ -71,7 +75,9 @@ class Keithley2110VISADriver:
         elif 'resolution' in kwargs.keys():
             cmd += ' DEF,' + str(kwargs['resolution'])
 
-        self._instr.write(cmd)
+        # Skipped when the instrument is already in this configuration (see SharedSession.write_settings)
+        self._instr.write_settings(cmd)
+        self.apply_filter()
 
 
 if __name__ == "__main__":
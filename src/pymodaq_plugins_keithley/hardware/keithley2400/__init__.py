@@ -0,0 +1 @@
+from .keithley2400_sweep import list_sweep, linear_sweep
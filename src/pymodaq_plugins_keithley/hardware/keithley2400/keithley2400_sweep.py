@@ -0,0 +1,116 @@
+from contextlib import contextmanager
+
+import numpy as np
+from pymeasure.adapters import VISAAdapter
+
+from pymodaq_plugins_keithley.hardware.simulator.pymeasure_adapter import SimulatedAdapter
+from pymodaq.utils.logger import set_logger, get_module_name
+logger = set_logger(get_module_name(__file__))
+
+SOURCE_FUNCTIONS = {'Current': 'CURR', 'Voltage': 'VOLT'}
+# Readings elements set by pymeasure's Keithley2400 (VOLTAGE, CURRENT, RESISTANCE, TIME, STATUS)
+N_ELEMENTS = 5
+MAX_POINTS = 2500
+MAX_LIST_POINTS = 100
+# Upper bound of the duration of a reading (10 PLC at 50 Hz, auto zero and overheads)
+MAX_READING_DURATION = 0.5
+
+
+def list_commands(function, levels):
+    """Commands uploading a list of source levels, by messages of 100 levels at most
+
+    :param function: Source function ('VOLT' or 'CURR')
+    :type function: string
+    :param levels: Source levels
+    :type levels: list of float
+    :return: One command per message
+    :rtype: list of string
+    """
+    commands = [':SOUR:{}:MODE LIST'.format(function)]
+    for start in range(0, len(levels), MAX_LIST_POINTS):
+        header = ':SOUR:LIST:{}{}'.format(function, ':APP' if start else '')
+        commands.append('{} {}'.format(header, ','.join('{:g}'.format(level) for level in
+                                                        levels[start:start + MAX_LIST_POINTS])))
+    return commands
+
+
+def linear_commands(function, start, stop, n_points):
+    """Commands configuring a linear staircase sweep from start to stop
+
+    :param function: Source function ('VOLT' or 'CURR')
+    :type function: string
+    :rtype: list of string
+    """
+    return [':SOUR:{0}:STAR {1:g};:SOUR:{0}:STOP {2:g};:SOUR:SWE:SPAC LIN;:SOUR:SWE:POIN {3:d};'
+            ':SOUR:{0}:MODE SWE'.format(function, start, stop, n_points)]
+
+
+@contextmanager
+def sweep_timeout(instrument, n_points, delay):
+    """Raise the timeout of a VISA connection so that it covers the whole sweep, then restore it"""
+    # Adapter wrapped by an InstrumentedAdapter
+    adapter = getattr(instrument.adapter, 'adapter', instrument.adapter)
+    if not isinstance(adapter, (VISAAdapter, SimulatedAdapter)):
+        yield
+        return
+    timeout = adapter.connection.timeout
+    adapter.connection.timeout = max(timeout, 1000 * n_points * (delay + MAX_READING_DURATION) + 2000)
+    try:
+        yield
+    finally:
+        adapter.connection.timeout = timeout
+
+
+def run_sweep(instrument, commands, n_points, source_mode='Voltage', delay=0.001):
+    """Configure a sweep, trigger it once and read all the source/measure pairs in a single transfer
+
+    The output must be enabled. The source is set back to its fixed mode, the trigger count to 1 and the source delay
+    (or auto delay) to its previous setting afterwards.
+
+    :param instrument: The connected sourcemeter
+    :type instrument: pymeasure.instruments.keithley.Keithley2400
+    :param commands: Sweep configuration commands, see list_commands and linear_commands
+    :type commands: list of string
+    :param n_points: Number of source levels
+    :type n_points: int
+    :param source_mode: 'Voltage' or 'Current'
+    :type source_mode: string
+    :param delay: Source delay (s) before each measurement
+    :type delay: float
+    :return: The voltages and the currents
+    :rtype: tuple of numpy arrays
+    """
+    if not 1 <= n_points <= MAX_POINTS:
+        raise ValueError('A sweep is limited to {} points'.format(MAX_POINTS))
+    function = SOURCE_FUNCTIONS[source_mode]
+    if instrument.ask(':SOUR:DEL:AUTO?').strip() in ('1', 'ON'):
+        restore_delay = ':SOUR:DEL:AUTO ON'
+    else:
+        restore_delay = ':SOUR:DEL {:g}'.format(float(instrument.ask(':SOUR:DEL?')))
+    for command in commands:
+        instrument.write(command)
+    try:
+        instrument.write(':SOUR:DEL {:g};:TRIG:COUN {:d}'.format(delay, n_points))
+        with sweep_timeout(instrument, n_points, delay):
+            values = np.array(instrument.values(':READ?'), dtype=float)
+    finally:
+        instrument.write(':SOUR:{}:MODE FIX;:TRIG:COUN 1;{}'.format(function, restore_delay))
+    values = values.reshape(-1, N_ELEMENTS)
+    return values[:, 0], values[:, 1]
+
+
+def list_sweep(instrument, levels, source_mode='Voltage', delay=0.001):
+    """Source each level of a list and measure, with a single trigger, see run_sweep
+
+    :param levels: Source levels (V or A)
+    :type levels: list of float
+    """
+    levels = list(levels)
+    return run_sweep(instrument, list_commands(SOURCE_FUNCTIONS[source_mode], levels), len(levels),
+                     source_mode, delay)
+
+
+def linear_sweep(instrument, start, stop, n_points, source_mode='Voltage', delay=0.001):
+    """Source n_points levels linearly spaced from start to stop and measure, with a single trigger, see run_sweep"""
+    return run_sweep(instrument, linear_commands(SOURCE_FUNCTIONS[source_mode], start, stop, n_points), n_points,
+                     source_mode, delay)
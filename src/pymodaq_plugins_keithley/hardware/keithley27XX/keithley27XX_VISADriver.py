@@ -1,9 +1,164 @@
+import hashlib
+import re
+import string
+import time
+import warnings
 import numpy as np
 import pyvisa as visa
+from pyvisa.constants import StatusCode
 from pymodaq_plugins_keithley import config
+from pymodaq_plugins_keithley.utils import SetupCache
+from pymodaq_plugins_keithley.hardware.visa_resources import list_resources, open_session
 from pymodaq.utils.logger import set_logger, get_module_name
 logger = set_logger(get_module_name(__file__))
 
+# Characters of the units attached to ASCII replies (VDC, OHM, C, RDNG#...), the exponent mark E excepted
+UNIT_CHARACTERS = (string.ascii_uppercase.replace('E', '') + '#').encode()
+# Numeric value at the beginning of each element of an ASCII reply
+ASCII_ELEMENT = re.compile(r'(?:^|,)\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+
+# Timing model of the readings (s), used to set the timeouts from the expected duration of the scans
+DEFAULT_NPLC = 5.
+# Firmware time of a reading and relay settling time of a scanned channel (7700 series)
+READING_OVERHEAD = .002
+RELAY_SETTLING = .003
+# Settling time of the AC measurements for each detector bandwidth (Hz)
+AC_SETTLING = {3.: 2.5, 30.: .25, 300.: .025}
+DEFAULT_BANDWIDTH = 30.
+# Gate time of the frequency measurements
+DEFAULT_APERTURE = 1.
+# Timeout of a scan: TIMEOUT_FACTOR times its expected duration, plus TIMEOUT_MARGIN for the bus and the firmware
+TIMEOUT_FACTOR = 2.
+TIMEOUT_MARGIN = 1.
+# Bytes of a reading in each data format, and throughput (bytes/s) of the non serial interfaces
+READING_BYTES = {'ASCII': 45, 'SREAL': 8, 'DREAL': 16}
+BUS_THROUGHPUT = 1e6
+
+
+def parse_ascii_answer(str_answer, n_elements=3):
+    """Extract the measurement values and timestamps of an ASCII reply in a single pass
+
+    Units are removed from the whole payload at once and the numbers are converted by numpy. Should an
+    unexpected unit (lower case, non ASCII...) prevent it, each element is parsed with a regular expression instead.
+
+    :param str_answer: Instrument answer (READING,TIMESTAMP,READING NUMBER,...) with units attached
+    :type str_answer: string
+    :param n_elements: Number of elements sent for each reading
+    :type n_elements: int
+    :return: The measurement values and the timestamp of each measurement
+    :rtype: tuple of numpy arrays
+    """
+    # Units holding a digit or an E are dropped before the per-character removal
+    payload = str_answer.replace('OHM4W', '').replace('SECS', '').encode().translate(None, UNIT_CHARACTERS)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            values = np.fromstring(payload, sep=',')
+    except ValueError:
+        # numpy >= 2 raises on an unparsable element instead of stopping there
+        values = None
+    if values is None or values.size != str_answer.count(',') + 1:
+        values = np.array(ASCII_ELEMENT.findall(str_answer), dtype=float)
+    return values[::n_elements], values[1::n_elements]
+
+
+def channel_list(channels):
+    """Format channels as the content of a SCPI channel list, consecutive channels as ranges ([101, 102, 103, 105]
+    gives '101:103,105')"""
+    channels = sorted(channels)
+    ranges = []
+    first = last = channels[0]
+    for channel in channels[1:] + [None]:
+        if channel is not None and channel == last + 1:
+            last = channel
+            continue
+        ranges.append(str(first) if first == last else '{}:{}'.format(first, last))
+        first = last = channel
+    return ','.join(ranges)
+
+
+def group_settings(plan):
+    """Group the channels of a channel plan sharing identical settings
+
+    :param plan: The (channel, mode, settings) of each channel, see Keithley27XXVISADriver.channel_plan
+    :type plan: list of tuples
+    :return: The channels of each (header, parameter) setting, in order of first use
+    :rtype: dict
+    """
+    groups = {}
+    for channel, _, settings in plan:
+        for setting in settings:
+            groups.setdefault(setting, []).append(channel)
+    return groups
+
+
+def join_commands(commands, max_length):
+    """Join commands with ';' into program messages of at most max_length characters"""
+    messages = []
+    message = ''
+    for command in commands:
+        if message and len(message) + len(command) + 1 > max_length:
+            messages.append(message)
+            message = ''
+        message = command if not message else message + ';' + command
+    if message:
+        messages.append(message)
+    return messages
+
+
+def reading_duration(mode, settings, line_frequency=50., scanned=True):
+    """Expected duration of a reading, from the settings of its channel
+
+    :param mode: Measurement mode ('VOLT:DC', 'TEMP'...)
+    :type mode: string
+    :param settings: (header, parameter) settings of the channel, see Keithley27XXVISADriver.channel_plan
+    :type settings: list of tuples
+    :param line_frequency: Power line frequency (Hz)
+    :type line_frequency: float
+    :param scanned: Whether the relay settling time of a scanned channel should be added
+    :type scanned: bool
+    :rtype: float
+    """
+    settings = {header.upper(): str(parameter).upper() for header, parameter in settings}
+
+    def number(name, default):
+        try:
+            return float(settings.get(mode + ':' + name, default))
+        except ValueError:
+            # MIN, MAX, DEF
+            return default
+
+    if mode == 'FREQ':
+        duration = number('APER', DEFAULT_APERTURE)
+    else:
+        # Autozero measures the reference as well as the input, doubling the integration time
+        duration = 2 * number('NPLC', DEFAULT_NPLC) / line_frequency
+    if mode.endswith(':AC'):
+        duration += AC_SETTLING.get(number('DET:BAND', DEFAULT_BANDWIDTH), AC_SETTLING[3.])
+    if settings.get(mode + ':AVER:STAT') in ('ON', '1') and settings.get(mode + ':AVER:TCON', 'REP') == 'REP':
+        duration *= number('AVER:COUN', 10)
+    return duration + READING_OVERHEAD + (RELAY_SETTLING if scanned else 0.)
+
+
+def filter_settings(mode, filter_type='REP', count=10):
+    """Settings enabling the digital filter of a measurement mode
+
+    :param mode: Measurement mode ('VOLT:DC', 'TEMP'...), see Keithley27XXVISADriver.filter_modes
+    :type mode: string
+    :param filter_type: 'REP' (repeating filter, count conversions per reading) or 'MOV' (moving average)
+    :type filter_type: string
+    :param count: Number of averaged conversions (1 to 100)
+    :type count: int
+    :return: (header, parameter) settings, see Keithley27XXVISADriver.channel_plan
+    :rtype: list of tuples
+    """
+    return [(mode + ':AVER:TCON', filter_type.upper()), (mode + ':AVER:COUN', str(count)), (mode + ':AVER:STAT', 'ON')]
+
+
+def plan_digest(plan, modules):
+    """Digest identifying a channel plan applied to the given switching modules"""
+    return hashlib.sha1(repr((sorted(modules.items()), plan)).encode()).hexdigest()
+
 
 class Keithley27XXVISADriver:
     """VISA class driver for the Keithley 27XX Multimeter/Switch System
@@ -21,22 +176,27 @@ class Keithley27XXVISADriver:
     logger.info("Configured instruments: {}".format(list(list_instruments.items())))
 
     # Non-amps modules
-    non_amp_module = {"MODULE01": False, "MODULE02": False}
     non_amp_modules_list = ['7701', '7703', '7706', '7707', '7708', '7709']
 
-    # Channels & modes attributes
-    channels_scan_list = ''
-    modes_channels_dict = {'VOLT:DC': [],
-                           'VOLT:AC': [],
-                           'CURR:DC': [],
-                           'CURR:AC': [],
-                           'RES': [],
-                           'FRES': [],
-                           'FREQ': [],
-                           'TEMP': []}
-    sample_count_1 = False
-    reading_scan_list = False
-    current_mode = ''
+    # Measurement modes of the channels
+    modes = ('VOLT:DC', 'VOLT:AC', 'CURR:DC', 'CURR:AC', 'RES', 'FRES', 'FREQ', 'TEMP')
+    # Measurement modes having a digital filter, and its maximum count
+    filter_modes = ('VOLT:DC', 'VOLT:AC', 'CURR:DC', 'CURR:AC', 'RES', 'FRES', 'TEMP')
+    max_filter_count = 100
+
+    # Data transfer formats: struct datatype of the binary block elements (None for ASCII)
+    data_formats = {'ASCII': None, 'SREAL': 'f', 'DREAL': 'd'}
+
+    # Maximum length (characters) of a batched configuration message, well below the input buffer of the 27XX
+    max_message_length = 1024
+    # Size of the error queue of the 27XX
+    error_queue_size = 10
+
+    # Reading buffer capacity of each model (default for unknown models)
+    buffer_sizes = {'2701': 450000, 'default': 55000}
+
+    # Timeout (ms) of the commands until a mode is set, the scans then having their own timeout (see set_scan_timeout)
+    command_timeout = 5000
 
     def __init__(self, rsrc_name):
         """Initialize KeithleyVISADriver class
@@ -48,26 +208,55 @@ class Keithley27XXVISADriver:
         self.rsrc_name = rsrc_name
         self.instr = ""
         self.configured_modules = {}
+        self.data_format = 'ASCII'
+        self.samp_count = 1
+        self.buffer_size = self.buffer_sizes['default']
+        self.stop_requested = False
+        self.configuration_errors = {}
+        self.setup_cache = SetupCache()
+
+        # Channels & modes attributes, specific to each instrument
+        self.non_amp_module = {"MODULE01": False, "MODULE02": False}
+        self.channels_scan_list = ''
+        self.modes_channels_dict = {mode: [] for mode in self.modes}
+        self.scan_channels = []
+        self.sample_count_1 = False
+        self.reading_scan_list = False
+        self.current_mode = ''
+        # Mode given to set_mode, 'SCAN_' prefixed for the rear panel
+        self.mode = ''
+        # Free running instrument, read without triggering (see set_monitoring)
+        self.monitoring = False
+
+        # Mode and settings of each configured channel, and expected duration (s) of a scan of the current mode
+        self.line_frequency = 50.
+        self.channel_settings = {}
+        self.scan_duration = 0.
+        # Conversions averaged by the repeating filter of the scanned channels, 1 for the configured filters (see
+        # set_averaging)
+        self.averaging = 1
 
     def init_hardware(self, pyvisa_backend='@py'):
         """Initialize the selected VISA resource
         
-        :param pyvisa_backend: Expects a pyvisa backend identifier or a path to the visa backend dll (ref. to pyvisa)
+        :param pyvisa_backend: Expects a pyvisa backend identifier or a path to the visa backend dll (ref. to pyvisa),
+         '@keithley_sim' for the simulated instruments
         :type pyvisa_backend: string
         """
         # Open connexion with instrument
-        rm = visa.highlevel.ResourceManager(pyvisa_backend)
-        logger.info("Resources detected by pyvisa: {}".format(rm.list_resources(query='?*')))
+        logger.info("Resources detected by pyvisa: {}".format(list_resources(pyvisa_backend, query='?*')))
         try:
-            self._instr = rm.open_resource(self.rsrc_name,
-                                           write_termination="\n",
-                                           read_termination="\n",
-                                           )
-            self._instr.timeout = 10000
+            self._instr = open_session(self.rsrc_name, pyvisa_backend,
+                                       write_termination="\n",
+                                       read_termination="\n",
+                                       )
+            self._instr.timeout = self.command_timeout
             # Check if the selected resource match the loaded configuration
             model = self.get_idn()[32:36]
+            self.line_frequency = self.get_line_frequency()
             if "27" not in model:
                 logger.warning("Driver designed to use Keithley 27XX, not {} model. Problems may occur.".format(model))
+            self.buffer_size = self.buffer_sizes.get(model, self.buffer_sizes['default'])
             for instr in config["Keithley", "27XX"]:
                 if type(config["Keithley", "27XX", instr]) == dict:
                     if self.rsrc_name in config["Keithley", "27XX", instr, "rsrc_name"]:
@@ -110,22 +299,18 @@ class Keithley27XXVISADriver:
         except visa.errors.VisaIOError as err:
             logger.error(err)
 
-    def configuration_sequence(self):
-        """Configure each channel selected by the user
+    def channel_plan(self):
+        """Compile the channels configuration of the .toml configuration file into SCPI settings
 
-        Read the configuration file to get the channels used and their configuration,
-        and send the keithley a sequence allowing to set up each channel.
-        
+        Channels not correctly defined in the configuration file are skipped.
+
+        :return: The (channel, mode, settings) of each configured channel, settings being the (header, parameter)
+         tuples to apply to the channel
+        :rtype: list of tuples
         :raises TypeError: Channel section of configuration file not correctly defined, each channel should be a dict
         :raises ValueError: Channel not correctly defined, it should at least contain a key called "mode"
         """
-        logger.info("       ********** CONFIGURATION SEQUENCE INITIALIZED **********")
-
-        self.reset()
-        self.clear_buffer()
-        channels = ''
-
-        # The following loop set up each channel in the config file
+        plan = []
         for module in self.configured_modules:
             for key in config["Keithley", "27XX", self.instr, module, "CHANNELS"].keys():
 
@@ -139,70 +324,156 @@ class Keithley27XXVISADriver:
                     logger.info("Channel {} not fully defined, 'mode' is missing" .format(key))
                     continue
                 if config["Keithley", "27XX", self.instr, module, 'CHANNELS', key, "mode"].upper()\
-                        not in self.modes_channels_dict.keys():
+                        not in self.modes:
                     logger.info("Channel {} not correctly defined, mode not recognized" .format(key))
                     continue
 
                 # Channel mode
-                mode = config["Keithley", "27XX", self.instr, module, 'CHANNELS', key, "mode"].upper()
-                self.modes_channels_dict[mode].append(int(key))
-                channel = '(@' + key + ')'
-                channels += key + ","
-                cmd = "FUNC '" + mode + "'," + channel
-                self._instr.write(cmd)
+                channel_config = config["Keithley", "27XX", self.instr, module, 'CHANNELS', key]
+                mode = channel_config["mode"].upper()
+                settings = [("FUNC", "'" + mode + "'")]
 
                 # Config
-                if 'range' in config["Keithley", "27XX", self.instr, module, 'CHANNELS', key].keys():
-                    rang = config["Keithley", "27XX", self.instr, module, 'CHANNELS', key, "range"]
-                    if 'autorange' in str(rang):
-                        self._instr.write(mode + ':RANG:AUTO ')
+                if 'range' in channel_config.keys():
+                    if 'autorange' in str(channel_config["range"]):
+                        settings.append((mode + ':RANG:AUTO', 'ON'))
                     else:
-                        self._instr.write(mode + ':RANG ' + str(range))
-
-                if 'resolution' in config["Keithley", "27XX", self.instr, module, 'CHANNELS', key].keys():
-                    resolution = config["Keithley", "27XX", self.instr, module, 'CHANNELS', key, "resolution"]
-                    self._instr.write(mode + ':DIG ' + str(resolution))
-
-                if 'nplc' in config["Keithley", "27XX", self.instr, module, 'CHANNELS', key].keys():
-                    nplc = config["Keithley", "27XX", self.instr, module, 'CHANNELS', key, "nplc"]
-                    self._instr.write(mode + ':NPLC ' + str(nplc))
+                        settings.append((mode + ':RANG', str(channel_config["range"])))
+                if 'resolution' in channel_config.keys():
+                    settings.append((mode + ':DIG', str(channel_config["resolution"])))
+                if 'nplc' in channel_config.keys():
+                    settings.append((mode + ':NPLC', str(channel_config["nplc"])))
+                if 'filter' in channel_config.keys():
+                    if mode not in self.filter_modes:
+                        logger.info("Channel {}: no filter in {} mode".format(key, mode))
+                    elif channel_config["filter"].upper() in ('REP', 'MOV'):
+                        settings.extend(filter_settings(mode, channel_config["filter"],
+                                                        channel_config.get("filter_count", 10)))
+                    else:
+                        settings.append((mode + ':AVER:STAT', 'OFF'))
 
                 if "TEMP" in mode:
-                    transducer = config["Keithley", "27XX", self.instr, module, 'CHANNELS', key, "transducer"].upper()
+                    transducer = channel_config["transducer"].upper()
+                    settings.append(("TEMP:TRAN", transducer))
                     if "TC" in transducer:
-                        tc_type = config["Keithley", "27XX", self.instr, module, 'CHANNELS', key, "type"].upper()
-                        ref_junc = config["Keithley", "27XX", self.instr, module, 'CHANNELS', key, "ref_junc"].upper()
-                        self.mode_temp_tc(channel, transducer, tc_type, ref_junc)
+                        settings.append(("TEMP:TC:TYPE", channel_config["type"].upper()))
+                        settings.append(("TEMP:RJUN:RSEL", channel_config["ref_junc"].upper()))
                     elif "THER" in transducer:
-                        ther_type = config["Keithley", "27XX", self.instr, module, 'CHANNELS', key, "type"].upper()
-                        self.mode_temp_ther(channel, transducer, ther_type)
+                        settings.append(("TEMP:THER:TYPE", channel_config["type"].upper()))
                     elif "FRTD" in transducer:
-                        frtd_type = config["Keithley", "27XX", self.instr, module, 'CHANNELS', key, "type"].upper()
-                        self.mode_temp_frtd(channel, transducer, frtd_type)
-
-                # Console info
-                logger.info("Channels {} \n {}".format(key,
-                                                       config["Keithley", "27XX", self.instr, module, 'CHANNELS', key]))
-                # Timeout update for long measurement modes such as voltage AC
-                if "AC" in mode:
-                    self._instr.timeout += 4000
-
-                # Handling errors from Keithley
-                current_error = self.get_error()
-                try:
-                    if current_error != '0,"No error"':
-                        raise ValueError("The following error has been raised by the Keithley:\
-                        %s => Please refer to the User Manual to correct it\n\
-                        Note: To make sure channels are well configured in the .toml file,\
-                        refer to section 15 'SCPI Reference Tables', Table 15-5" % current_error)
-                except Exception as err:
-                    logger.info("{}".format(err))
-                    pass
-        
+                        settings.append(("TEMP:FRTD:TYPE", channel_config["type"].upper()))
+
+                plan.append((int(key), mode, settings))
+        return plan
+
+    def configuration_sequence(self, batched=True, use_setup_cache=True):
+        """Configure each channel selected by the user
+
+        Read the configuration file to get the channels used and their configuration,
+        and send the keithley a sequence allowing to set up each channel.
+
+        In batched mode, channels sharing a setting are configured at once through a channel list such as
+        (@101:110), the commands are joined in a few messages and the error queue is read once at the end. Errors are
+        then mapped back to their channels by replaying the commands that failed.
+
+        The resulting setup is saved in the instrument memory slot given by the setup_slot key of the configuration
+        file. When that slot already holds the setup of the same channel plan, it is recalled instead of sending the
+        whole sequence.
+
+        :param batched: Whether the commands are batched, or sent and checked channel by channel
+        :type batched: bool
+        :param use_setup_cache: Whether the setup saved in the instrument memory can be used
+        :type use_setup_cache: bool
+        """
+        logger.info("       ********** CONFIGURATION SEQUENCE INITIALIZED **********")
+        self._instr.timeout = self.command_timeout
+
+        plan = self.channel_plan()
+        digest = plan_digest(plan, self.configured_modules)
+        slot = self.get_setup_slot() if use_setup_cache else None
+        recalled = slot is not None and self.recall_setup(slot, digest, plan)
+        if not recalled:
+            self.reset()
+        self.clear_buffer()
+        # *RST restores the ASCII format, binary transfer has to be selected again
+        if recalled or self.data_format != 'ASCII':
+            self.set_data_format(self.data_format)
+        self.configuration_errors = {}
+
+        # Rebuilt on each configuration, so that a reconnection does not duplicate the channels
+        self.modes_channels_dict = {mode: [] for mode in self.modes}
+        self.channel_settings = {}
+        # The configured filters are restored by the sequence
+        self.averaging = 1
+        for channel, mode, settings in plan:
+            self.modes_channels_dict[mode].append(channel)
+            # Console info
+            logger.info("Channels {} \n {}".format(channel, settings))
+            # Kept for the expected duration of the readings (timeout of the scans) and to restore the filters
+            self.channel_settings[channel] = (mode, settings)
+
+        if recalled:
+            logger.info("Channels configuration skipped, setup recalled from the instrument memory")
+        elif batched:
+            groups = group_settings(plan)
+            commands = [":{} {},(@{})".format(header, parameter, channel_list(channels))
+                        for (header, parameter), channels in groups.items()]
+            for message in join_commands(commands, self.max_message_length):
+                self._instr.write(message)
+            if self.get_errors():
+                self.locate_errors(groups)
+        else:
+            for channel, mode, settings in plan:
+                for header, parameter in settings:
+                    self._instr.write("{} {},(@{})".format(header, parameter, channel))
+                for error in self.get_errors():
+                    self.log_configuration_error(channel, error)
+
+        # Only a setup free of errors is worth recalling
+        if slot is not None and not recalled and not self.configuration_errors:
+            self.save_setup(slot, digest)
+
         self.current_mode = 'scan_list'
-        self.channels_scan_list = channels[:-1]
+        self.channels_scan_list = ','.join(str(channel) for channel, _, _ in plan)
         logger.info("       ********** CONFIGURATION SEQUENCE SUCCESSFULLY ENDED **********")
 
+    def get_setup_slot(self):
+        # Setup memory slot of the instrument used to cache the configuration, None if disabled
+        try:
+            slot = int(config["Keithley", "27XX", self.instr, "setup_slot"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return slot if slot >= 0 else None
+
+    def locate_errors(self, groups):
+        """Replay the batched configuration commands one at a time to find the channels raising errors
+
+        :param groups: Channels of each (header, parameter) setting, as returned by group_settings
+        :type groups: dict
+        """
+        for (header, parameter), channels in groups.items():
+            self._instr.write(":{} {},(@{})".format(header, parameter, channel_list(channels)))
+            if not self.get_errors():
+                continue
+            if len(channels) == 1:
+                culprits = channels
+            else:
+                culprits = []
+                for channel in channels:
+                    self._instr.write(":{} {},(@{})".format(header, parameter, channel))
+                    if self.get_errors():
+                        culprits.append(channel)
+            for channel in culprits:
+                self._instr.write(":{} {},(@{})".format(header, parameter, channel))
+                for error in self.get_errors():
+                    self.log_configuration_error(channel, "{} ({} {})".format(error, header, parameter))
+
+    def log_configuration_error(self, channel, error):
+        self.configuration_errors.setdefault(channel, []).append(error)
+        logger.info("The following error has been raised by the Keithley on channel {}: {} => Please refer to the "
+                    "User Manual to correct it\nNote: To make sure channels are well configured in the .toml file, "
+                    "refer to section 15 'SCPI Reference Tables', Table 15-5".format(channel, error))
+
     def clear_buffer(self):
         # Default: auto clear when scan start
         self._instr.write("TRAC:CLE")
@@ -219,65 +490,143 @@ class Keithley27XXVISADriver:
         self._instr.write("ROUT:OPEN:ALL")
         self._instr.close()
 
-    def data(self):
+    def data(self, return_answer=True):
         """Get data from instrument
 
         Make the Keithley perform 3 actions: init, trigger, fetch. Then process the answer to return 3 variables:
-        - The answer (string)
+        - The answer (string, None when a binary data format is used or when return_answer is False)
         - The measurement values (numpy array)
         - The timestamp of each measurement (numpy array)
+
+        In monitoring mode (see set_monitoring), the latest readings of the free running instrument are read instead,
+        without triggering: DATA:LAT? for a single reading, FETCH? for the last complete scan. The same readings are
+        returned until newer ones are available.
+
+        :param return_answer: Whether the raw answer of the instrument should be returned
+        :type return_answer: bool
         """
-        if not self.sample_count_1:
-            # Initiate scan
-            self._instr.write("INIT")
-            # Trigger scan
-            self._instr.write("*TRG")
+        # Other handles of the session must not interleave commands between the trigger and the fetch
+        command = "DATA:LAT?" if self.monitoring and self.samp_count == 1 else "FETCH?"
+        with self._instr.lock:
+            if not self.sample_count_1 and not self.monitoring:
+                # Initiate scan
+                self._instr.write("INIT")
+                # Trigger scan
+                self._instr.write("*TRG")
+                self.wait_scan()
+            if self.data_format != 'ASCII':
+                return self.data_binary(command)
             # Get data (equivalent to TRAC:DATA? from buffer)
-            str_answer = self._instr.query("FETCH?")
-        else:
-            str_answer = self._instr.query("FETCH?")
-        # Split the instrument answer (MEASUREMENT,TIME,READING COUNT) to create a list
-        list_split_answer = str_answer.split(",")
-
-        # MEASUREMENT & TIME EXTRACTION
-        list_measurements = list_split_answer[::3]
-        str_measurements = ''
-        list_times = list_split_answer[1::3]
-        str_times = ''
-        for j in range(len(list_measurements)):
-            if not j == 0:
-                str_measurements += ','
-                str_times += ','
-            for l1 in range(len(list_measurements[j])):
-                test_carac = list_measurements[j][-(l1+1)]
-                # Remove non-digit characters (units)
-                if test_carac.isdigit():
-                    if l1 == 0:
-                        str_measurements += list_measurements[j]
-                    else:
-                        str_measurements += list_measurements[j][:-l1]
-                    break
-            for l2 in range(len(list_times[j])):
-                test_carac = list_times[j][-(l2+1)]
-                # Remove non-digit characters (units)
-                if test_carac.isdigit():
-                    if l2 == 0:
-                        str_times += list_times[j]
-                    else:
-                        str_times += list_times[j][:-l2]
-                    break
-
-        # Split created string to access each value
-        list_measurements_values = str_measurements.split(",")
-        list_times_values = str_times.split(",")
-        # Create numpy.array containing desired values (float type)
-        array_measurements_values = np.array(list_measurements_values, dtype=float)
-        if not self.sample_count_1:
-            array_times_values = np.array(list_times_values, dtype=float)
-        else:
+            str_answer = self._instr.query(command)
+        # Extract measurements and times from the instrument answer (MEASUREMENT,TIME,READING COUNT)
+        array_measurements_values, array_times_values = parse_ascii_answer(str_answer)
+        if self.sample_count_1:
             array_times_values = np.array([0], dtype=float)
 
-        return str_answer, array_measurements_values, array_times_values
+        return str_answer if return_answer else None, array_measurements_values, array_times_values
+
+    def data_binary(self, command="FETCH?"):
+        """Fetch the last readings as an IEEE-488.2 binary block
+
+        The instrument must have been set in a binary data format (see set_data_format), the block then holds
+        (READING, TIMESTAMP) pairs of single or double precision floats.
+
+        :param command: Query of the readings (FETCH? or DATA:LAT?)
+        :type command: string
+        """
+        array_measurements_values, array_times_values = self.query_binary_readings(command, self.samp_count)
+        if self.sample_count_1:
+            array_times_values = np.array([0], dtype=float)
+
+        return None, array_measurements_values, array_times_values
+
+    def data_buffered(self, n_scans, chunk_size=1000, poll_interval=0.1):
+        """Perform n_scans scans filling the instrument buffer and get their readings
+
+        The scans are armed at once and run at the instrument's own rate. The buffer is transferred by chunks as
+        soon as they are filled, while the following scans are still running.
+
+        :param n_scans: Number of scans of the current scan list
+        :type n_scans: int
+        :param chunk_size: Maximum number of readings per transfer
+        :type chunk_size: int
+        :param poll_interval: Time (s) between two queries of the number of stored readings
+        :type poll_interval: float
+        :return: The measurement values and the timestamps, with shape (n_scans, number of channels)
+        :rtype: tuple of numpy arrays
+        """
+        self.set_buffered_scan(n_scans)
+        self.stop_requested = False
+        self._instr.write("INIT")
+        return self.read_buffered(n_scans, chunk_size, poll_interval)
+
+    def read_buffered(self, n_scans, chunk_size=1000, poll_interval=0.1):
+        """Get the readings of n_scans scans armed by set_buffered_scan and initiated, as they fill the buffer
+
+        :param n_scans: Number of scans of the current scan list
+        :type n_scans: int
+        :param chunk_size: Maximum number of readings per transfer
+        :type chunk_size: int
+        :param poll_interval: Time (s) between two queries of the number of stored readings
+        :type poll_interval: float
+        :return: The measurement values and the timestamps, with shape (n_scans, number of channels)
+        :rtype: tuple of numpy arrays
+        :raises TimeoutError: if no reading is stored within the session timeout
+        """
+        n_readings = n_scans * self.samp_count
+        values = np.zeros(n_readings)
+        times = np.zeros(n_readings)
+
+        start = 0
+        last_progress = time.perf_counter()
+        last_stored = 0
+        while start < n_readings and not self.stop_requested:
+            n_stored = self.get_buffer_points()
+            if n_stored > last_stored:
+                last_stored = n_stored
+                last_progress = time.perf_counter()
+            if n_stored - start >= min(chunk_size, n_readings - start):
+                count = min(chunk_size, n_stored - start)
+                values[start:start + count], times[start:start + count] = self.fetch_buffer(start, count)
+                start += count
+                last_progress = time.perf_counter()
+            elif time.perf_counter() - last_progress > self._instr.timeout / 1000:
+                self.stop_acquisition()
+                raise TimeoutError("No reading stored by the Keithley within {} ms".format(self._instr.timeout))
+            else:
+                time.sleep(poll_interval)
+        if self.stop_requested:
+            self._instr.write("ABOR")
+            n_readings = start - start % self.samp_count
+
+        shape = (n_readings // self.samp_count, self.samp_count)
+        return values[:n_readings].reshape(shape), times[:n_readings].reshape(shape)
+
+    def fetch_buffer(self, start, count):
+        """Get count readings of the instrument buffer, starting from the start index
+
+        :param start: Index of the first reading (starting from 0)
+        :type start: int
+        :param count: Number of readings
+        :type count: int
+        :return: The measurement values and the timestamp of each measurement
+        :rtype: tuple of numpy arrays
+        """
+        command = "TRAC:DATA:SEL? {},{}".format(start, count)
+        # The scan timeout only covers the transfer of a scan: extended to the transfer of the count readings
+        timeout = self._instr.timeout
+        self._instr.timeout = max(timeout, int(1000 * (TIMEOUT_FACTOR * self.transfer_duration(count) +
+                                                       TIMEOUT_MARGIN)))
+        try:
+            if self.data_format != 'ASCII':
+                return self.query_binary_readings(command, count)
+            return parse_ascii_answer(self._instr.query(command))
+        finally:
+            self._instr.timeout = timeout
+
+    def get_buffer_points(self):
+        # Number of readings currently stored in the buffer
+        return int(self._instr.query("TRAC:POIN:ACT?"))
 
     def get_card(self):
         # Query switching module
@@ -287,17 +636,39 @@ class Keithley27XXVISADriver:
         # Ask the keithley to return the last current error
         return self._instr.query("SYST:ERR?")
     
+    def get_errors(self):
+        """Empty the error queue of the instrument
+
+        :return: The errors of the queue, oldest first
+        :rtype: list of string
+        """
+        errors = []
+        for ind in range(self.error_queue_size):
+            error = self.get_error()
+            if int(error.split(',')[0]) == 0:
+                break
+            errors.append(error)
+        return errors
+
     def get_idn(self):
         # Query identification
         return self._instr.query("*IDN?")
+
+    def get_line_frequency(self):
+        # Power line frequency (Hz), setting the integration time of a PLC
+        try:
+            return float(self._instr.query("SYST:LFR?"))
+        except (visa.errors.VisaIOError, ValueError) as err:
+            logger.warning("Line frequency unknown, 50 Hz assumed: {}".format(err))
+            return 50.
     
     def init_cont_off(self):
         # Disable continuous initiation
-        self._instr.write("INIT:CONT OFF")
+        self._instr.write_settings("INIT:CONT OFF")
         
     def init_cont_on(self):
         # Enable continuous initiation
-        self._instr.write("INIT:CONT ON")
+        self._instr.write_settings("INIT:CONT ON")
 
     def mode_temp_frtd(self, channel, transducer, frtd_type,):
         self._instr.write("TEMP:TRAN " + transducer + "," + channel)
@@ -312,12 +683,210 @@ class Keithley27XXVISADriver:
         self._instr.write("TEMP:TRAN " + transducer + "," + channel)
         self._instr.write("TEMP:THER:TYPE " + ther_type + "," + channel)
     
+    def query_binary_readings(self, command, n_readings):
+        """Send a query and read its answer as an IEEE-488.2 binary block of (READING, TIMESTAMP) pairs
+
+        :param command: SCPI query returning readings (FETCH?, TRAC:DATA?...)
+        :type command: string
+        :param n_readings: Number of readings expected in the answer
+        :type n_readings: int
+        :return: The measurement values and the timestamp of each measurement
+        :rtype: tuple of numpy arrays
+        """
+        # The 27XX sends an indefinite length block (#0), its size is deduced from the expected number of readings
+        block = self._instr.query_binary_values(command,
+                                                datatype=self.data_formats[self.data_format],
+                                                is_big_endian=False,
+                                                container=np.array,
+                                                data_points=2 * n_readings)
+        return block[::2].astype(float), block[1::2].astype(float)
+
+    def recall_setup(self, slot, digest, plan=()):
+        """Recall the setup saved in a memory slot of the instrument if it matches a channel plan
+
+        The digests of the saved setups are only known by the host: the slot may have been overwritten since (front
+        panel, other host). The recalled setup is then checked against the plan, see check_setup.
+
+        :param slot: Setup memory slot (0 to 4)
+        :type slot: int
+        :param digest: Digest of the channel plan (see plan_digest)
+        :type digest: string
+        :param plan: The (channel, mode, settings) of each configured channel, see channel_plan
+        :type plan: list of tuples
+        :return: True if the setup has been recalled
+        :rtype: bool
+        """
+        if self.setup_cache.get(self.get_idn(), slot) != digest:
+            return False
+        self._instr.write("*CLS")
+        self._instr.write("*RCL " + str(slot))
+        errors = self.get_errors()
+        if errors:
+            logger.warning("Setup {} could not be recalled: {}".format(slot, errors))
+            return False
+        if not self.check_setup(plan):
+            logger.warning("Setup {} does not match the channels configuration, it has been overwritten since it was "
+                           "saved".format(slot))
+            return False
+        return True
+
+    def check_setup(self, plan):
+        """Check that the channels are set in the mode given by a channel plan
+
+        :param plan: The (channel, mode, settings) of each configured channel, see channel_plan
+        :type plan: list of tuples
+        :rtype: bool
+        """
+        if not plan:
+            return True
+        channels = sorted(channel for channel, _, _ in plan)
+        reply = self._instr.query("FUNC? (@{})".format(channel_list(channels)))
+        functions = [function.strip().strip('"\'').upper() for function in reply.split(',')]
+        modes = {channel: mode for channel, mode, _ in plan}
+        return functions == [modes[channel] for channel in channels]
+
     def reset(self):
         # Clear measurement event register
         self._instr.write("*CLS")
         # One-shot measurement mode (Equivalent to INIT:COUNT OFF)
         self._instr.write("*RST")
 
+    def save_setup(self, slot, digest):
+        """Save the current setup in a memory slot of the instrument, as the setup of a channel plan
+
+        :param slot: Setup memory slot (0 to 4)
+        :type slot: int
+        :param digest: Digest of the channel plan (see plan_digest)
+        :type digest: string
+        """
+        self._instr.write("*SAV " + str(slot))
+        errors = self.get_errors()
+        if errors:
+            logger.warning("Setup could not be saved in slot {}: {}".format(slot, errors))
+            return
+        try:
+            self.setup_cache.set(self.get_idn(), slot, digest)
+        except OSError as err:
+            logger.warning("Setup cache could not be written: {}".format(err))
+
+    def scan_groups(self):
+        """Channels of the current mode, grouped by measurement mode
+
+        When reading the scan list, there is one group per mode having channels, otherwise a single group of the
+        current mode ('front' channel for the front panel).
+
+        :return: (mode, channels, indexes of the channels readings in a scan) for each group
+        :rtype: list of tuples
+        """
+        if not self.reading_scan_list:
+            return [(self.current_mode, list(self.scan_channels) or ['front'], list(range(self.samp_count)))]
+        return [(mode, list(channels), [self.scan_channels.index(channel) for channel in channels])
+                for mode, channels in self.modes_channels_dict.items() if channels]
+
+    def set_averaging(self, count):
+        """Average count conversions per reading of the scanned channels, in the instrument
+
+        The repeating filter of the channels is enabled with count conversions, so that each reading of a scan is
+        averaged by the firmware, overriding the filters of the configuration file. It is kept by set_mode, a count of
+        1 restoring the configured filters. The scan timeout is updated accordingly. Frequency channels have no filter.
+
+        :param count: Number of averaged conversions (1 to max_filter_count)
+        :type count: int
+        """
+        if not 1 <= count <= self.max_filter_count:
+            raise ValueError("Filter count {} out of range (1 to {})".format(count, self.max_filter_count))
+        if count == self.averaging:
+            return
+        self.averaging = count
+        if count > 1:
+            self.apply_averaging()
+        else:
+            self.restore_filters()
+        self.set_scan_timeout(None if self.scan_channels else self.current_mode)
+
+    def apply_averaging(self):
+        # Repeating filter of the channels of the current mode, see set_averaging
+        commands = []
+        for mode, channels, _ in self.scan_groups():
+            if mode not in self.filter_modes:
+                continue
+            target = ',(@{})'.format(channel_list(channels)) if self.scan_channels else ''
+            commands.extend(':{} {}{}'.format(header, parameter, target)
+                            for header, parameter in filter_settings(mode, 'REP', self.averaging))
+        for message in join_commands(commands, self.max_message_length):
+            self._instr.write(message)
+
+    def restore_filters(self):
+        # Filters of the configuration file (disabled if not configured), see set_averaging
+        if not self.scan_channels:
+            if self.current_mode in self.filter_modes:
+                self._instr.write(":{}:AVER:STAT OFF".format(self.current_mode))
+            return
+        plan = []
+        for channel, (mode, settings) in self.channel_settings.items():
+            if mode in self.filter_modes:
+                plan.append((channel, mode, [setting for setting in settings if ':AVER:' in setting[0]] or
+                             [(mode + ':AVER:STAT', 'OFF')]))
+        commands = [":{} {},(@{})".format(header, parameter, channel_list(channels))
+                    for (header, parameter), channels in group_settings(plan).items()]
+        for message in join_commands(commands, self.max_message_length):
+            self._instr.write(message)
+
+    def set_buffered_scan(self, n_scans, trigger_source='IMM'):
+        """Arm n_scans scans of the current scan list, stored in the instrument buffer
+
+        Scans are triggered immediately one after the other once initiated. With another trigger source, a single
+        trigger starts all the scans (the sample count wrapping around the scan list). Call set_mode to come back to a
+        single scan per trigger.
+
+        :param n_scans: Number of scans
+        :type n_scans: int
+        :param trigger_source: 'IMM', or the source of the trigger starting the scans ('BUS' for *TRG, 'EXT' for the
+         trigger link input)
+        :type trigger_source: string
+        """
+        n_readings = n_scans * self.samp_count
+        if n_readings > self.buffer_size:
+            raise ValueError("{} readings requested while the Keithley buffer can only store {}".format(
+                n_readings, self.buffer_size))
+        self.init_cont_off()
+        self.clear_buffer()
+        self._instr.write("TRIG:SOUR " + trigger_source)
+        if trigger_source == 'IMM':
+            self._instr.write("TRIG:COUN " + str(n_scans))
+        else:
+            self._instr.write("TRIG:COUN 1")
+            self._instr.write("SAMP:COUN " + str(n_readings))
+        self._instr.write("TRAC:POIN " + str(n_readings))
+        self._instr.write("TRAC:FEED SENS")
+        self._instr.write("TRAC:FEED:CONT NEXT")
+
+    def set_data_format(self, data_format='ASCII'):
+        """Select the format used by the instrument to send readings
+
+        Binary formats only transfer the reading and timestamp elements, without units, as little-endian
+        IEEE754 floats (SREAL: single precision, DREAL: double precision).
+
+        :param data_format: Supported formats: 'ASCII', 'SREAL' and 'DREAL'
+        :type data_format: string
+        """
+        data_format = data_format.upper()
+        if data_format not in self.data_formats:
+            raise ValueError("Data format {} not supported, should be in {}".format(data_format,
+                                                                                   list(self.data_formats)))
+        if data_format == 'ASCII':
+            self._instr.write("FORM:DATA ASC")
+            # Default elements: reading, timestamp and reading number
+            self._instr.write("FORM:ELEM READ,TST,RNUM")
+        else:
+            self._instr.write("FORM:DATA " + data_format)
+            self._instr.write("FORM:BORD SWAP")
+            self._instr.write("FORM:ELEM READ,TST")
+        self.data_format = data_format
+        if self.scan_duration:
+            # The transfer duration depends on the format
+            self.apply_scan_timeout()
+
     def set_mode(self, mode):
         """Define whether the Keithley will scan all the scan_list or only channels in the selected mode
 
@@ -325,56 +894,60 @@ class Keithley27XXVISADriver:
         :type mode: string
         """
         mode = mode.upper()
-        
+        self.mode = mode
+
         # FRONT panel
-        if "SCAN" not in mode:
+        if not mode.startswith('SCAN_'):
+            # One reading per trigger, the trigger model being possibly left by a buffered scan (set_buffered_scan)
+            self._instr.write_settings("TRIG:SOUR IMM", "TRIG:COUN 1", "SAMP:COUN 1")
             self.init_cont_on()
             self.sample_count_1 = True
+            self.samp_count = 1
             self.reading_scan_list = False
-            self._instr.write("FUNC '" + mode + "'")
+            self.scan_channels = []
+            self.current_mode = mode
+            self._instr.write_settings("FUNC '" + mode + "'")
+            if self.averaging > 1:
+                self.apply_averaging()
+            self.set_scan_timeout(mode)
+            if self.monitoring:
+                self.set_monitoring()
 
         # REAR panel
         else:
             self.clear_buffer()
             # Init continuous disabled
             self.init_cont_off()
+            if self.monitoring:
+                # Stop the free running scans (infinite trigger count)
+                self._instr.write("ABOR")
             mode = mode[5:]
             self.current_mode = mode
             if 'SCAN_LIST' in mode:
                 self.reading_scan_list = True
                 self.sample_count_1 = False
                 channels = '(@' + self.channels_scan_list + ')'
-                # Set to perform 1 to INF scan(s)
-                self._instr.write("TRIG:COUN 1")
-                # Trigger immediately after previous scan end if IMM
-                self._instr.write("TRIG:SOUR BUS")
-                # Set to scan <n> channels
+                self.scan_channels = [int(channel) for channel in self.channels_scan_list.split(',') if channel]
                 samp_count = 1 + channels.count(',')
-                self._instr.write("SAMP:COUN "+str(samp_count))
-                # Disable scan if currently enabled
-                self._instr.write("ROUT:SCAN:LSEL NONE")
-                # Set scan list channels
-                self._instr.write("ROUT:SCAN " + channels)
-                # Start scan immediately when enabled and triggered
-                self._instr.write("ROUT:SCAN:TSO IMM")
-                # Enable scan
-                self._instr.write("ROUT:SCAN:LSEL INT")
+                self.samp_count = samp_count
+                # Set to perform 1 to INF scan(s), trigger immediately after previous scan end if IMM, set to scan
+                # <n> channels
+                self._instr.write_settings("TRIG:COUN 1", "TRIG:SOUR BUS", "SAMP:COUN " + str(samp_count))
+                self.set_scan(channels)
 
             else:
                 self.reading_scan_list = False
                 # Select channels in the channels list (config file) matching the requested mode
                 channels = '(@' + str(self.modes_channels_dict[mode])[1:-1] + ')'
-                # Set to perform 1 to INF scan(s)
-                self._instr.write("TRIG:COUN 1")
-                # Set to scan <n> channels
+                self.scan_channels = list(self.modes_channels_dict[mode])
                 samp_count = 1+channels.count(',')
-                self._instr.write("SAMP:COUN "+str(samp_count))
+                self.samp_count = samp_count
+                # Set to perform 1 to INF scan(s), set to scan <n> channels
+                self._instr.write_settings("TRIG:COUN 1", "SAMP:COUN " + str(samp_count))
                 if samp_count == 1:
                     self.init_cont_on()
-                    # Trigger definition
-                    self._instr.write("TRIG:SOUR IMM")
-                    # Disable scan if currently enabled
-                    self._instr.write("ROUT:SCAN:LSEL NONE")
+                    # Trigger definition, disable scan if currently enabled
+                    self._instr.write_settings("TRIG:SOUR IMM", "ROUT:SCAN:LSEL NONE")
                     self._instr.write("ROUT:CLOS " + channels)
                     
                     self._instr.write("FUNC '" + mode + "'")
@@ -385,22 +958,140 @@ class Keithley27XXVISADriver:
                 else:
                     self.sample_count_1 = False
                     # Trigger definition
-                    self._instr.write("TRIG:SOUR BUS")
-                    # Disable scan if currently enabled
-                    self._instr.write("ROUT:SCAN:LSEL NONE")
-                    # Set scan list channels
-                    self._instr.write("ROUT:SCAN " + channels)
-                    # Start scan immediately when enabled and triggered
-                    self._instr.write("ROUT:SCAN:TSO IMM")
-                    # Enable scan
-                    self._instr.write("ROUT:SCAN:LSEL INT")
+                    self._instr.write_settings("TRIG:SOUR BUS")
+                    self.set_scan(channels)
+            if self.averaging > 1:
+                self.apply_averaging()
+            self.set_scan_timeout()
+            if self.monitoring:
+                self.set_monitoring()
                 
             return channels
         
+    def set_monitoring(self, enabled=True):
+        """Let the instrument scan continuously, its latest readings being read by data without triggering
+
+        The scans are initiated continuously (INIT:CONT ON) and triggered immediately, so that a grab is a single
+        short query whatever the integration time. Readings are skipped between two grabs: use the triggered mode (or
+        data_buffered) to get every scan. The mode is kept by set_mode.
+
+        :param enabled: True for the monitoring mode, False to come back to one scan per bus trigger
+        :type enabled: bool
+        """
+        self.monitoring = enabled
+        if enabled:
+            self._instr.write_settings("TRIG:SOUR IMM", "TRIG:COUN INF")
+            self.init_cont_on()
+        elif self.sample_count_1:
+            # Single readings are free running anyway
+            self._instr.write_settings("TRIG:COUN 1")
+        else:
+            self.init_cont_off()
+            self._instr.write("ABOR")
+            self._instr.write_settings("TRIG:COUN 1", "TRIG:SOUR BUS")
+
+    def set_scan(self, channels):
+        """Select and enable the scan of a channel list, unless already done
+
+        :param channels: Channel list, such as (@101,102)
+        :type channels: string
+        """
+        if not self._instr.shadow.changed("ROUT:SCAN " + channels, "ROUT:SCAN:TSO IMM", "ROUT:SCAN:LSEL INT"):
+            return
+        # Disable scan if currently enabled
+        self._instr.write("ROUT:SCAN:LSEL NONE")
+        # Set scan list channels
+        self._instr.write("ROUT:SCAN " + channels)
+        # Start scan immediately when enabled and triggered
+        self._instr.write("ROUT:SCAN:TSO IMM")
+        # Enable scan
+        self._instr.write("ROUT:SCAN:LSEL INT")
+
+    def set_scan_timeout(self, front_mode=None):
+        """Estimate the duration of a scan of the current mode and set the session timeout from it
+
+        The timeout is TIMEOUT_FACTOR times the expected duration of the scan and of the transfer of its readings, plus
+        TIMEOUT_MARGIN. Channels missing from the configuration are assumed to be read with the default settings.
+
+        :param front_mode: Measurement mode of the front panel, None for the rear panel channels
+        :type front_mode: string
+        """
+        def settings(mode, channel_settings):
+            if self.averaging > 1 and mode in self.filter_modes:
+                return channel_settings + filter_settings(mode, 'REP', self.averaging)
+            return channel_settings
+
+        if front_mode is not None:
+            self.scan_duration = reading_duration(front_mode, settings(front_mode, []), self.line_frequency,
+                                                  scanned=False)
+        else:
+            self.scan_duration = 0.
+            for channel in self.scan_channels:
+                mode, channel_settings = self.channel_settings.get(channel, (self.current_mode, []))
+                self.scan_duration += reading_duration(mode, settings(mode, channel_settings), self.line_frequency)
+        self.apply_scan_timeout()
+
+    def transfer_duration(self, n_readings):
+        # Expected duration (s) of the transfer of n_readings readings in the current data format (about one byte per
+        # 10 bauds on serial links)
+        throughput = getattr(self._instr, 'baud_rate', 10 * BUS_THROUGHPUT) / 10 if 'ASRL' in self.rsrc_name \
+            else BUS_THROUGHPUT
+        return n_readings * READING_BYTES.get(self.data_format, READING_BYTES['ASCII']) / throughput
+
+    def apply_scan_timeout(self):
+        # Session timeout covering the expected scan duration and the transfer of its readings
+        transfer = self.transfer_duration(self.samp_count)
+        self._instr.timeout = int(1000 * (TIMEOUT_FACTOR * (self.scan_duration + transfer) + TIMEOUT_MARGIN))
+        logger.info("Expected scan duration: {:.3f} s, timeout: {} ms".format(self.scan_duration,
+                                                                               self._instr.timeout))
+
     def stop_acquisition(self):
         # If scan in process, stop it
         self._instr.write("ROUT:SCAN:LSEL NONE")
 
+    def wait_scan(self, poll_interval=None):
+        """Wait for the end of the triggered scan
+
+        By default, the completion is detected by *OPC?, answered by the instrument as soon as the scan is over. With a
+        poll_interval (s), the Operation Complete bit set by *OPC is polled through the status byte (*STB?) instead,
+        leaving the bus free between the polls. The wait is bounded by the session timeout (see set_scan_timeout): a
+        stalled scan is aborted and raises a TimeoutError, without waiting in a long FETCH?.
+
+        :param poll_interval: Time between two polls of the status byte, None to wait with *OPC?
+        :type poll_interval: float
+        :raises TimeoutError: if the scan is not over within the timeout
+        """
+        try:
+            if poll_interval is None:
+                self._instr.query("*OPC?")
+                return
+            # Operation Complete summarized in the Event Summary bit (32) of the status byte
+            self._instr.write_settings("*ESE 1")
+            self._instr.write("*OPC")
+            end = time.perf_counter() + self._instr.timeout / 1000
+            while not int(self._instr.query("*STB?")) & 32:
+                if time.perf_counter() > end:
+                    raise visa.errors.VisaIOError(StatusCode.error_timeout)
+                time.sleep(poll_interval)
+            # Clear the event register
+            self._instr.query("*ESR?")
+        except visa.errors.VisaIOError as err:
+            if err.error_code != StatusCode.error_timeout:
+                raise
+            self.abort_scan()
+            raise TimeoutError("Scan not over within {} ms, expected duration {:.3f} s".format(
+                self._instr.timeout, self.scan_duration)) from err
+
+    def abort_scan(self):
+        """Abort a stalled scan and discard the replies it could still produce"""
+        try:
+            self._instr.clear()
+        except (visa.errors.Error, NotImplementedError) as err:
+            logger.warning("Device clear failed: {}".format(err))
+        self._instr.write("ABOR")
+        logger.error("Scan aborted after {} ms, expected duration {:.3f} s".format(self._instr.timeout,
+                                                                                 self.scan_duration))
+
     def user_command(self):
         command = input('Enter here a command you want to send directly to the Keithley [if None, press enter]: ')
         if command != '':
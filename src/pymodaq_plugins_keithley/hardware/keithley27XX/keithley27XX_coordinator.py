@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from pymodaq_plugins_keithley import config
+from pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_VISADriver import Keithley27XXVISADriver
+from pymodaq.utils.logger import set_logger, get_module_name
+logger = set_logger(get_module_name(__file__))
+
+
+class Keithley27XXCoordinator:
+    """Concurrent scans on several Keithley 27XX instruments
+
+    Each instrument is driven by its own Keithley27XXVISADriver, already connected and set in the mode to acquire. The
+    scans of all the instruments are triggered and fetched concurrently by a thread pool (the drivers block on their
+    own VISA sessions), so that a grab lasts as long as the slowest instrument instead of the sum of their scans.
+
+    :param drivers: Connected and configured drivers, one per instrument
+    :type drivers: list of Keithley27XXVISADriver
+    """
+    def __init__(self, drivers):
+        self.drivers = list(drivers)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.drivers)),
+                                            thread_name_prefix='Keithley27XXCoordinator')
+
+    @classmethod
+    def from_config(cls, pyvisa_backend='@py', mode='SCAN_LIST'):
+        """Connect and configure every rear panel instrument of the configuration file
+
+        The instruments are configured concurrently. Front panel instruments are skipped.
+
+        :param pyvisa_backend: pyvisa backend identifier, see Keithley27XXVISADriver.init_hardware
+        :type pyvisa_backend: string
+        :param mode: Scan mode of the instruments ('SCAN_LIST' or a measurement mode such as 'VOLT:DC')
+        :type mode: string
+        :rtype: Keithley27XXCoordinator
+        """
+        drivers = []
+        for instr, rsrc_name in Keithley27XXVISADriver.list_instruments.items():
+            if config["Keithley", "27XX", instr, "panel"].upper() != 'REAR':
+                logger.info("Instrument {} skipped: only rear panel instruments are coordinated".format(rsrc_name))
+                continue
+            drivers.append(Keithley27XXVISADriver(rsrc_name))
+        coordinator = cls(drivers)
+
+        def configure(driver):
+            driver.init_hardware(pyvisa_backend)
+            driver.configuration_sequence()
+            driver.set_mode('SCAN_' + mode)
+
+        coordinator.map(configure)
+        return coordinator
+
+    def map(self, function):
+        """Call function(driver) for each driver concurrently
+
+        :return: The results, in the order of the drivers
+        :rtype: list
+        :raises: The first exception raised by a call, once all the calls are over
+        """
+        futures = [self._executor.submit(function, driver) for driver in self.drivers]
+        return [future.result() for future in futures]
+
+    def data(self):
+        """Trigger and fetch a scan on every instrument concurrently
+
+        :return: The measurement values and the timestamps of each instrument, by resource name
+        :rtype: dict of tuples of numpy arrays
+        """
+        results = self.map(lambda driver: driver.data(return_answer=False)[1:])
+        return {driver.rsrc_name: result for driver, result in zip(self.drivers, results)}
+
+    def data_merged(self):
+        """Trigger and fetch a scan on every instrument concurrently and merge the readings
+
+        :return: The measurement values, the timestamps and the '<resource name>/<channel>' label of each reading, the
+         instruments in the order of the drivers
+        :rtype: tuple (numpy array, numpy array, list of string)
+        """
+        data = self.data()
+        labels = []
+        for driver in self.drivers:
+            channels = driver.scan_channels or ['front']
+            labels.extend('{}/{}'.format(driver.rsrc_name, channel) for channel in channels)
+        values = np.concatenate([data[driver.rsrc_name][0] for driver in self.drivers])
+        times = np.concatenate([data[driver.rsrc_name][1] for driver in self.drivers])
+        return values, times, labels
+
+    def close(self):
+        """Close all the instruments and stop the thread pool"""
+        try:
+            self.map(lambda driver: driver.close())
+        finally:
+            self._executor.shutdown()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming HDF5 logger of the Keithley 27XX scans
+
+Long unattended scans (thermal logging over days...) are appended to a chunked and compressed HDF5 file instead of
+going through the DataToExport/GUI path: the readings are kept in a bounded buffer of scans, appended to the file
+each time the buffer is full and the file is flushed periodically, so that the memory used does not grow with the
+duration of the acquisition. The file holds one group per measurement mode::
+
+    /VOLT_DC/values      extensible array (scans x channels), the readings
+    /VOLT_DC/timestamps  extensible array (scans x channels), the instrument timestamps (s)
+    /TEMP/...
+    /host_time           extensible array (scans), the computer time (s since epoch) at the end of each scan
+
+The channels of each group are stored in its 'channels' attribute. The logger can be run from the
+DAQ_0DViewer_Keithley27XX plugin, or headless with:
+
+    python -m pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_logger scans.h5 [--resource ASRL1::INSTR]
+    [--mode SCAN_LIST] [--duration 86400]
+"""
+import argparse
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import tables
+
+from pymodaq.utils.config import get_set_local_dir
+from pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_VISADriver import Keithley27XXVISADriver
+from pymodaq_plugins_keithley.utils import RingBuffer
+from pymodaq.utils.logger import set_logger, get_module_name
+logger = set_logger(get_module_name(__file__))
+
+
+def default_path():
+    """Timestamped file path in the local PyMoDAQ configuration folder"""
+    return get_set_local_dir().joinpath('keithley27XX_{}.h5'.format(datetime.now().strftime('%Y%m%d_%H%M%S')))
+
+
+class ScanFile:
+    """HDF5 file where the scans are appended, through a bounded buffer
+
+    :param path: Path of the file, created or appended to
+    :type path: str or Path
+    :param layout: Groups of channels, see Keithley27XXVISADriver.scan_groups
+    :type layout: list of tuples
+    :param buffer_scans: Number of scans buffered before being written, also the chunk length of the arrays
+    :type buffer_scans: int
+    :param flush_interval: Maximum time (s) between two flushes of the file
+    :type flush_interval: float
+    :param complevel: zlib compression level (0 to 9)
+    :type complevel: int
+    """
+    def __init__(self, path, layout, buffer_scans=100, flush_interval=10., complevel=5, title=''):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.scans = 0
+        width = sum(len(indexes) for _, _, indexes in layout)
+        self._values = np.zeros((buffer_scans, width))
+        self._times = np.zeros((buffer_scans, width))
+        self._host_times = np.zeros(buffer_scans)
+        self._count = 0
+        self._last_flush = time.perf_counter()
+
+        self._file = tables.open_file(str(path), mode='a', title=title)
+        filters = tables.Filters(complevel=complevel, complib='zlib', shuffle=True)
+        self._groups = []
+        start = 0
+        for mode, channels, indexes in layout:
+            name = mode.replace(':', '_') or 'FRONT'
+            if name in self._file.root:
+                group = self._file.get_node(self._file.root, name)
+                if list(group._v_attrs.channels) != [str(channel) for channel in channels]:
+                    self._file.close()
+                    raise ValueError('The channels of the group {} of {} do not match the scanned ones'.format(
+                        name, path))
+            else:
+                group = self._file.create_group(self._file.root, name)
+                group._v_attrs.mode = mode
+                group._v_attrs.channels = [str(channel) for channel in channels]
+                for array in ('values', 'timestamps'):
+                    self._file.create_earray(group, array, tables.Float64Atom(), shape=(0, len(channels)),
+                                             filters=filters, chunkshape=(buffer_scans, len(channels)))
+            columns = slice(start, start + len(indexes))
+            self._groups.append((group.values, group.timestamps, np.array(indexes), columns))
+            start += len(indexes)
+        if 'host_time' not in self._file.root:
+            self._file.create_earray(self._file.root, 'host_time', tables.Float64Atom(), shape=(0,),
+                                     filters=filters, chunkshape=(buffer_scans,))
+
+    def append(self, values, times):
+        """Append the readings and the timestamps of a scan
+
+        :param values: Readings of the scan, in the order of the scanned channels
+        :type values: numpy array
+        :param times: Timestamps of the readings
+        :type times: numpy array
+        """
+        for _, _, indexes, columns in self._groups:
+            self._values[self._count, columns] = values[indexes]
+            self._times[self._count, columns] = times[indexes]
+        self._host_times[self._count] = time.time()
+        self._count += 1
+        self.scans += 1
+        if self._count == len(self._host_times):
+            self.write()
+        if time.perf_counter() - self._last_flush > self.flush_interval:
+            self.flush()
+
+    def write(self):
+        """Append the buffered scans to the arrays of the file"""
+        if self._count:
+            for values, timestamps, _, columns in self._groups:
+                values.append(self._values[:self._count, columns])
+                timestamps.append(self._times[:self._count, columns])
+            self._file.root.host_time.append(self._host_times[:self._count])
+            self._count = 0
+
+    def flush(self):
+        """Write the buffered scans and flush the file to the disk"""
+        self.write()
+        self._file.flush()
+        self._last_flush = time.perf_counter()
+
+    def close(self):
+        if self._file.isopen:
+            try:
+                self.flush()
+            finally:
+                self._file.close()
+
+
+class Keithley27XXHDF5Logger(threading.Thread):
+    """Background acquisition of scans streamed to an HDF5 file, see ScanFile
+
+    As the Keithley27XXScanWorker, the logger owns the communication with the instrument while running: no other
+    command should be sent to the driver until it is stopped. Only the most recent scan is kept in memory, for display.
+
+    :param controller: Keithley27XXVISADriver instance, already configured in the mode to acquire
+    :type controller: object
+    :param path: Path of the HDF5 file, created or appended to
+    :type path: str or Path
+    :param buffer_scans: Number of scans buffered before being written to the file
+    :type buffer_scans: int
+    :param flush_interval: Maximum time (s) between two flushes of the file
+    :type flush_interval: float
+    :param complevel: zlib compression level (0 to 9)
+    :type complevel: int
+    """
+    def __init__(self, controller, path, buffer_scans=100, flush_interval=10., complevel=5):
+        super().__init__(name='Keithley27XXHDF5Logger', daemon=True)
+        self.controller = controller
+        # Opened here so that an invalid path is reported to the caller
+        self.file = ScanFile(path, controller.scan_groups(), buffer_scans, flush_interval, complevel,
+                             title=controller.rsrc_name)
+        self.buffer = RingBuffer(1, controller.samp_count)
+        self.error = None
+        self._stop_event = threading.Event()
+
+    @property
+    def scans(self):
+        # Number of scans logged (buffered or written)
+        return self.file.scans
+
+    @property
+    def stopping(self):
+        # Stop requested, the current scan may still be running
+        return self._stop_event.is_set()
+
+    def run(self):
+        logger.info("Logging of the scans to {} started".format(self.file.path))
+        try:
+            while not self._stop_event.is_set():
+                _, values, times = self.controller.data(return_answer=False)
+                self.file.append(values, times)
+                self.buffer.push(values)
+        except Exception as err:
+            self.error = err
+            logger.error("Logging of the scans interrupted: {}".format(err))
+        finally:
+            self.file.close()
+        logger.info("Logging of the scans stopped after {} scans".format(self.scans))
+
+    def stop(self, timeout=None):
+        """Ask the logger to stop, wait for the scan in progress to end and the file to be closed
+
+        :param timeout: Maximum waiting time (s), None to wait until the logger is stopped
+        :type timeout: float
+        :return: True if the logger is stopped
+        :rtype: bool
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        elif self.ident is None:
+            # Never started
+            self.file.close()
+        return not self.is_alive()
+
+
+def main():
+    resources = list(Keithley27XXVISADriver.list_instruments.values())
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('path', nargs='?', help='Path of the HDF5 file (timestamped file of the local PyMoDAQ folder '
+                                                'by default)')
+    parser.add_argument('--resource', default=resources[0] if resources else None, choices=resources,
+                        help='VISA resource of the instrument, as in the configuration file')
+    parser.add_argument('--mode', default='SCAN_LIST', help="Scan mode: 'SCAN_LIST' or a measurement mode such as "
+                                                             "'VOLT:DC' (rear panel) or 'FRONT:VOLT:DC' (front panel)")
+    parser.add_argument('--data-format', default='SREAL', choices=list(Keithley27XXVISADriver.data_formats))
+    parser.add_argument('--duration', type=float, help='Duration (s) of the logging, until interrupted by default')
+    parser.add_argument('--buffer', type=int, default=100, help='Number of scans buffered before being written')
+    parser.add_argument('--flush-interval', type=float, default=10., help='Maximum time (s) between two flushes')
+    parser.add_argument('--backend', default='@py', help='pyvisa backend')
+    args = parser.parse_args()
+
+    controller = Keithley27XXVISADriver(args.resource)
+    controller.init_hardware(args.backend)
+    controller.set_data_format(args.data_format)
+    mode = args.mode.upper()
+    if mode.startswith('FRONT:'):
+        controller.current_mode = mode[6:]
+        controller.set_mode(mode[6:])
+    else:
+        controller.configuration_sequence()
+        controller.set_mode('SCAN_' + mode)
+    path = args.path or default_path()
+    hdf5_logger = Keithley27XXHDF5Logger(controller, path, args.buffer, args.flush_interval)
+    hdf5_logger.start()
+    start = time.perf_counter()
+    try:
+        while hdf5_logger.is_alive() and (args.duration is None or time.perf_counter() - start < args.duration):
+            hdf5_logger.join(1.)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        hdf5_logger.stop()
+        controller.close()
+    print('{} scans logged to {}'.format(hdf5_logger.scans, path))
+
+
+if __name__ == '__main__':
+    main()
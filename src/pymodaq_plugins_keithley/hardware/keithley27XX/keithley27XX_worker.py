@@ -0,0 +1,58 @@
+import threading
+from pymodaq_plugins_keithley.utils import RingBuffer
+from pymodaq.utils.logger import set_logger, get_module_name
+logger = set_logger(get_module_name(__file__))
+
+
+class Keithley27XXScanWorker(threading.Thread):
+    """Background producer triggering and fetching scans into a ring buffer
+
+    The worker owns the communication with the instrument while running: no other command should be sent to the
+    driver until it is stopped.
+
+    :param controller: Keithley27XXVISADriver instance, already configured in the mode to acquire
+    :type controller: object
+    :param buffer_length: Maximum number of scans kept in the ring buffer
+    :type buffer_length: int
+    """
+    def __init__(self, controller, buffer_length=100):
+        super().__init__(name='Keithley27XXScanWorker', daemon=True)
+        self.controller = controller
+        self.buffer = RingBuffer(buffer_length, controller.samp_count)
+        self.error = None
+        self._stop_event = threading.Event()
+
+    @property
+    def overruns(self):
+        # Number of scans lost because the buffer was not drained fast enough
+        return self.buffer.overruns
+
+    @property
+    def stopping(self):
+        # Stop requested, the current scan may still be running
+        return self._stop_event.is_set()
+
+    def run(self):
+        logger.info("Continuous acquisition started")
+        while not self._stop_event.is_set():
+            try:
+                _, values, _ = self.controller.data(return_answer=False)
+            except Exception as err:
+                self.error = err
+                logger.error("Continuous acquisition interrupted: {}".format(err))
+                break
+            self.buffer.push(values)
+        logger.info("Continuous acquisition stopped")
+
+    def stop(self, timeout=None):
+        """Ask the worker to stop and wait for the scan in progress to end
+
+        :param timeout: Maximum waiting time (s), None to wait until the worker is stopped
+        :type timeout: float
+        :return: True if the worker is stopped
+        :rtype: bool
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        return not self.is_alive()
@@ -0,0 +1,4 @@
+from .scpi_simulator import SimulatedInstrument, SimulatedSession
+from .keithley_models import (SimulatedDMM, SimulatedKeithley27XX, SimulatedKeithley2100, SimulatedKeithley2110,
+                              SimulatedKeithley2400, SimulatedKeithleyPico)
+from .resource_manager import SimulatedResourceManager
@@ -0,0 +1,1023 @@
+import copy
+import math
+import random
+import struct
+import weakref
+
+import numpy as np
+
+from .scpi_simulator import SimulatedInstrument, parse_channels, scpi, short_form
+
+# Measurement functions: (ASCII unit, typical reading, relative noise)
+FUNCTIONS = {'VOLT:DC': ('VDC', 1., 1e-5),
+             'VOLT:AC': ('VAC', .5, 1e-4),
+             'CURR:DC': ('ADC', 1e-3, 1e-5),
+             'CURR:AC': ('AAC', 1e-3, 1e-4),
+             'RES': ('OHM', 1e3, 1e-5),
+             'FRES': ('OHM4W', 1e3, 1e-6),
+             'FREQ': ('HZ', 1e3, 1e-6),
+             'PER': ('SEC', 1e-3, 1e-6),
+             'TEMP': ('C', 23., 1e-3),
+             'CONT': ('OHM', 1., 1e-3),
+             'CHAR': ('C', 1e-9, 1e-4)}
+
+# Settling time (s) of an AC measurement for each detector bandwidth (Hz)
+AC_SETTLING = {3.: 2.5, 30.: .25, 300.: .025}
+
+# Allowed values of the character data settings of the functions
+SETTING_VALUES = {'TRAN': {'TC', 'THER', 'FRTD'},
+                  'TC:TYPE': set('JKNTERSB'),
+                  'RJUN:RSEL': {'INT', 'EXT', 'SIM'},
+                  'THER:TYPE': {'2252', '5000', '10000'},
+                  'FRTD:TYPE': {'PT100', 'D100', 'F100', 'PT385', 'PT3916', 'USER'},
+                  'AVER:TCON': {'REP', 'MOV'}}
+
+# Allowed range of the numeric settings of the functions
+SETTING_LIMITS = {'NPLC': (.01, 60.),
+                  'DIG': (4, 7),
+                  'AVER:COUN': (1, 100),
+                  'DET:BAND': (3., 300.)}
+
+# Channels (including the current channels) of the 7700 series switching modules
+CARD_CHANNELS = {'7700': 22, '7701': 32, '7702': 42, '7703': 32, '7706': 20, '7707': 10, '7708': 40, '7709': 48,
+                 '7710': 20}
+
+# Relay settling time (s) when a scan switches to a channel
+RELAY_SETTLING = .003
+
+
+def parse_function(name):
+    """Normalize a function name ('VOLTage:DC', "'VOLT'", 'CURR'...) to its key in FUNCTIONS"""
+    nodes = [short_form(node) for node in name.strip('\'" ').split(':') if node]
+    if nodes[0] in ('VOLT', 'CURR') and (len(nodes) == 1 or nodes[1] not in ('DC', 'AC')):
+        nodes.insert(1, 'DC')
+    function = ':'.join(nodes[:2]) if nodes[0] in ('VOLT', 'CURR') else nodes[0]
+    if function not in FUNCTIONS:
+        raise KeyError(function)
+    return function
+
+
+def parse_number(arg, limits=None, default=None):
+    """Convert a numeric parameter (number or MIN/MAX/DEF), raise ValueError if it is not a number"""
+    arg = short_form(arg) if arg.isalpha() else arg
+    if limits is not None and arg in ('MIN', 'MAX'):
+        return limits[0] if arg == 'MIN' else limits[1]
+    if arg == 'DEF' and default is not None:
+        return default
+    if arg in ('INF', 'INFINITY'):
+        return math.inf
+    return float(arg)
+
+
+def parse_bool(arg):
+    arg = arg.strip().upper()
+    if arg in ('1', 'ON'):
+        return True
+    if arg in ('0', 'OFF'):
+        return False
+    raise ValueError(arg)
+
+
+class ScanRun:
+    """Timing of the readings triggered after an initiation
+
+    A run is made of n_scans scans (None for a free running instrument) of the readings planned for one trigger. Scans
+    start immediately one after the other, or on each trigger for bus or external trigger sources.
+    """
+    def __init__(self, plan, durations, n_scans, immediate, start):
+        self.plan = plan
+        self.cum_durations = np.cumsum(durations)
+        self.scan_time = float(self.cum_durations[-1])
+        self.readings_per_scan = len(plan)
+        self.n_scans = n_scans
+        self.immediate = immediate
+        self.start = start
+        self.scan_starts = []
+        self.emitted = 0
+        self.readings = []
+
+    @property
+    def n_readings(self):
+        return None if self.n_scans is None else self.n_scans * self.readings_per_scan
+
+    def trigger(self, t):
+        """Start a new scan at t (or at the end of the previous one), return False if the trigger is ignored"""
+        if self.immediate or (self.n_scans is not None and len(self.scan_starts) >= self.n_scans):
+            return False
+        last_end = self.scan_starts[-1] + self.scan_time if self.scan_starts else t
+        self.scan_starts.append(max(t, last_end))
+        return True
+
+    def scan_start(self, scan):
+        if self.immediate:
+            return self.start + scan * self.scan_time
+        return self.scan_starts[scan] if scan < len(self.scan_starts) else math.inf
+
+    def completion_time(self, index):
+        scan, position = divmod(index, self.readings_per_scan)
+        return self.scan_start(scan) + self.cum_durations[position]
+
+    def done_count(self, t):
+        """Number of readings completed at time t"""
+        if self.immediate:
+            scans, elapsed = divmod(max(t - self.start, 0.), self.scan_time)
+            scans = int(scans)
+        else:
+            scans = 0
+            while scans < len(self.scan_starts) and self.scan_starts[scans] + self.scan_time <= t:
+                scans += 1
+            elapsed = t - self.scan_start(scans)
+        count = scans * self.readings_per_scan + int(np.searchsorted(self.cum_durations, elapsed, side='right'))
+        return count if self.n_readings is None else min(count, self.n_readings)
+
+    def end_time(self):
+        if self.n_readings is None:
+            return math.inf
+        return self.completion_time(self.n_readings - 1)
+
+
+class TriggerLink:
+    """Trigger link cable connecting all the simulated instruments of the process
+
+    An instrument waiting for an external trigger (TRIG:SOUR EXT or TLIN, ARM:SOUR TLIN for the picoammeters) is
+    triggered by the pulses of the others. A single line is modelled, and an instrument only outputs one pulse per
+    accepted trigger: at the end of the first reading of the scan (voltmeter complete) or, for the picoammeters with
+    ARM:OUTP TRIG, when leaving the arm layer.
+    """
+    def __init__(self):
+        self.instruments = weakref.WeakSet()
+
+    def connect(self, instrument):
+        self.instruments.add(instrument)
+
+    def pulse(self, source, t):
+        """Pulse output by the source instrument at its time t"""
+        if source.realtime:
+            t = t + source._t0
+        for instrument in list(self.instruments):
+            if instrument is not source:
+                instrument.link_trigger(t - instrument._t0 if instrument.realtime else max(t, instrument.now()))
+
+
+TRIGGER_LINK = TriggerLink()
+
+
+class SimulatedDMM(SimulatedInstrument):
+    """Digital multimeter measurement and trigger model
+
+    Readings take the integration time set by NPLC (times the filter count when the repeating filter is enabled),
+    plus the settling time of AC measurements. The trigger model supports immediate, bus and external (see TriggerLink)
+    trigger sources, sample and trigger counts and continuous initiation. The optional trace buffer is enabled with a
+    non zero buffer_capacity.
+    """
+    functions = ['VOLT:DC', 'VOLT:AC', 'CURR:DC', 'CURR:AC', 'RES', 'FRES', 'FREQ', 'PER', 'TEMP', 'CONT']
+    default_function = 'VOLT:DC'
+    default_nplc = 1.
+    # Fixed time (s) spent by the firmware for each reading
+    reading_overhead = .0005
+    buffer_capacity = 0
+    # Readings kept from the past when catching up with a free running instrument
+    max_backlog = 1000
+    setup_attributes = ['function', 'function_settings', 'trigger_source', 'trigger_count', 'sample_count',
+                        'format_data', 'elements', 'byte_order']
+
+    def reset(self):
+        super().reset()
+        self.function = self.default_function
+        self.function_settings = {function: {'NPLC': self.default_nplc, 'AVER:STAT': False, 'AVER:COUN': 10,
+                                             'AVER:TCON': 'REP', 'DET:BAND': 30.}
+                                  for function in self.functions}
+        self.trigger_source = 'IMM'
+        self.trigger_count = 1
+        self.sample_count = 1
+        self.init_continuous = False
+        self.run = None
+        self.latest = None
+        self.reading_number = 0
+        self.timestamp_zero = self.now()
+        self.random = random.Random(self.seed)
+        self.format_data = 'ASC'
+        self.elements = ['READ']
+        self.byte_order = 'NORM'
+        self.buffer = []
+        self.buffer_points = min(100, self.buffer_capacity)
+        self.feed = 'SENS'
+        self.feed_control = 'NEV'
+        self.buffer_auto_clear = True
+        self.opc_time = None
+        TRIGGER_LINK.connect(self)
+
+    # Setups
+    def save_setup(self):
+        setup = super().save_setup()
+        setup.update({name: copy.deepcopy(getattr(self, name)) for name in self.setup_attributes})
+        return setup
+
+    def recall_setup(self, setup):
+        setup = dict(setup)
+        for name in self.setup_attributes:
+            setattr(self, name, copy.deepcopy(setup.pop(name)))
+        super().recall_setup(setup)
+
+    # Function settings
+    def split_function(self, nodes):
+        """Split header nodes into the measurement function they address and the setting nodes"""
+        if nodes[0] in ('VOLT', 'CURR'):
+            if nodes[1:2] in (['DC'], ['AC']):
+                return nodes[0] + ':' + nodes[1], nodes[2:]
+            return nodes[0] + ':DC', nodes[1:]
+        if nodes[0] in FUNCTIONS:
+            return nodes[0], nodes[1:]
+        return None, nodes
+
+    def dispatch(self, header, args, is_query):
+        function, setting = self.split_function(header.split(':'))
+        if function in self.function_settings and setting:
+            return self.function_setting(function, ':'.join(setting), args, is_query)
+        return super().dispatch(header, args, is_query)
+
+    def function_setting(self, function, setting, args, is_query):
+        """Set or query one setting (NPLC, AVER:COUN...) of a measurement function"""
+        args, channels = self.split_channels(args)
+        settings = self.settings_of(function, channels[0] if channels else None)
+        if is_query:
+            value = settings.get(setting, '')
+            if isinstance(value, bool):
+                return str(int(value))
+            return '{:g}'.format(value) if isinstance(value, float) else str(value)
+        if setting in SETTING_LIMITS:
+            value = parse_number(args, SETTING_LIMITS[setting])
+            if not SETTING_LIMITS[setting][0] <= value <= SETTING_LIMITS[setting][1]:
+                self.push_error(-222, 'Parameter data out of range')
+                return None
+        elif setting in SETTING_VALUES:
+            value = args.strip('\'" ').upper()
+            if value not in SETTING_VALUES[setting]:
+                self.push_error(-224, 'Illegal parameter value')
+                return None
+        elif setting.endswith('STAT') or setting.endswith('AUTO'):
+            if not args:
+                self.push_error(-109, 'Missing parameter')
+                return None
+            value = parse_bool(args)
+        elif setting.startswith('RANG'):
+            value = parse_number(args)
+        else:
+            value = args
+        for channel in channels or [None]:
+            self.settings_of(function, channel, create=True)[setting] = value
+        self.reconfigure()
+        return None
+
+    def split_channels(self, args):
+        """Separate the parameter from the channel list of an argument (not supported by this model)"""
+        return args, []
+
+    def settings_of(self, function, channel=None, create=False):
+        return self.function_settings[function]
+
+    # Measurement model
+    def plan(self):
+        """Return the (channel, function) of each reading performed for one trigger"""
+        return [(None, self.function)] * self.sample_count
+
+    def reading_duration(self, channel, function):
+        settings = self.settings_of(function, channel)
+        duration = settings['NPLC'] / self.line_frequency + self.reading_overhead
+        if function.endswith(':AC'):
+            duration += AC_SETTLING.get(settings['DET:BAND'], .25)
+        if settings['AVER:STAT'] and settings['AVER:TCON'] == 'REP':
+            duration *= settings['AVER:COUN']
+        return duration
+
+    def reading_value(self, channel, function, t):
+        unit, typical, noise = FUNCTIONS[function]
+        offset = 1 + .01 * (channel % 100 if channel else 0)
+        settings = self.settings_of(function, channel)
+        if settings['AVER:STAT']:
+            noise /= math.sqrt(settings['AVER:COUN'])
+        if function == 'TEMP':
+            return typical + offset + .5 * math.sin(2 * math.pi * t / 600) + 23 * noise * self.random.gauss(0, 1)
+        return typical * offset * (1 + noise * self.random.gauss(0, 1))
+
+    def initiate(self):
+        plan = self.plan()
+        durations = [self.reading_duration(channel, function) for channel, function in plan]
+        n_scans = None if self.init_continuous or math.isinf(self.trigger_count) else int(self.trigger_count)
+        self.run = ScanRun(plan, durations, n_scans, self.trigger_source == 'IMM', self.now())
+        if self.feed_control != 'NEV' and self.buffer_auto_clear:
+            self.buffer = []
+
+    def reconfigure(self):
+        # A free running instrument restarts its measurements with the new configuration
+        if self.init_continuous:
+            self.initiate()
+
+    def update(self, count=None):
+        """Perform the readings of the current run up to count readings (the ones completed by now by default)"""
+        run = self.run
+        if run is None:
+            return
+        if count is None:
+            count = run.done_count(self.now())
+        if count <= run.emitted:
+            return
+        first = max(run.emitted, count - self.max_backlog) if run.n_scans is None else run.emitted
+        records = []
+        for index in range(first, count):
+            channel, function = run.plan[index % run.readings_per_scan]
+            t = run.completion_time(index)
+            self.reading_number += 1
+            records.append((self.reading_value(channel, function, t), t - self.timestamp_zero, self.reading_number,
+                            channel, function))
+        run.emitted = count
+        run.readings.extend(records)
+        if run.n_scans is None:
+            # Free running: only the last complete scan and the current one are kept
+            del run.readings[:-(run.readings_per_scan + count % run.readings_per_scan)]
+        self.latest = records[-1]
+        if self.buffer_capacity and self.feed != 'NONE' and self.feed_control != 'NEV':
+            room = self.buffer_points - len(self.buffer)
+            self.buffer.extend(records[:room] if self.feed_control == 'NEXT' else records)
+            if self.feed_control == 'ALW':
+                del self.buffer[:-self.buffer_points]
+            elif len(self.buffer) >= self.buffer_points:
+                self.feed_control = 'NEV'
+
+    def operation_end(self):
+        if self.run is None or self.run.n_scans is None:
+            return self.now()
+        return self.run.end_time()
+
+    def handle(self, message):
+        self.update()
+        return super().handle(message)
+
+    # Reply formatting
+    def format_ascii(self, record):
+        return '{:+.8E}'.format(record[0])
+
+    def element_values(self, record):
+        """Values of the selected elements of a reading, for the binary formats"""
+        return [record[0]]
+
+    def format_readings(self, records):
+        if self.format_data == 'ASC':
+            return ','.join(self.format_ascii(record) for record in records)
+        datatype = 'd' if self.format_data == 'DRE' else 'f'
+        values = [value for record in records for value in self.element_values(record)]
+        order = '<' if self.byte_order == 'SWAP' else '>'
+        return b'#0' + struct.pack(order + datatype * len(values), *values)
+
+    # Trigger model
+    @scpi('INIT')
+    def command_init(self, args):
+        if self.init_continuous:
+            self.push_error(-213, 'Init ignored')
+            return
+        self.initiate()
+
+    @scpi('INIT:CONT')
+    def command_init_continuous(self, args):
+        self.init_continuous = parse_bool(args)
+        if self.init_continuous:
+            self.initiate()
+        elif self.run is not None and self.run.n_scans is None:
+            self.run = None
+
+    @scpi('INIT:CONT?')
+    def query_init_continuous(self, args):
+        return str(int(self.init_continuous))
+
+    @scpi('ABOR')
+    def command_abort(self, args):
+        self.run = None
+        if self.init_continuous:
+            self.initiate()
+
+    @scpi('*TRG')
+    def command_trg(self, args):
+        if self.run is None or self.trigger_source != 'BUS' or not self.run.trigger(self.now()):
+            self.push_error(-211, 'Trigger ignored')
+            return
+        self.output_trigger()
+
+    def link_trigger(self, t):
+        """Trigger received from the trigger link at time t"""
+        if self.run is not None and self.trigger_source in ('EXT', 'TLIN') and self.run.trigger(t):
+            self.output_trigger()
+
+    def output_trigger(self):
+        # Voltmeter complete pulse, at the end of the first reading of the scan just triggered
+        TRIGGER_LINK.pulse(self, self.run.scan_starts[-1] + float(self.run.cum_durations[0]))
+
+    @scpi('TRIG:SOUR')
+    def command_trigger_source(self, args):
+        self.trigger_source = short_form(args)
+
+    @scpi('TRIG:SOUR?')
+    def query_trigger_source(self, args):
+        return self.trigger_source
+
+    @scpi('TRIG:COUN')
+    def command_trigger_count(self, args):
+        self.trigger_count = parse_number(args, (1, math.inf), 1)
+
+    @scpi('TRIG:COUN?')
+    def query_trigger_count(self, args):
+        return '{:g}'.format(self.trigger_count) if not math.isinf(self.trigger_count) else '9.9e37'
+
+    @scpi('SAMP:COUN')
+    def command_sample_count(self, args):
+        self.sample_count = int(parse_number(args, (1, 50000), 1))
+
+    @scpi('SAMP:COUN?')
+    def query_sample_count(self, args):
+        return str(self.sample_count)
+
+    @scpi('FUNC')
+    def command_function(self, args):
+        try:
+            self.function = parse_function(args)
+        except KeyError:
+            self.push_error(-224, 'Illegal parameter value')
+            return
+        self.reconfigure()
+
+    @scpi('FUNC?')
+    def query_function(self, args):
+        return '"{}"'.format(self.function)
+
+    # Readings
+    def readings_reply(self, records, ready_time):
+        self.delay_reply(ready_time)
+        return self.format_readings(records)
+
+    @scpi('FETC?')
+    def query_fetch(self, args):
+        run = self.run
+        if run is None:
+            self.push_error(-230, 'Data corrupt or stale')
+            return None
+        if run.n_scans is None:
+            # Free running: the readings of the last complete scan
+            ready_time = run.completion_time(run.readings_per_scan - 1) if run.emitted < run.readings_per_scan \
+                else self.now()
+            self.update(max(run.emitted, run.readings_per_scan))
+            end = len(run.readings) - run.emitted % run.readings_per_scan
+            return self.readings_reply(run.readings[end - run.readings_per_scan:end], ready_time)
+        if not run.immediate and len(run.scan_starts) < run.n_scans:
+            # Waiting for triggers that will never come
+            self.delay_reply(math.inf)
+            return ''
+        self.update(run.n_readings)
+        return self.readings_reply(run.readings, run.end_time())
+
+    @scpi('READ?')
+    def query_read(self, args):
+        if self.init_continuous:
+            self.push_error(-213, 'Init ignored')
+            return None
+        if self.trigger_source not in ('IMM', 'TIM'):
+            self.push_error(-214, 'Trigger deadlock')
+            return None
+        self.initiate()
+        return self.query_fetch(args)
+
+    @scpi('DATA?', 'DATA:LAT?', 'SENS:DATA?')
+    def query_latest(self, args):
+        if self.latest is None:
+            if self.run is None:
+                self.push_error(-230, 'Data corrupt or stale')
+                return None
+            if self.run.completion_time(0) == math.inf:
+                self.delay_reply(math.inf)
+                return ''
+            self.update(1)
+            return self.readings_reply([self.run.readings[0]], self.run.completion_time(0))
+        return self.format_readings([self.latest])
+
+    # Data format
+    @scpi('FORM:DATA', 'FORM')
+    def command_format_data(self, args):
+        data_format = short_form(args.split(',')[0])
+        if data_format not in ('ASC', 'SRE', 'DRE', 'REAL'):
+            self.push_error(-224, 'Illegal parameter value')
+            return
+        self.format_data = 'SRE' if data_format == 'REAL' else data_format
+
+    @scpi('FORM:DATA?')
+    def query_format_data(self, args):
+        return self.format_data
+
+    @scpi('FORM:ELEM')
+    def command_format_elements(self, args):
+        self.elements = [short_form(element.strip()) for element in args.split(',') if element.strip()]
+
+    @scpi('FORM:ELEM?')
+    def query_format_elements(self, args):
+        return ','.join(self.elements)
+
+    @scpi('FORM:BORD')
+    def command_byte_order(self, args):
+        self.byte_order = short_form(args)
+
+    # Trace buffer
+    def check_buffer(self):
+        if not self.buffer_capacity:
+            self.push_error(-113, 'Undefined header')
+        return bool(self.buffer_capacity)
+
+    @scpi('TRAC:CLE')
+    def command_trace_clear(self, args):
+        if self.check_buffer():
+            self.buffer = []
+
+    @scpi('TRAC:CLE:AUTO')
+    def command_trace_auto_clear(self, args):
+        if self.check_buffer():
+            self.buffer_auto_clear = parse_bool(args)
+
+    @scpi('TRAC:POIN')
+    def command_trace_points(self, args):
+        if self.check_buffer():
+            points = int(parse_number(args, (2, self.buffer_capacity)))
+            if not 2 <= points <= self.buffer_capacity:
+                self.push_error(-222, 'Parameter data out of range')
+                return
+            self.buffer_points = points
+
+    @scpi('TRAC:POIN?')
+    def query_trace_points(self, args):
+        return str(self.buffer_points) if self.check_buffer() else None
+
+    @scpi('TRAC:POIN:ACT?', 'TRAC:NEXT?')
+    def query_trace_actual_points(self, args):
+        return str(len(self.buffer)) if self.check_buffer() else None
+
+    @scpi('TRAC:FEED')
+    def command_trace_feed(self, args):
+        if self.check_buffer():
+            self.feed = short_form(args)
+
+    @scpi('TRAC:FEED:CONT')
+    def command_trace_feed_control(self, args):
+        if self.check_buffer():
+            self.feed_control = short_form(args)
+
+    @scpi('TRAC:FEED:CONT?')
+    def query_trace_feed_control(self, args):
+        return self.feed_control if self.check_buffer() else None
+
+    @scpi('TRAC:DATA?')
+    def query_trace_data(self, args):
+        return self.format_readings(self.buffer) if self.check_buffer() else None
+
+    @scpi('TRAC:DATA:SEL?')
+    def query_trace_data_selected(self, args):
+        if not self.check_buffer():
+            return None
+        start, count = (int(arg) for arg in args.split(','))
+        if start < 0 or count < 1 or start + count > len(self.buffer):
+            self.push_error(-222, 'Parameter data out of range')
+            return None
+        return self.format_readings(self.buffer[start:start + count])
+
+
+class SimulatedKeithley27XX(SimulatedDMM):
+    """Keithley 2700/2701/2750 Multimeter/Switch System fitted with 7700 series switching modules
+
+    Each channel of the modules has its own function and settings. A scan performs the sample count readings of the
+    scan list, with a relay settling time before each channel.
+    """
+    default_nplc = 5.
+    setup_attributes = SimulatedDMM.setup_attributes + ['channel_functions', 'channel_settings', 'scan_list',
+                                                        'scan_enabled', 'closed_channel']
+
+    def __init__(self, model='2700', cards=('7700', '7702'), realtime=True, seed=0):
+        self.model = model
+        self.cards = list(cards)
+        self.idn = 'KEITHLEY INSTRUMENTS INC.,MODEL {},1234567,B06  /A02'.format(model)
+        self.options = ','.join(self.cards)
+        self.buffer_capacity = 450000 if model == '2701' else 55000
+        super().__init__(realtime, seed)
+
+    def reset(self):
+        super().reset()
+        self.channel_functions = {}
+        self.channel_settings = {}
+        self.scan_list = []
+        self.scan_enabled = False
+        self.closed_channel = None
+        self.elements = ['READ', 'TST', 'RNUM']
+
+    def valid_channel(self, channel):
+        slot, number = divmod(channel, 100)
+        return 1 <= slot <= len(self.cards) and 1 <= number <= CARD_CHANNELS.get(self.cards[slot - 1], 0)
+
+    def check_channels(self, channels):
+        if not channels or not all(self.valid_channel(channel) for channel in channels):
+            self.push_error(-222, 'Parameter data out of range')
+            return False
+        return True
+
+    def split_channels(self, args):
+        if '(@' not in args:
+            return args, []
+        channels = parse_channels(args)
+        return args[:args.index('(@')].rstrip(' ,'), channels if self.check_channels(channels) else []
+
+    def settings_of(self, function, channel=None, create=False):
+        if channel is None:
+            return self.function_settings[function]
+        if create and (channel, function) not in self.channel_settings:
+            self.channel_settings[(channel, function)] = dict(self.function_settings[function])
+        return self.channel_settings.get((channel, function), self.function_settings[function])
+
+    def plan(self):
+        if self.scan_enabled and self.scan_list:
+            return [(channel, self.channel_functions.get(channel, self.function))
+                    for channel in (self.scan_list * self.sample_count)[:self.sample_count]]
+        channel = self.closed_channel
+        return [(channel, self.channel_functions.get(channel, self.function))] * self.sample_count
+
+    def reading_duration(self, channel, function):
+        duration = super().reading_duration(channel, function)
+        if self.scan_enabled and channel is not None:
+            duration += RELAY_SETTLING
+        return duration
+
+    def format_ascii(self, record):
+        value, timestamp, number, channel, function = record
+        fields = {'READ': '{:+.8E}{}'.format(value, FUNCTIONS[function][0]),
+                  'TST': '{:+09.3f}SECS'.format(timestamp),
+                  'RNUM': '{:+06d}RDNG#'.format(number),
+                  'CHAN': '{:03d}INTCHAN'.format(channel or 0)}
+        return ','.join(fields[element] for element in self.elements if element in fields)
+
+    def element_values(self, record):
+        value, timestamp, number, channel, function = record
+        fields = {'READ': value, 'TST': timestamp, 'RNUM': number, 'CHAN': channel or 0}
+        return [fields[element] for element in self.elements if element in fields]
+
+    @scpi('FUNC')
+    def command_function(self, args):
+        args, channels = self.split_channels(args)
+        try:
+            function = parse_function(args)
+        except KeyError:
+            self.push_error(-224, 'Illegal parameter value')
+            return
+        if channels:
+            for channel in channels:
+                self.channel_functions[channel] = function
+        elif '(@' not in args:
+            self.function = function
+        self.reconfigure()
+
+    @scpi('FUNC?')
+    def query_function(self, args):
+        _, channels = self.split_channels(args)
+        if not channels:
+            return super().query_function(args)
+        return ','.join('"{}"'.format(self.channel_functions.get(channel, self.function)) for channel in channels)
+
+    @scpi('ROUT:SCAN', 'ROUT:SCAN:INT')
+    def command_scan_list(self, args):
+        channels = parse_channels(args)
+        if self.check_channels(channels):
+            self.scan_list = channels
+
+    @scpi('ROUT:SCAN?', 'ROUT:SCAN:INT?')
+    def query_scan_list(self, args):
+        return '(@{})'.format(','.join(str(channel) for channel in self.scan_list))
+
+    @scpi('ROUT:SCAN:LSEL')
+    def command_scan_select(self, args):
+        self.scan_enabled = short_form(args) == 'INT'
+
+    @scpi('ROUT:SCAN:LSEL?')
+    def query_scan_select(self, args):
+        return 'INT' if self.scan_enabled else 'NONE'
+
+    @scpi('ROUT:CLOS')
+    def command_close(self, args):
+        channels = parse_channels(args)
+        if self.check_channels(channels):
+            self.closed_channel = channels[0]
+            self.spend(RELAY_SETTLING)
+            self.reconfigure()
+
+    @scpi('ROUT:CLOS?')
+    def query_close(self, args):
+        return '(@{})'.format(self.closed_channel if self.closed_channel is not None else '')
+
+    @scpi('ROUT:OPEN:ALL')
+    def command_open_all(self, args):
+        self.closed_channel = None
+
+
+class SimulatedKeithley2100(SimulatedDMM):
+    """Keithley 2100 6 1/2 digits USB multimeter"""
+    idn = 'KEITHLEY INSTRUMENTS INC.,MODEL 2100,1149087,01.08-01-01'
+    default_nplc = 10.
+
+    def configure(self, args):
+        function, _, settings = args.partition(' ')
+        self.function = parse_function(function)
+        self.trigger_source = 'IMM'
+        self.trigger_count = 1
+        self.sample_count = 1
+        self.init_continuous = False
+
+    def dispatch(self, header, args, is_query):
+        nodes = header.split(':')
+        if nodes[0] in ('CONF', 'MEAS') and len(nodes) > 1:
+            try:
+                self.configure(':'.join(nodes[1:]))
+            except KeyError:
+                self.push_error(-113, 'Undefined header')
+                return None
+            if nodes[0] == 'MEAS' and is_query:
+                return self.query_read('')
+            return None
+        return super().dispatch(header, args, is_query)
+
+    @scpi('CONF?')
+    def query_configuration(self, args):
+        return '"{} DEF,DEF"'.format(self.function.replace(':DC', ''))
+
+
+class SimulatedKeithley2110(SimulatedKeithley2100):
+    """Keithley 2110 5 1/2 digits multimeter"""
+    idn = 'KEITHLEY INSTRUMENTS INC.,MODEL 2110,8001234,02.03-03-20'
+    default_nplc = 1.
+
+
+class SimulatedKeithleyPico(SimulatedDMM):
+    """Keithley 6485 picoammeter / 6514 electrometer
+
+    ASCII readings are sent with the READ, TIME and STAT elements by default, units only with the UNIT element. Arm and
+    trigger counts multiply, the arm layer waits for a bus or trigger link event with ARM:SOUR BUS or TLIN, the trace
+    buffer stores up to 2500 readings and CALC3 computes statistics on it.
+    """
+    functions = ['CURR:DC']
+    default_function = 'CURR:DC'
+    default_nplc = 6.
+    buffer_capacity = 2500
+    reading_overhead = .001
+
+    def __init__(self, model='6485', realtime=True, seed=0):
+        self.model = model
+        self.idn = 'KEITHLEY INSTRUMENTS INC.,MODEL {},1234567,A04   Jun  4 2004 11:34:29/A02  /E'.format(model)
+        if model == '6514':
+            self.functions = ['CURR:DC', 'VOLT:DC', 'RES', 'CHAR']
+        super().__init__(realtime, seed)
+
+    def reset(self):
+        super().reset()
+        self.elements = ['READ', 'TIME', 'STAT']
+        self.arm_count = 1
+        self.arm_source = 'IMM'
+        self.arm_output = 'NONE'
+        self.calc3_format = 'MEAN'
+
+    def initiate(self):
+        trigger_count = self.trigger_count
+        self.trigger_count = self.trigger_count * self.arm_count
+        super().initiate()
+        self.trigger_count = trigger_count
+        if self.arm_source != 'IMM':
+            # Readings start when the arm event is received
+            self.run.start = math.inf
+
+    def arm(self, t):
+        """Arm event at time t, return False if the instrument is not waiting for it"""
+        if self.run is None or self.run.start != math.inf:
+            return False
+        self.run.start = t
+        if self.arm_output == 'TRIG':
+            TRIGGER_LINK.pulse(self, t)
+        return True
+
+    def link_trigger(self, t):
+        if self.arm_source == 'TLIN':
+            self.arm(t)
+        else:
+            super().link_trigger(t)
+
+    @scpi('*TRG')
+    def command_trg(self, args):
+        if self.arm_source != 'BUS':
+            super().command_trg(args)
+        elif not self.arm(self.now()):
+            self.push_error(-211, 'Trigger ignored')
+
+    def reading_value(self, channel, function, t):
+        return 1e-9 * (1 + 1e-3 * self.random.gauss(0, 1)) if function == 'CURR:DC' else \
+            super().reading_value(channel, function, t)
+
+    def format_ascii(self, record):
+        value, timestamp, number, channel, function = record
+        unit = {'CURR:DC': 'A', 'VOLT:DC': 'V', 'RES': 'OHM', 'CHAR': 'C'}[function]
+        fields = {'READ': '{:+.6E}'.format(value) + (unit if 'UNIT' in self.elements else ''),
+                  'TIME': '{:+.6E}'.format(timestamp),
+                  'STAT': '{:+.6E}'.format(0)}
+        return ','.join(fields[element] for element in self.elements if element in fields)
+
+    def element_values(self, record):
+        value, timestamp, number, channel, function = record
+        fields = {'READ': value, 'TIME': timestamp, 'STAT': 0.}
+        return [fields[element] for element in self.elements if element in fields]
+
+    def dispatch(self, header, args, is_query):
+        nodes = header.split(':')
+        if nodes[0] == 'CONF' and len(nodes) > 1 and not is_query:
+            try:
+                function = parse_function(':'.join(nodes[1:]))
+            except KeyError:
+                function = None
+            if function not in self.functions:
+                self.push_error(-113, 'Undefined header')
+                return None
+            self.function = function
+            self.trigger_count = 1
+            self.arm_count = 1
+            self.arm_source = 'IMM'
+            return None
+        return super().dispatch(header, args, is_query)
+
+    @scpi('ARM:COUN')
+    def command_arm_count(self, args):
+        self.arm_count = int(parse_number(args, (1, 2500), 1))
+
+    @scpi('ARM:SOUR')
+    def command_arm_source(self, args):
+        self.arm_source = short_form(args)
+
+    @scpi('ARM:SOUR?')
+    def query_arm_source(self, args):
+        return self.arm_source
+
+    @scpi('ARM:OUTP')
+    def command_arm_output(self, args):
+        self.arm_output = short_form(args)
+
+    @scpi('CALC3:FORM')
+    def command_calc3_format(self, args):
+        self.calc3_format = short_form(args)
+
+    @scpi('CALC3:DATA?')
+    def query_calc3_data(self, args):
+        if not self.buffer:
+            self.push_error(-230, 'Data corrupt or stale')
+            return None
+        values = np.array([record[0] for record in self.buffer])
+        statistics = {'MEAN': np.mean, 'SDEV': np.std, 'MAX': np.max, 'MIN': np.min, 'PKPK': np.ptp}
+        if self.calc3_format not in statistics:
+            self.push_error(-224, 'Illegal parameter value')
+            return None
+        return '{:+.6E}'.format(statistics[self.calc3_format](values))
+
+
+class SimulatedKeithley2400(SimulatedDMM):
+    """Keithley 2400 SourceMeter sourcing into a resistive load
+
+    Sweeps are supported through the FIX, LIST and SWE source modes: each reading of a run uses the next source level.
+    Readings are sent with the VOLT, CURR, RES, TIME and STAT elements and require the output to be enabled.
+    """
+    idn = 'KEITHLEY INSTRUMENTS INC.,MODEL 2400,1234567,C30   Mar 17 2006 09:29:29/A02  /K/J'
+    functions = ['VOLT:DC', 'CURR:DC', 'RES']
+    buffer_capacity = 2500
+    load_resistance = 1e3
+    setup_attributes = SimulatedDMM.setup_attributes + ['source']
+
+    def reset(self):
+        super().reset()
+        self.elements = ['VOLT', 'CURR', 'RES', 'TIME', 'STAT']
+        self.source = {'FUNC': 'VOLT', 'VOLT': 0., 'CURR': 0., 'MODE': 'FIX', 'LIST': [0.], 'STAR': 0., 'STOP': 0.,
+                       'POIN': 2.5, 'SPAC': 'LIN', 'DEL': .001, 'DEL:AUTO': True, 'VOLT:PROT': 21.,
+                       'CURR:PROT': 1.05e-4}
+        self.output = False
+        self.sweep_points = 1
+
+    def source_levels(self):
+        function = self.source['FUNC']
+        mode = self.source.get(function + ':MODE', 'FIX')
+        if mode == 'LIST':
+            return self.source.get(function + ':LIST', [0.])
+        if mode == 'SWE':
+            start = self.source.get(function + ':STAR', 0.)
+            stop = self.source.get(function + ':STOP', 0.)
+            points = int(self.source.get('SWE:POIN', 2500))
+            if self.source.get('SWE:SPAC', 'LIN') == 'LOG' and start > 0 and stop > 0:
+                return list(np.geomspace(start, stop, points))
+            return list(np.linspace(start, stop, points))
+        return [self.source.get(function, 0.)]
+
+    def plan(self):
+        return [(index, self.function) for index in range(self.sample_count)]
+
+    def initiate(self):
+        if not self.output:
+            self.push_error(803, 'Output disabled')
+            self.run = None
+            return
+        levels = self.source_levels()
+        plan = [(index % len(levels), 'VOLT:DC') for index in range(int(self.trigger_count) * self.sample_count)]
+        durations = [self.source['DEL'] + self.reading_duration(None, 'VOLT:DC')] * len(plan)
+        self.levels = levels
+        self.run = ScanRun(plan, durations, 1, True, self.now())
+        if self.feed_control != 'NEV' and self.buffer_auto_clear:
+            self.buffer = []
+
+    def reading_value(self, channel, function, t):
+        level = self.levels[channel]
+        noise = 1 + 1e-5 * self.random.gauss(0, 1)
+        if self.source['FUNC'] == 'VOLT':
+            limit = self.source['CURR:PROT']
+            current = max(-limit, min(limit, level / self.load_resistance)) * noise
+            return level, current
+        limit = self.source['VOLT:PROT']
+        voltage = max(-limit, min(limit, level * self.load_resistance)) * noise
+        return voltage, level
+
+    def element_values(self, record):
+        (voltage, current), timestamp, number, channel, function = record
+        fields = {'VOLT': voltage, 'CURR': current, 'RES': voltage / current if current else 9.91e37,
+                  'TIME': timestamp, 'STAT': 0.}
+        return [fields[element] for element in self.elements if element in fields]
+
+    def format_ascii(self, record):
+        return ','.join('{:+.6E}'.format(value) for value in self.element_values(record))
+
+    def dispatch(self, header, args, is_query):
+        nodes = header.split(':')
+        if nodes[0] == 'SOUR':
+            return self.source_setting(nodes[1:], args, is_query)
+        if nodes[0] in ('VOLT', 'CURR') and nodes[-1] == 'PROT':
+            key = nodes[0] + ':PROT'
+            if is_query:
+                return '{:+.6E}'.format(self.source[key])
+            self.source[key] = parse_number(args)
+            return None
+        if nodes[0] == 'MEAS' and is_query:
+            self.output = True
+            return self.query_read('')
+        if nodes[0] == 'CONF':
+            return None
+        return super().dispatch(header, args, is_query)
+
+    def source_setting(self, nodes, args, is_query):
+        nodes = [node for node in nodes if node not in ('LEV', 'IMM', 'AMPL')]
+        key = ':'.join(nodes)
+        if is_query:
+            value = self.source.get(key, '')
+            if isinstance(value, bool):
+                return str(int(value))
+            return ','.join('{:+.6E}'.format(level) for level in value) if isinstance(value, list) else \
+                '{:+.6E}'.format(value) if isinstance(value, float) else str(value)
+        if key == 'FUNC' or key.endswith('MODE') or key.endswith('SPAC'):
+            self.source[key] = short_form(args)
+        elif nodes[0] == 'LIST':
+            # SOUR:LIST:VOLT|CURR[:APP] (100 levels at most per message)
+            levels = [parse_number(arg) for arg in args.split(',')]
+            if len(levels) > 100:
+                self.push_error(-223, 'Too much data')
+                return None
+            key = nodes[1] + ':LIST'
+            self.source[key] = self.source.get(key, []) + levels if nodes[-1] == 'APP' else levels
+        elif key == 'DEL:AUTO':
+            self.source[key] = parse_bool(args)
+        elif key.endswith('STEP'):
+            function = nodes[0]
+            start, stop = self.source.get(function + ':STAR', 0.), self.source.get(function + ':STOP', 0.)
+            self.source['SWE:POIN'] = abs(round((stop - start) / parse_number(args))) + 1
+        else:
+            self.source[key] = parse_number(args)
+            if key == 'DEL':
+                # A source delay disables the auto delay
+                self.source['DEL:AUTO'] = False
+        return None
+
+    @scpi('OUTP')
+    def command_output(self, args):
+        self.output = parse_bool(args)
+
+    @scpi('OUTP?')
+    def query_output(self, args):
+        return str(int(self.output))
+
+    @scpi('FETC?')
+    def query_fetch(self, args):
+        if self.run is None:
+            self.push_error(-230, 'Data corrupt or stale')
+            return None
+        return super().query_fetch(args)
+
+    @scpi('READ?')
+    def query_read(self, args):
+        self.initiate()
+        if self.run is None:
+            return None
+        return self.query_fetch(args)
@@ -0,0 +1,34 @@
+from pymeasure.adapters import Adapter
+
+from .resource_manager import SimulatedResourceManager
+
+
+class SimulatedAdapter(Adapter):
+    """pymeasure adapter connecting an Instrument to a simulated Keithley instrument
+
+    :param resource_name: Resource name of the simulated instrument (see SimulatedResourceManager)
+    :type resource_name: string
+    """
+    def __init__(self, resource_name, realtime=True, **kwargs):
+        super().__init__(**kwargs)
+        self.connection = SimulatedResourceManager(realtime=realtime).open_resource(resource_name,
+                                                                                   read_termination='\n',
+                                                                                   write_termination='\n')
+
+    def __repr__(self):
+        return '<SimulatedAdapter(resource={!r})>'.format(self.connection.resource_name)
+
+    def _write(self, command, **kwargs):
+        self.connection.write(command)
+
+    def _write_bytes(self, content, **kwargs):
+        self.connection.write_raw(content)
+
+    def _read(self, **kwargs):
+        return self.connection.read()
+
+    def _read_bytes(self, count, break_on_termchar=False, **kwargs):
+        return self.connection.read_bytes(count)
+
+    def flush_read_buffer(self):
+        self.connection.clear()
@@ -0,0 +1,77 @@
+import re
+
+from pyvisa.constants import InterfaceType
+from pyvisa.highlevel import ResourceInfo
+
+from .keithley_models import (SimulatedKeithley27XX, SimulatedKeithley2100, SimulatedKeithley2110,
+                              SimulatedKeithley2400, SimulatedKeithleyPico)
+from .scpi_simulator import SimulatedSession
+
+# Simulated instruments: resource name -> (model class, keyword arguments, VISA alias)
+DEFAULT_RESOURCES = {
+    'ASRL1::INSTR': (SimulatedKeithley27XX, {'model': '2700', 'cards': ('7700', '7702')}, None),
+    'TCPIP0::192.168.1.101::1394::SOCKET': (SimulatedKeithley27XX, {'model': '2701', 'cards': ('7702', '7702')},
+                                            None),
+    'USB0::0x05E6::0x2100::1149087::INSTR': (SimulatedKeithley2100, {}, None),
+    'USB0::0x05E6::0x2110::8001234::INSTR': (SimulatedKeithley2110, {}, 'K2110'),
+    'GPIB0::14::INSTR': (SimulatedKeithleyPico, {'model': '6485'}, None),
+    'GPIB0::15::INSTR': (SimulatedKeithleyPico, {'model': '6514'}, None),
+    'GPIB0::24::INSTR': (SimulatedKeithley2400, {}, None),
+}
+
+INTERFACE_TYPES = {'ASRL': InterfaceType.asrl, 'GPIB': InterfaceType.gpib, 'USB': InterfaceType.usb,
+                   'TCPIP': InterfaceType.tcpip}
+
+
+class SimulatedResourceManager:
+    """Stand-in of the pyvisa ResourceManager listing and opening the simulated Keithley instruments
+
+    The instruments are shared by all the managers of the process: sessions opened on the same resource talk to
+    the same simulated instrument, as they would with a real one.
+
+    :param resources: Simulated instruments, see DEFAULT_RESOURCES
+    :type resources: dict
+    :param realtime: Whether the instruments follow the wall clock or a virtual clock
+    :type realtime: bool
+    """
+    instruments = {}
+
+    def __init__(self, resources=None, realtime=True):
+        self.resources = dict(DEFAULT_RESOURCES if resources is None else resources)
+        self.realtime = realtime
+        self.aliases = {alias: name for name, (_, _, alias) in self.resources.items() if alias is not None}
+
+    def __repr__(self):
+        return '<SimulatedResourceManager({} resources)>'.format(len(self.resources))
+
+    def list_resources(self, query='?*::INSTR'):
+        return tuple(self.resources)
+
+    def list_resources_info(self, query='?*::INSTR'):
+        infos = {}
+        for name, (_, _, alias) in self.resources.items():
+            interface = re.match(r'[A-Z]*', name).group()
+            board = re.match(r'[A-Z]*(\d*)', name).group(1)
+            infos[name] = ResourceInfo(INTERFACE_TYPES.get(interface, InterfaceType.unknown),
+                                       int(board or 0), name.split('::')[-1], name, alias)
+        return infos
+
+    def resource_info(self, resource_name):
+        return self.list_resources_info()[self.aliases.get(resource_name, resource_name)]
+
+    def instrument(self, resource_name):
+        """Return the simulated instrument of a resource, created on first use"""
+        resource_name = self.aliases.get(resource_name, resource_name)
+        if resource_name not in self.resources:
+            raise ValueError("No simulated instrument for resource {}".format(resource_name))
+        if resource_name not in self.instruments:
+            model, kwargs, _ = self.resources[resource_name]
+            self.instruments[resource_name] = model(realtime=self.realtime, **kwargs)
+        return self.instruments[resource_name]
+
+    def open_resource(self, resource_name, **kwargs):
+        return SimulatedSession(self.aliases.get(resource_name, resource_name), self.instrument(resource_name),
+                                **kwargs)
+
+    def close(self):
+        pass
@@ -0,0 +1,442 @@
+import re
+import struct
+import time
+from collections import deque
+
+import numpy as np
+import pyvisa as visa
+from pyvisa.constants import StatusCode
+from pymodaq.utils.logger import set_logger, get_module_name
+logger = set_logger(get_module_name(__file__))
+
+# Long form nodes whose short form does not follow the 4 characters rule
+SHORT_FORMS = {'FRESISTANCE': 'FRES'}
+
+# Bus model of each VISA interface: (latency per transaction (s), throughput (bytes/s))
+BUS_MODELS = {'ASRL': (0.002, 960.),
+              'GPIB': (0.0005, 400e3),
+              'USB': (0.0003, 2e6),
+              'TCPIP': (0.001, 1e6)}
+
+
+def short_form(node):
+    """Return the SCPI short form of a header node (TRIGger -> TRIG, CALCulate3 -> CALC3)"""
+    node = node.upper()
+    suffix = re.search(r'\d*$', node).group()
+    name = node[:len(node) - len(suffix)]
+    if name in SHORT_FORMS:
+        name = SHORT_FORMS[name]
+    elif len(name) > 4:
+        name = name[:3] if name[3] in 'AEIOU' else name[:4]
+    return name + suffix
+
+
+def split_message(message):
+    """Split a program message into (header, arguments, is_query) tuples
+
+    Headers are returned in short form with absolute path, following the SCPI rules for compound commands: a header
+    not starting with a colon is relative to the path of the previous header of the message.
+    """
+    commands = []
+    path = []
+    for command in re.split(r';(?=(?:[^\'"]|\'[^\']*\'|"[^"]*")*$)', message.strip()):
+        command = command.strip()
+        if not command:
+            continue
+        header, _, args = command.partition(' ')
+        args = args.strip()
+        is_query = header.endswith('?')
+        header = header.rstrip('?')
+        if header.startswith('*'):
+            commands.append((header.upper(), args, is_query))
+            continue
+        if header.startswith(':'):
+            path = []
+        nodes = path + [short_form(node) for node in header.strip(':').split(':') if node]
+        path = nodes[:-1]
+        commands.append((':'.join(nodes), args, is_query))
+    return commands
+
+
+def parse_channels(args):
+    """Return the channels of a channel list argument such as (@101,103:105)"""
+    match = re.search(r'\(@([^)]*)\)', args)
+    if match is None:
+        return []
+    channels = []
+    for item in match.group(1).split(','):
+        if ':' in item:
+            first, last = item.split(':')
+            channels.extend(range(int(first), int(last) + 1))
+        elif item.strip():
+            channels.append(int(item))
+    return channels
+
+
+def scpi(*headers):
+    """Decorator registering a method of a SimulatedInstrument as the handler of SCPI headers (short form)"""
+    def decorator(func):
+        func.scpi_headers = headers
+        return func
+    return decorator
+
+
+class SimulatedInstrument:
+    """Base class of the simulated SCPI instruments
+
+    Commands are dispatched to the methods registered with the scpi decorator (HEADER for commands, HEADER? for
+    queries). Other commands are stored as plain settings that can be queried back. The instrument keeps its own
+    clock: with realtime=True, it follows the wall clock and the session really sleeps for the modelled latencies,
+    otherwise it runs on a virtual clock only advanced by the modelled durations.
+    """
+    idn = 'KEITHLEY INSTRUMENTS INC.,MODEL 0000,0000000,A00'
+    options = '0'
+    line_frequency = 50.
+    # Processing time (s) of a command by the instrument firmware
+    command_time = 0.0002
+    # Size of the error queue
+    error_queue_size = 10
+    # Optional leading nodes, dropped from the headers
+    implied_nodes = ('SENS',)
+    handlers = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        handlers = {}
+        for klass in reversed(cls.__mro__):
+            for name, attr in vars(klass).items():
+                for header in getattr(attr, 'scpi_headers', ()):
+                    handlers[header] = name
+        cls.handlers = handlers
+
+    def __init__(self, realtime=True, seed=0):
+        self.realtime = realtime
+        self.seed = seed
+        self._t0 = time.perf_counter()
+        self._clock = 0.
+        self.errors = deque()
+        self.setups = {}
+        self.settings = {}
+        self.ese = 0
+        self.sre = 0
+        self.esr = 0
+        self.reply_time = 0.
+        self.reset()
+
+    # Time model
+    def now(self):
+        if self.realtime:
+            return time.perf_counter() - self._t0
+        return self._clock
+
+    def spend(self, duration):
+        """Let duration (s) elapse"""
+        if duration <= 0:
+            return
+        if self.realtime:
+            time.sleep(duration)
+        else:
+            self._clock += duration
+
+    def delay_reply(self, ready_time):
+        # The reply of the current query is only available at ready_time
+        self.reply_time = max(self.reply_time, ready_time)
+
+    # Error queue
+    def push_error(self, code, message):
+        if len(self.errors) >= self.error_queue_size:
+            self.errors[-1] = (-350, 'Queue overflow')
+        else:
+            self.errors.append((code, message))
+
+    # Message processing
+    def handle(self, message):
+        """Process a program message
+
+        :return: the replies to the queries of the message (str or bytes) and the time they are available at
+        :rtype: tuple
+        """
+        replies = []
+        self.reply_time = 0.
+        for header, args, is_query in split_message(message):
+            self.spend(self.command_time)
+            nodes = header.split(':')
+            while len(nodes) > 1 and nodes[0] in self.implied_nodes:
+                nodes = nodes[1:]
+            header = ':'.join(nodes)
+            try:
+                reply = self.dispatch(header, args, is_query)
+            except ValueError as err:
+                self.push_error(-104, 'Data type error')
+                logger.debug("Simulated {}: {} {} => {}".format(self.idn.split(',')[1], header, args, err))
+                reply = None
+            if is_query and reply is not None:
+                replies.append(reply)
+        return replies, self.reply_time
+
+    def dispatch(self, header, args, is_query):
+        key = header + '?' if is_query else header
+        if key in self.handlers:
+            return getattr(self, self.handlers[key])(args)
+        if is_query:
+            if header in self.settings:
+                return self.settings[header]
+            self.push_error(-113, 'Undefined header')
+            return None
+        self.settings[header] = args
+        return None
+
+    def reset(self):
+        """Restore the default settings (*RST)"""
+        self.settings = {}
+
+    # IEEE-488.2 common commands
+    @scpi('*IDN?')
+    def query_idn(self, args):
+        return self.idn
+
+    @scpi('*OPT?')
+    def query_opt(self, args):
+        return self.options
+
+    @scpi('*RST')
+    def command_rst(self, args):
+        self.spend(0.05)
+        self.reset()
+
+    @scpi('*CLS')
+    def command_cls(self, args):
+        self.errors.clear()
+        self.esr = 0
+
+    @scpi('*ESE')
+    def command_ese(self, args):
+        self.ese = int(args)
+
+    @scpi('*SRE')
+    def command_sre(self, args):
+        self.sre = int(args)
+
+    @scpi('*ESR?')
+    def query_esr(self, args):
+        self.update_status()
+        esr, self.esr = self.esr, 0
+        return str(esr)
+
+    @scpi('*STB?')
+    def query_stb(self, args):
+        return str(self.status_byte())
+
+    @scpi('*OPC')
+    def command_opc(self, args):
+        self.opc_time = self.operation_end()
+
+    @scpi('*OPC?')
+    def query_opc(self, args):
+        self.delay_reply(self.operation_end())
+        return '1'
+
+    @scpi('*WAI')
+    def command_wai(self, args):
+        self.spend(self.operation_end() - self.now())
+
+    @scpi('*SAV')
+    def command_sav(self, args):
+        self.setups[int(args)] = self.save_setup()
+
+    @scpi('*RCL')
+    def command_rcl(self, args):
+        if int(args) not in self.setups:
+            self.push_error(-222, 'Parameter data out of range')
+            return
+        self.spend(0.05)
+        self.recall_setup(self.setups[int(args)])
+
+    @scpi('SYST:ERR?', 'SYST:ERR:NEXT?')
+    def query_error(self, args):
+        if not self.errors:
+            return '0,"No error"'
+        return '{},"{}"'.format(*self.errors.popleft())
+
+    @scpi('SYST:LFR?')
+    def query_line_frequency(self, args):
+        return '{:g}'.format(self.line_frequency)
+
+    # Status model
+    opc_time = None
+
+    def operation_end(self):
+        """Time at which the pending operations (measurements) are over"""
+        return self.now()
+
+    def update_status(self):
+        if self.opc_time is not None and self.now() >= self.opc_time:
+            self.esr |= 1
+            self.opc_time = None
+
+    def status_byte(self):
+        self.update_status()
+        stb = 0
+        if self.errors:
+            stb |= 4
+        if self.esr & self.ese:
+            stb |= 32
+        if stb & self.sre:
+            stb |= 64
+        return stb
+
+    # Setups
+    def save_setup(self):
+        return dict(self.settings)
+
+    def recall_setup(self, setup):
+        self.settings = dict(setup)
+
+
+class SimulatedSession:
+    """In-process stand-in of a pyvisa MessageBasedResource connected to a SimulatedInstrument
+
+    It models the bus latency and throughput of the VISA interface of the resource name (serial links: one byte per 10
+    bauds of baud_rate) and counts the transferred bytes. Replies of the instrument are queued and read back as a real
+    instrument output buffer, the timeout bounding the wait for the reply and its transfer.
+    """
+    def __init__(self, resource_name, instrument, read_termination=None, write_termination='\r\n', timeout=2000,
+                 **kwargs):
+        self.resource_name = resource_name
+        self.instrument = instrument
+        self.read_termination = read_termination
+        self.write_termination = write_termination
+        self.timeout = timeout
+        self.encoding = 'ascii'
+        interface = re.match(r'[A-Z]*', resource_name.upper()).group()
+        self.latency, self.throughput = BUS_MODELS.get(interface, BUS_MODELS['GPIB'])
+        if interface == 'ASRL':
+            self.baud_rate = int(10 * self.throughput)
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self._output = deque()
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return '<SimulatedSession({!r}, {})>'.format(self.resource_name, type(self.instrument).__name__)
+
+    def _transfer_duration(self, nbytes):
+        throughput = self.baud_rate / 10 if hasattr(self, 'baud_rate') else self.throughput
+        return self.latency + nbytes / throughput
+
+    def _transfer(self, nbytes):
+        self.instrument.spend(self._transfer_duration(nbytes))
+
+    def _timeout_error(self):
+        return visa.errors.VisaIOError(StatusCode.error_timeout)
+
+    # Writing
+    def write(self, message, termination=None, encoding=None):
+        termination = self.write_termination if termination is None else termination
+        nbytes = len(message) + len(termination or '')
+        self._transfer(nbytes)
+        self.bytes_written += nbytes
+        replies, ready_time = self.instrument.handle(message)
+        if replies:
+            if all(isinstance(reply, str) for reply in replies):
+                replies = [';'.join(replies)]
+            for reply in replies:
+                self._output.append((reply, ready_time))
+        return nbytes
+
+    def write_raw(self, message):
+        return self.write(message.decode(self.encoding), termination='')
+
+    def assert_trigger(self):
+        self._transfer(0)
+        self.instrument.handle('*TRG')
+
+    def clear(self):
+        self._output.clear()
+
+    # Reading
+    def read_raw(self, size=None):
+        if not self._output:
+            self.instrument.spend(self.timeout / 1000)
+            self.instrument.push_error(-420, 'Query UNTERMINATED')
+            raise self._timeout_error()
+        reply, ready_time = self._output.popleft()
+        if isinstance(reply, str):
+            reply = reply.encode(self.encoding)
+        reply += (self.read_termination or '\n').encode(self.encoding)
+        wait = max(0., ready_time - self.instrument.now())
+        if wait + self._transfer_duration(len(reply)) > self.timeout / 1000:
+            self.instrument.spend(self.timeout / 1000)
+            raise self._timeout_error()
+        self.instrument.spend(wait)
+        self._transfer(len(reply))
+        self.bytes_read += len(reply)
+        return reply
+
+    def read(self, termination=None, encoding=None):
+        message = self.read_raw().decode(encoding or self.encoding)
+        termination = self.read_termination if termination is None else termination
+        if termination and message.endswith(termination):
+            message = message[:-len(termination)]
+        return message
+
+    def read_bytes(self, count, chunk_size=None, break_on_termchar=False):
+        return self.read_raw()[:count]
+
+    def query(self, message, delay=None):
+        self.write(message)
+        if delay:
+            self.instrument.spend(delay)
+        return self.read()
+
+    def read_ascii_values(self, converter='f', separator=',', container=list):
+        converter = {'f': float, 'd': int, 's': str}.get(converter, converter)
+        return container([converter(value) for value in self.read().split(separator) if value.strip()])
+
+    def query_ascii_values(self, message, converter='f', separator=',', container=list, delay=None):
+        self.write(message)
+        if delay:
+            self.instrument.spend(delay)
+        return self.read_ascii_values(converter, separator, container)
+
+    def read_binary_values(self, datatype='f', is_big_endian=False, container=list, header_fmt='ieee',
+                           expect_termination=True, data_points=0, chunk_size=None, **kwargs):
+        block = self.read_raw()
+        if expect_termination:
+            block = block[:-len(self.read_termination or '\n')]
+        if header_fmt == 'ieee':
+            n_digits = int(block[1:2])
+            offset = 2 + n_digits
+            length = int(block[2:offset]) if n_digits else data_points * struct.calcsize(datatype)
+            block = block[offset:offset + length]
+        values = np.frombuffer(block, dtype=np.dtype(('>' if is_big_endian else '<') + datatype))
+        return values.copy() if container is np.array else container(values.tolist())
+
+    def query_binary_values(self, message, datatype='f', is_big_endian=False, container=list, delay=None,
+                            header_fmt='ieee', expect_termination=True, data_points=0, chunk_size=None, **kwargs):
+        self.write(message)
+        if delay:
+            self.instrument.spend(delay)
+        return self.read_binary_values(datatype, is_big_endian, container, header_fmt, expect_termination,
+                                       data_points, chunk_size)
+
+    # Status
+    def read_stb(self):
+        self._transfer(1)
+        return self.instrument.status_byte()
+
+    @property
+    def stb(self):
+        return self.read_stb()
+
+    def wait_for_srq(self, timeout=25000):
+        """Wait until the instrument requests service"""
+        deadline = self.instrument.now() + (timeout or 0) / 1000
+        while not self.instrument.status_byte() & 64:
+            if self.instrument.now() >= deadline:
+                raise self._timeout_error()
+            self.instrument.spend(0.001)
+
+    def close(self):
+        self._output.clear()
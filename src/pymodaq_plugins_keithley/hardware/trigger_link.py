@@ -0,0 +1,286 @@
+"""
+Hardware synchronised acquisition of several Keithley instruments through their trigger lines
+
+The output trigger line of a master instrument is wired to the trigger input of the others (slaves): the 27XX
+voltmeter complete output (trigger link) or the external trigger connector of the 2100, and the trigger link lines of
+the picoammeters. Every instrument is armed for a burst of readings stored in its memory, the master is triggered
+from the bus and starts the slaves with its output pulse, then all the bursts are fetched concurrently::
+
+    k2701 = Keithley27XXVISADriver('TCPIP0::192.168.1.101::1394::SOCKET')     # initialized and set in its mode
+    k2100 = Keithley2100VISADriver('USB0::0x05E6::0x2100::1149087::INSTR')    # initialized and set in its mode
+    pico = open_session('GPIB0::14::INSTR', read_termination='\\r')
+    group = TriggerLinkGroup([Keithley27XXLinkMember(k2701), Keithley2100LinkMember(k2100),
+                              KeithleyPicoLinkMember(pico)])
+    readings = group.acquire(100)
+    values, times, labels = group.merged(readings)
+
+The time axis of each instrument starts at its trigger, the slaves being offset by the output delay of the master (end
+of its first reading for a multimeter, none for a picoammeter), so that all the readings share the time origin of the
+master trigger. The 2100 does not timestamp its readings: they are assumed evenly spaced from its trigger to the end of
+the burst, as measured by the host when *OPC? returns.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from pymodaq.utils.logger import set_logger, get_module_name
+logger = set_logger(get_module_name(__file__))
+
+
+def trigger_times(timestamps):
+    """Times (s) since the trigger of readings timestamped by the instrument, in the order of the readings
+
+    The first reading is assumed to last as long as the mean interval between the readings.
+
+    :param timestamps: Timestamps of consecutive readings, in any shape
+    :type timestamps: numpy array
+    :rtype: numpy array
+    """
+    timestamps = np.asarray(timestamps, dtype=float)
+    period = (timestamps.flat[-1] - timestamps.flat[0]) / (timestamps.size - 1) if timestamps.size > 1 else 0.
+    return timestamps - timestamps.flat[0] + period
+
+
+class Keithley27XXLinkMember:
+    """Keithley 27XX in a trigger link group: one trigger starts all the scans, buffered with their timestamps
+
+    :param driver: Connected driver, set in the mode to acquire (see Keithley27XXVISADriver.set_mode)
+    :type driver: Keithley27XXVISADriver
+    :param chunk_size: Maximum number of readings per transfer, see Keithley27XXVISADriver.read_buffered
+    :type chunk_size: int
+    :param poll_interval: Time (s) between two queries of the number of stored readings
+    :type poll_interval: float
+    """
+    def __init__(self, driver, chunk_size=1000, poll_interval=.05):
+        self.driver = driver
+        self.name = driver.rsrc_name
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.n_scans = 0
+
+    @property
+    def labels(self):
+        return [str(channel) for channel in self.driver.scan_channels] or ['front']
+
+    def arm(self, n_readings, master):
+        self.n_scans = n_readings
+        self.driver.set_buffered_scan(n_readings, 'BUS' if master else 'EXT')
+        self.driver.stop_requested = False
+        self.driver._instr.write("INIT")
+
+    def trigger(self):
+        self.driver._instr.write("*TRG")
+
+    def fetch(self, trigger_time):
+        """Scans (n_scans, number of channels) and their times since the trigger, given by their first channel"""
+        values, timestamps = self.driver.read_buffered(self.n_scans, self.chunk_size, self.poll_interval)
+        return values, trigger_times(timestamps)[:, 0]
+
+    @staticmethod
+    def output_delay(times):
+        # Voltmeter complete: end of the first reading
+        return float(times[0])
+
+    @staticmethod
+    def shifted(times, delay):
+        """Times since the master trigger of a slave triggered delay (s) after it"""
+        return times + delay
+
+    def disarm(self):
+        # Back to the mode set before arm, on the rear ('SCAN_' prefixed mode) or front panel
+        self.driver.set_mode(self.driver.mode)
+
+
+class Keithley2100LinkMember:
+    """Keithley 2100 in a trigger link group: one trigger starts a burst of readings (see arm_burst of the driver)
+
+    :param driver: Connected driver, set in the mode to acquire (see Keithley2100VISADriver.set_mode)
+    :type driver: Keithley2100VISADriver
+    """
+    labels = ['reading']
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.name = driver.rsrc_name
+        self.n_readings = 0
+        # Monitoring mode left by arm_burst, restored by disarm
+        self.monitoring = False
+
+    def arm(self, n_readings, master):
+        self.n_readings = n_readings
+        self.monitoring = self.driver.monitoring
+        self.driver.arm_burst(n_readings, 'BUS' if master else 'EXT')
+
+    def trigger(self):
+        self.driver._instr.write("*TRG")
+
+    def fetch(self, trigger_time):
+        """Readings (n_readings, 1) and their times since the trigger, evenly spaced until the end of the burst
+
+        The end of the burst is taken when *OPC? returns, before the transfer of the readings.
+        """
+        self.driver.wait_burst()
+        period = (time.perf_counter() - trigger_time) / self.n_readings
+        values = self.driver.fetch_burst(wait=False)
+        return values.reshape(-1, 1), period * np.arange(1, self.n_readings + 1)
+
+    @staticmethod
+    def output_delay(times):
+        # Voltmeter complete: end of the first reading
+        return float(times[0])
+
+    @staticmethod
+    def shifted(times, delay):
+        """Times since the master trigger of a slave triggered delay (s) after it
+
+        The burst started delay after the master trigger from which its duration was measured: the spacing of the
+        readings is reduced accordingly, the end of the burst being kept.
+        """
+        return delay + times * (1 - delay / times[-1])
+
+    def disarm(self):
+        # The sample count of the burst is kept, see Keithley2100VISADriver.read_command
+        self.driver._instr.write_settings("TRIG:SOUR IMM")
+        if self.monitoring:
+            self.driver.set_monitoring(True)
+
+
+class KeithleyPicoLinkMember:
+    """Keithley 6485/6514 in a trigger link group: the arm layer waits for the trigger, then the readings are stored in
+    the trace buffer with their timestamps
+
+    The master outputs its trigger on output_line when leaving the arm layer, the slaves wait for it on input_line.
+
+    :param session: Opened session of the instrument, as in DAQ_0DViewer_Keithley_Pico
+    :type session: SharedSession
+    :param input_line: Trigger link input line (1 to 6)
+    :type input_line: int
+    :param output_line: Trigger link output line (1 to 6)
+    :type output_line: int
+    :param name: Name of the instrument in the group, its resource name by default
+    :type name: string
+    """
+    labels = ['reading']
+    # Settings changed by arm, queried before and restored by disarm
+    restored_settings = (':FORM:ELEM', ':FORM:DATA', ':TRIG:COUN')
+
+    def __init__(self, session, input_line=1, output_line=2, name=None):
+        self.session = session
+        self.name = name or session.resource_name
+        self.input_line = input_line
+        self.output_line = output_line
+        self.n_readings = 0
+        self.restore_commands = []
+
+    def arm(self, n_readings, master):
+        self.n_readings = n_readings
+        self.restore_commands = ['{} {}'.format(header, self.session.query(header + '?').strip())
+                                 for header in self.restored_settings]
+        if master:
+            arm = [':ARM:SOUR BUS', ':ARM:OLIN {:d}'.format(self.output_line), ':ARM:OUTP TRIG']
+        else:
+            arm = [':ARM:SOUR TLIN', ':ARM:ILIN {:d}'.format(self.input_line), ':ARM:OUTP NONE']
+        commands = arm + [':ARM:COUN 1', ':TRIG:SOUR IMM', ':TRIG:COUN {:d}'.format(n_readings), ':TRAC:CLE',
+                          ':TRAC:POIN {:d}'.format(n_readings), ':TRAC:FEED SENS', ':TRAC:FEED:CONT NEXT',
+                          ':FORM:ELEM READ,TIME', ':FORM:DATA ASC', ':INIT']
+        self.session.write(';'.join(commands))
+
+    def trigger(self):
+        self.session.write("*TRG")
+
+    def fetch(self, trigger_time):
+        """Readings (n_readings, 1) and their times since the trigger"""
+        self.session.query("*OPC?")
+        block = self.session.query_ascii_values(':TRAC:DATA?', container=np.array)
+        return block[::2].reshape(-1, 1), trigger_times(block[1::2])
+
+    @staticmethod
+    def output_delay(times):
+        # Trigger output when leaving the arm layer, before the first reading
+        return 0.
+
+    @staticmethod
+    def shifted(times, delay):
+        """Times since the master trigger of a slave triggered delay (s) after it"""
+        return times + delay
+
+    def disarm(self):
+        self.session.write(';'.join([':ARM:SOUR IMM', ':ARM:OUTP NONE'] + self.restore_commands))
+
+
+class TriggerLinkGroup:
+    """Synchronised buffered acquisition of instruments connected by their trigger lines
+
+    Each member adapts an instrument (Keithley27XXLinkMember, Keithley2100LinkMember, KeithleyPicoLinkMember). The
+    instruments are armed and fetched concurrently by a thread pool, as in Keithley27XXCoordinator. The session timeout
+    of each instrument must cover its burst.
+
+    :param members: Instruments of the group, wired to the output trigger line of the master
+    :type members: list
+    :param master: Index of the master in members
+    :type master: int
+    """
+    def __init__(self, members, master=0):
+        self.members = list(members)
+        self.master = self.members[master]
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.members)),
+                                            thread_name_prefix='TriggerLinkGroup')
+
+    def map(self, function):
+        """Call function(member) for each member concurrently
+
+        :return: The results, in the order of the members
+        :rtype: list
+        :raises: The first exception raised by a call, once all the calls are over
+        """
+        futures = [self._executor.submit(function, member) for member in self.members]
+        return [future.result() for future in futures]
+
+    def acquire(self, n_readings):
+        """Arm every instrument for n_readings readings (scans for a 27XX), trigger the master and fetch the bursts
+
+        The instruments come back to their triggering mode afterwards.
+
+        :return: The readings (n_readings, number of channels) and their times (s since the master trigger) of each
+         member, by name
+        :rtype: dict of tuples of numpy arrays
+        """
+        try:
+            self.map(lambda member: member.arm(n_readings, member is self.master))
+            trigger_time = time.perf_counter()
+            self.master.trigger()
+            results = self.map(lambda member: member.fetch(trigger_time))
+        finally:
+            self.map(lambda member: member.disarm())
+
+        master_times = results[self.members.index(self.master)][1]
+        delay = self.master.output_delay(master_times)
+        readings = {}
+        for member, (values, times) in zip(self.members, results):
+            readings[member.name] = (values, times if member is self.master else member.shifted(times, delay))
+        logger.debug("{} readings acquired by {} instruments, master output delay {:.3g} s"
+                     .format(n_readings, len(self.members), delay))
+        return readings
+
+    def merged(self, readings):
+        """Interpolate the readings of every member at the times of the master
+
+        :param readings: Readings returned by acquire
+        :type readings: dict
+        :return: The measurement values (n_readings, total number of channels), the common times and the
+         '<name>/<channel>' label of each column, the members in their order
+        :rtype: tuple (numpy array, numpy array, list of string)
+        """
+        times = readings[self.master.name][1]
+        columns = []
+        labels = []
+        for member in self.members:
+            values, member_times = readings[member.name]
+            columns.extend(np.interp(times, member_times, values[:, index]) for index in range(values.shape[1]))
+            labels.extend('{}/{}'.format(member.name, label) for label in member.labels)
+        return np.column_stack(columns), times, labels
+
+    def close(self):
+        """Stop the thread pool, the instruments are left open"""
+        self._executor.shutdown()
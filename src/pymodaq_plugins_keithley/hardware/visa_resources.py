@@ -0,0 +1,361 @@
+import threading
+import time
+
+import pyvisa as visa
+from pyvisa.util import from_ascii_block
+from pymodaq_plugins_keithley import config
+from pymodaq_plugins_keithley.hardware.simulator import SimulatedResourceManager
+from pymodaq_plugins_keithley.hardware.instrumentation import instrumentation
+from pymodaq.utils.logger import set_logger, get_module_name
+logger = set_logger(get_module_name(__file__))
+
+# Backend name selecting the simulated instruments instead of a VISA library
+SIMULATOR_BACKEND = '@keithley_sim'
+
+# Time (s) during which an enumeration of the VISA resources is reused
+RESOURCES_TTL = 60.
+
+_resources_cache = {}
+_resources_lock = threading.Lock()
+
+# Headers restoring a whole setup of the instrument (short forms)
+RESET_HEADERS = ('*RST', '*RCL', 'SYST:PRES')
+# Headers configuring a whole measurement function, with the function in the header (:CONF:VOLT:DC 10)
+CONFIGURE_HEADERS = ('CONF',)
+# Subsystems of the configured function written along with its configuration (:VOLT:DC:AVER:COUN 10)
+CONFIGURE_SUBSYSTEMS = ('AVER',)
+
+
+def simulation_enabled():
+    """Whether the simulated instruments are enabled in the configuration file ([Keithley.simulator] section)"""
+    try:
+        return bool(config["Keithley", "simulator", "enabled"])
+    except KeyError:
+        return False
+
+
+def get_resource_manager(pyvisa_backend=''):
+    """Return the resource manager of a pyvisa backend, or the simulated one
+
+    :param pyvisa_backend: pyvisa backend identifier ('@py', '@ni', path to a visa dll...), '' for the default one,
+     SIMULATOR_BACKEND for the simulated instruments
+    :type pyvisa_backend: string
+    """
+    if pyvisa_backend == SIMULATOR_BACKEND or simulation_enabled():
+        try:
+            realtime = bool(config["Keithley", "simulator", "realtime"])
+        except KeyError:
+            realtime = True
+        return SimulatedResourceManager(realtime=realtime)
+    return visa.ResourceManager(pyvisa_backend)
+
+
+def list_resources(pyvisa_backend='', info=False, refresh=False, query='?*::INSTR'):
+    """List the VISA resources of a backend
+
+    Enumerating the resources scans every bus (seconds with some backends): the result is cached and reused during
+    RESOURCES_TTL seconds.
+
+    :param pyvisa_backend: pyvisa backend identifier, see get_resource_manager
+    :type pyvisa_backend: string
+    :param info: Whether the ResourceInfo of each resource should be returned (dict keyed by resource name) instead of
+     the resource names
+    :type info: bool
+    :param refresh: Whether the bus should be scanned again, even if the cached list is still valid
+    :type refresh: bool
+    :param query: pyvisa resources query ('?*' for all the resources)
+    :type query: string
+    """
+    key = (pyvisa_backend, info, query, simulation_enabled())
+    with _resources_lock:
+        timestamp, resources = _resources_cache.get(key, (None, None))
+        if refresh or timestamp is None or time.monotonic() - timestamp > RESOURCES_TTL:
+            try:
+                rm = get_resource_manager(pyvisa_backend)
+                resources = rm.list_resources_info(query) if info else rm.list_resources(query)
+            except (visa.errors.Error, OSError, ValueError) as err:
+                logger.warning("VISA resources could not be listed: {}".format(err))
+                resources = {} if info else ()
+            _resources_cache[key] = (time.monotonic(), resources)
+        return resources
+
+
+class LazyParams:
+    """Plugin params class attribute built from a function each time it is read
+
+    PyMoDAQ imports every plugin module to list them, but only reads the params of a plugin when it is selected:
+    parameters depending on the VISA resources are then built without enumerating them at import.
+
+    :param builder: Function returning the params list
+    :type builder: callable
+    """
+    def __init__(self, builder):
+        self.builder = builder
+
+    def __get__(self, instance, owner):
+        return self.builder()
+
+
+class SettingsShadow:
+    """Write-through record of the settings written to an instrument
+
+    Each setting command ('HEADER argument') written through a session is recorded, so that writing again the same
+    argument can be skipped (see SharedSession.write_settings). Queries and commands without argument (INIT, *TRG...)
+    do not change the record. It is cleared when the instrument setup is reset or recalled (RESET_HEADERS), when a
+    command fails or when an error is read from the error queue. A configuring command (CONFIGURE_HEADERS) clears it
+    too, and is only known to hold until another setting is written, the settings of its function in
+    CONFIGURE_SUBSYSTEMS (digital filter) excepted.
+
+    The headers are compared as written: the drivers must use the same (short) forms. Headers relative to the previous
+    one in a compound message (no leading ':') cannot be resolved and clear the record.
+    """
+    def __init__(self):
+        self._settings = {}
+
+    def __len__(self):
+        return len(self._settings)
+
+    @staticmethod
+    def split(command):
+        """Key and argument of a setting command, both upper case, the key being None for a query
+
+        :rtype: tuple of string
+        """
+        header, _, argument = command.strip().partition(' ')
+        header = header.lstrip(':').upper()
+        if header.endswith('?'):
+            return None, ''
+        if header.startswith(CONFIGURE_HEADERS):
+            root = header.split(':')[0]
+            return root, (header[len(root):] + ' ' + argument.strip()).strip().upper()
+        return header, argument.strip().upper()
+
+    @staticmethod
+    def configures(configuration, key):
+        """Whether a setting belongs to the configuration recorded for a configuring header (see CONFIGURE_SUBSYSTEMS)
+
+        :param configuration: Recorded argument of the configuring header (':VOLT:DC 10')
+        :param key: Key of the setting ('VOLT:DC:AVER:COUN')
+        """
+        function = configuration.split(' ')[0].lstrip(':')
+        return bool(function) and any(key.startswith('{}:{}:'.format(function, subsystem))
+                                      for subsystem in CONFIGURE_SUBSYSTEMS)
+
+    def clear(self):
+        self._settings.clear()
+
+    def changed(self, *commands):
+        """Commands which would change the recorded settings, in order
+
+        :rtype: list of string
+        """
+        settings = dict(self._settings)
+        changed = []
+        for command in commands:
+            key, argument = self.split(command)
+            if key is None or settings.get(key) != argument:
+                changed.append(command)
+                settings[key] = argument
+        return changed
+
+    def observe(self, message):
+        """Update the record with a message written to the instrument"""
+        for index, command in enumerate(message.split(';')):
+            command = command.strip()
+            if not command:
+                continue
+            key, argument = self.split(command)
+            if index and not command.startswith((':', '*')):
+                self.clear()
+            elif key is None:
+                continue
+            elif key.startswith(RESET_HEADERS):
+                self.clear()
+            elif key in CONFIGURE_HEADERS:
+                self.clear()
+                self._settings[key] = argument
+            elif argument:
+                for configure_key in CONFIGURE_HEADERS:
+                    if not self.configures(self._settings.get(configure_key, ''), key):
+                        self._settings.pop(configure_key, None)
+                self._settings[key] = argument
+
+    def observe_error(self, reply):
+        """Clear the record if a reply of SYST:ERR? reports an error"""
+        if reply.strip().lstrip('+').split(',')[0] not in ('0', '-0'):
+            self.clear()
+
+
+class SharedSession:
+    """Handle of a VISA session shared by all the drivers and plugins opening the same resource
+
+    Calls to the session methods are serialized by a lock common to all the handles of the session, so that a query
+    (write then read) is never interleaved with the commands of another handle. The lock attribute can be used as a
+    context manager to make a sequence of calls atomic. The timeout and terminations are specific to each handle and
+    applied to the session before each call.
+
+    The transactions attribute counts the I/O calls (write, read or query methods) made through the handle. When the
+    instrumentation is enabled, they are also timed and recorded per command (see instrumentation.Instrumentation).
+
+    The settings written through any handle of the session are recorded by its shadow (see SettingsShadow), so that
+    write_settings only sends the commands changing the instrument state.
+
+    Closing a handle releases it, the session itself is closed with its last handle.
+    """
+    handle_attributes = ('timeout', 'read_termination', 'write_termination')
+    io_prefixes = ('write', 'read', 'query')
+
+    def __init__(self, registry, key, session, lock, shadow, **attributes):
+        object.__setattr__(self, '_registry', registry)
+        object.__setattr__(self, '_key', key)
+        object.__setattr__(self, '_session', session)
+        object.__setattr__(self, 'lock', lock)
+        object.__setattr__(self, 'shadow', shadow)
+        object.__setattr__(self, '_closed', False)
+        object.__setattr__(self, '_methods', {})
+        object.__setattr__(self, 'transactions', 0)
+        object.__setattr__(self, '_last_command', '')
+        handle = {name: getattr(session, name) for name in self.handle_attributes}
+        handle.update({name: value for name, value in attributes.items() if name in self.handle_attributes})
+        object.__setattr__(self, '_handle', handle)
+
+    def __repr__(self):
+        return '<SharedSession({!r})>'.format(self._session)
+
+    def __getattr__(self, name):
+        if name in self.handle_attributes:
+            return self._handle[name]
+        if name in self._methods:
+            return self._methods[name]
+        attr = getattr(self._session, name)
+        if not callable(attr):
+            return attr
+        io = name.startswith(self.io_prefixes)
+
+        def method(*args, **kwargs):
+            with self.lock:
+                if io:
+                    object.__setattr__(self, 'transactions', self.transactions + 1)
+                self._apply_handle()
+                try:
+                    if not (io and instrumentation.records(self._key[0])):
+                        result = attr(*args, **kwargs)
+                    else:
+                        result, command = instrumentation.call(self._key[0], name, attr, args, kwargs,
+                                                               self._last_command, self._handle['write_termination'],
+                                                               self._handle['read_termination'])
+                        if not name.startswith('read'):
+                            object.__setattr__(self, '_last_command', command)
+                except Exception:
+                    # The settings of a failed (or partially sent) command are unknown
+                    if io:
+                        self.shadow.clear()
+                    raise
+                if io and args and isinstance(args[0], str):
+                    self.shadow.observe(args[0])
+                    if 'SYST:ERR?' in args[0].upper() and isinstance(result, str):
+                        self.shadow.observe_error(result)
+                return result
+        self._methods[name] = method
+        return method
+
+    def __setattr__(self, name, value):
+        if name in self.handle_attributes:
+            self._handle[name] = value
+        else:
+            with self.lock:
+                setattr(self._session, name, value)
+
+    # The ascii values are parsed from the text reply, so that the instrumentation counts the bytes read
+    def read_ascii_values(self, converter='f', separator=',', container=list):
+        return from_ascii_block(self.read(), converter, separator, container)
+
+    def query_ascii_values(self, message, converter='f', separator=',', container=list, delay=None):
+        return from_ascii_block(self.query(message, delay), converter, separator, container)
+
+    def write_settings(self, *commands):
+        """Write the setting commands which change the state of the instrument, one message per command
+
+        :param commands: Setting commands ('HEADER argument')
+        :type commands: string
+        :return: The commands actually written
+        :rtype: list of string
+        """
+        with self.lock:
+            changed = self.shadow.changed(*commands)
+            for command in changed:
+                self.write(command)
+        return changed
+
+    def _apply_handle(self):
+        for name, value in self._handle.items():
+            if getattr(self._session, name) != value:
+                setattr(self._session, name, value)
+
+    def close(self):
+        if not self._closed:
+            object.__setattr__(self, '_closed', True)
+            self._registry.release(self._key)
+
+
+class SessionRegistry:
+    """Reference counted VISA sessions, keyed by resource name and VISA library
+
+    The first opening of a resource opens the session, the following ones only hand out a new SharedSession handle.
+    Keyword arguments other than the timeout and terminations are only used by the first opening. The settings shadow
+    of a resource lives as long as its session: a reconnection starts from an unknown state.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    @staticmethod
+    def key(resource_name, rm):
+        # The library of the resource manager resolves the default backend, so that '' and '@ni' can match
+        library = getattr(getattr(rm, 'visalib', None), 'library_path', type(rm).__name__)
+        return resource_name, str(library)
+
+    def open(self, resource_name, pyvisa_backend='', **kwargs):
+        """Return a handle of the session of a resource, opening it if needed
+
+        :param resource_name: VISA resource name or alias
+        :type resource_name: string
+        :param pyvisa_backend: pyvisa backend identifier, see get_resource_manager
+        :type pyvisa_backend: string
+        :param kwargs: Arguments of pyvisa open_resource (read_termination, write_termination, timeout...)
+        :rtype: SharedSession
+        """
+        rm = get_resource_manager(pyvisa_backend)
+        key = self.key(resource_name, rm)
+        with self._lock:
+            if key not in self._sessions:
+                session = rm.open_resource(resource_name, **kwargs)
+                self._sessions[key] = [session, threading.RLock(), 0, SettingsShadow()]
+                logger.info("VISA session opened: {}".format(resource_name))
+            entry = self._sessions[key]
+            entry[2] += 1
+        return SharedSession(self, key, entry[0], entry[1], entry[3], **kwargs)
+
+    def release(self, key):
+        with self._lock:
+            entry = self._sessions[key]
+            entry[2] -= 1
+            if entry[2] > 0:
+                return
+            del self._sessions[key]
+        with entry[1]:
+            entry[0].close()
+        logger.info("VISA session closed: {}".format(key[0]))
+
+    def handles(self, resource_name):
+        """Number of handles currently open on a resource"""
+        with self._lock:
+            return sum(entry[2] for key, entry in self._sessions.items() if key[0] == resource_name)
+
+
+sessions = SessionRegistry()
+
+
+def open_session(resource_name, pyvisa_backend='', **kwargs):
+    """Open a shared session of a VISA resource, see SessionRegistry.open"""
+    return sessions.open(resource_name, pyvisa_backend, **kwargs)
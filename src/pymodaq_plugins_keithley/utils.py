@@ -4,12 +4,138 @@ Created the 31/08/2023
 
 @author: Sebastien Weber
 """
+import json
+import threading
 from pathlib import Path
 
-from pymodaq.utils.config import BaseConfig, USER
+import numpy as np
+from pymodaq.utils.config import BaseConfig, USER, get_set_local_dir
 
 
 class Config(BaseConfig):
     """Main class to deal with configuration values for this plugin"""
     config_template_path = Path(__file__).parent.joinpath('resources/config_template.toml')
-    config_name = f"config_{__package__.split('pymodaq_plugins_')[1]}"
\ No newline at end of file
+    config_name = f"config_{__package__.split('pymodaq_plugins_')[1]}"
+
+class RingBuffer:
+    """Bounded and thread safe FIFO of numpy rows, overwriting the oldest rows when full
+
+    :param capacity: Maximum number of rows stored
+    :type capacity: int
+    :param width: Number of values in a row
+    :type width: int
+    """
+    def __init__(self, capacity, width, dtype=float):
+        self._data = np.zeros((capacity, width), dtype=dtype)
+        self._start = 0
+        self._count = 0
+        self.overruns = 0
+        self._not_empty = threading.Condition()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def capacity(self):
+        return self._data.shape[0]
+
+    def push(self, row):
+        """Append a row, the oldest one is lost (and counted as an overrun) if the buffer is full"""
+        with self._not_empty:
+            if self._count == self.capacity:
+                self._start = (self._start + 1) % self.capacity
+                self._count -= 1
+                self.overruns += 1
+            self._data[(self._start + self._count) % self.capacity] = row
+            self._count += 1
+            self._not_empty.notify_all()
+
+    def drain(self):
+        """Remove and return all the stored rows, from the oldest to the newest"""
+        with self._not_empty:
+            indexes = (self._start + np.arange(self._count)) % self.capacity
+            rows = self._data[indexes]
+            self._start = (self._start + self._count) % self.capacity
+            self._count = 0
+        return rows
+
+    def wait(self, timeout=None):
+        """Wait for at least one row to be stored, return False if timeout (s) expired before"""
+        with self._not_empty:
+            return self._not_empty.wait_for(lambda: self._count > 0, timeout)
+
+
+class RollingWindow:
+    """Preallocated (rows x length) matrix of the last columns appended, updated in place
+
+    Each column is stored twice in a matrix twice as long as the window, so that the window, from the oldest to the
+    newest column, is always a contiguous view of it: appending columns neither shifts nor reallocates the data.
+    Columns not yet appended hold the fill value, the filled property excludes them.
+
+    :param rows: Number of values in a column
+    :type rows: int
+    :param length: Number of columns of the window
+    :type length: int
+    :param fill: Initial value of the matrix
+    :type fill: float
+    """
+    def __init__(self, rows, length, fill=np.nan, dtype=float):
+        self._data = np.full((rows, 2 * length), fill, dtype=dtype)
+        self.length = length
+        # Index of the oldest column, where the next one is written, and number of columns appended (up to length)
+        self._index = 0
+        self.count = 0
+
+    def append(self, columns):
+        """Append columns, given as a (rows x n) array (the last length columns only are kept if n > length)"""
+        columns = columns[:, -self.length:]
+        indexes = (self._index + np.arange(columns.shape[1])) % self.length
+        self._data[:, indexes] = columns
+        self._data[:, indexes + self.length] = columns
+        self._index = (self._index + columns.shape[1]) % self.length
+        self.count = min(self.count + columns.shape[1], self.length)
+
+    @property
+    def window(self):
+        # View of the window, oldest column first
+        return self._data[:, self._index:self._index + self.length]
+
+    @property
+    def filled(self):
+        # View of the appended columns of the window, oldest column first
+        return self._data[:, self._index + self.length - self.count:self._index + self.length]
+
+
+class SetupCache:
+    """Host side record of the setups saved in the memory of the instruments (*SAV), stored as a json file
+
+    Each saved setup is identified by the digest of the configuration it implements, keyed by the identification
+    of the instrument and the setup memory slot.
+
+    :param path: Path of the json file, in the local PyMoDAQ configuration folder by default
+    :type path: str or Path
+    """
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else get_set_local_dir().joinpath('keithley_setups.json')
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def key(idn, slot):
+        return '{}/{}'.format(idn.strip(), slot)
+
+    def get(self, idn, slot):
+        """Return the digest of the setup saved in the slot of an instrument, None if unknown"""
+        with self._lock:
+            return self._load().get(self.key(idn, slot))
+
+    def set(self, idn, slot, digest):
+        with self._lock:
+            entries = self._load()
+            entries[self.key(idn, slot)] = digest
+            self.path.write_text(json.dumps(entries, indent=2))
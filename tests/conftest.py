@@ -0,0 +1,64 @@
+import pytest
+
+from pymodaq_plugins_keithley.hardware import visa_resources
+from pymodaq_plugins_keithley.hardware.simulator import SimulatedResourceManager
+from pymodaq_plugins_keithley.hardware.keithley27XX import keithley27XX_VISADriver
+from pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_VISADriver import Keithley27XXVISADriver
+
+K2701 = 'TCPIP0::192.168.1.101::1394::SOCKET'
+K2100 = 'USB0::0x05E6::0x2100::1149087::INSTR'
+
+
+class DictConfig:
+    """Plugin configuration read from a dictionary, config[key1, key2...] as with the toml configuration"""
+    def __init__(self, content):
+        self.content = content
+
+    def __getitem__(self, keys):
+        value = self.content
+        for key in keys if isinstance(keys, tuple) else (keys,):
+            value = value[key]
+        return value
+
+
+@pytest.fixture
+def simulator(monkeypatch):
+    """Fresh simulated instruments on a virtual clock, opened with the SIMULATOR_BACKEND"""
+    monkeypatch.setattr(visa_resources, 'config',
+                        DictConfig({'Keithley': {'simulator': {'enabled': False, 'realtime': False}}}))
+    monkeypatch.setattr(visa_resources, 'sessions', visa_resources.SessionRegistry())
+    monkeypatch.setattr(SimulatedResourceManager, 'instruments', {})
+    return visa_resources.SIMULATOR_BACKEND
+
+
+@pytest.fixture
+def simulated_plugins(simulator, monkeypatch):
+    """Simulated instruments enabled in the configuration, so that the plugins open them"""
+    monkeypatch.setattr(visa_resources, 'config',
+                        DictConfig({'Keithley': {'simulator': {'enabled': True, 'realtime': False}}}))
+    return simulator
+
+
+@pytest.fixture
+def config_27XX(monkeypatch):
+    """Configuration of a 2701 with two 7702 cards: 3 DC voltage channels, 2 thermocouples and a resistance"""
+    channels_1 = {str(101 + index): {'mode': 'volt:dc', 'nplc': 1} for index in range(3)}
+    channels_1['110'] = {'mode': 'res', 'nplc': 1}
+    channels_2 = {str(201 + index): {'mode': 'temp', 'transducer': 'tc', 'type': 'K', 'ref_junc': 'int', 'nplc': 1}
+                  for index in range(2)}
+    config = DictConfig({'Keithley': {'27XX': {'INSTRUMENT01': {
+        'rsrc_name': K2701, 'model_name': '2701', 'panel': 'rear', 'setup_slot': -1,
+        'MODULE01': {'module_name': '7702', 'CHANNELS': channels_1},
+        'MODULE02': {'module_name': '7702', 'CHANNELS': channels_2}}}}})
+    monkeypatch.setattr(keithley27XX_VISADriver, 'config', config)
+    return config
+
+
+@pytest.fixture
+def k2701(simulator, config_27XX):
+    """Connected and configured 2701"""
+    driver = Keithley27XXVISADriver(K2701)
+    driver.init_hardware(simulator)
+    driver.configuration_sequence()
+    yield driver
+    driver.close()
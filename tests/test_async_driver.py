@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from pymodaq_plugins_keithley.hardware.async_driver import AsyncDriver
+from pymodaq_plugins_keithley.hardware.keithley2100.keithley2100_VISADriver import Keithley2100VISADriver
+
+from conftest import K2100
+
+
+def test_scan_timeout_kept(k2701):
+    # Timeout modelled by set_mode when called synchronously
+    k2701.set_mode('SCAN_SCAN_LIST')
+    scan_timeout = k2701._instr.timeout
+    k2701._instr.timeout = 5000
+    k2701.set_mode('SCAN_VOLT:DC')
+
+    async def main():
+        driver = AsyncDriver(k2701, deadline=1.)
+        try:
+            await driver.set_mode('SCAN_SCAN_LIST')
+            return await driver.data(return_answer=False)
+        finally:
+            driver._executor.shutdown()
+    _, values, _ = asyncio.run(main())
+    assert values.shape == (6,)
+    assert k2701._instr.timeout == scan_timeout
+
+
+def test_timeout_restored(simulator):
+    k2100 = Keithley2100VISADriver(K2100)
+    k2100.init_hardware(simulator)
+    k2100._instr.timeout = 5000
+
+    async def main():
+        driver = AsyncDriver(k2100, deadline=1.)
+        try:
+            return await asyncio.gather(driver.read(), driver.get_idn())
+        finally:
+            driver._executor.shutdown()
+    reading, idn = asyncio.run(main())
+    assert reading == pytest.approx(1., abs=1e-3)
+    assert 'MODEL 2100' in idn
+    assert k2100._instr.timeout == 5000
+    k2100.close()
+
+
+def test_deadline_expired(simulator):
+    k2100 = Keithley2100VISADriver(K2100)
+    k2100.init_hardware(simulator)
+    k2100._instr.timeout = 5000
+
+    async def main():
+        driver = AsyncDriver(k2100)
+        try:
+            # 2000 integrations cannot end within 10 ms
+            with pytest.raises(asyncio.TimeoutError):
+                await driver.read_burst(2000, deadline=.01)
+            return await driver.read()
+        finally:
+            driver._executor.shutdown()
+    # The instrument is released for the next call
+    assert asyncio.run(main()) == pytest.approx(1., abs=1e-3)
+    assert k2100._instr.timeout == 5000
+    k2100.close()
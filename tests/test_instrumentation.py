@@ -0,0 +1,42 @@
+import pytest
+
+from pymodaq_plugins_keithley.hardware import visa_resources
+from pymodaq_plugins_keithley.hardware.instrumentation import Instrumentation, command_key
+from pymodaq_plugins_keithley.hardware.keithley2100.keithley2100_VISADriver import Keithley2100VISADriver
+
+from conftest import K2100
+
+
+@pytest.mark.parametrize('message, key', [
+    ('READ?', 'READ?'),
+    ('TRIG:COUN 5;:READ?', 'TRIG:COUN;:READ?'),
+    (b':CONF:VOLT:DC 10,0.001\n', ':CONF:VOLT:DC'),
+])
+def test_command_key(message, key):
+    assert command_key(message) == key
+
+
+@pytest.fixture
+def instrumentation(simulator, monkeypatch):
+    instrumentation = Instrumentation()
+    monkeypatch.setattr(visa_resources, 'instrumentation', instrumentation)
+    return instrumentation
+
+
+def test_records(instrumentation, simulator):
+    k2100 = Keithley2100VISADriver(K2100)
+    k2100.init_hardware(simulator)
+    k2100.read()
+    # Disabled by default
+    assert instrumentation.statistics() == {}
+    instrumentation.enable(K2100)
+    for _ in range(3):
+        k2100.read()
+    statistics = instrumentation.statistics(K2100)[K2100]
+    assert statistics['READ?']['count'] == 3
+    assert statistics['READ?']['bytes_written'] == 3 * len('READ?\n')
+    assert statistics['READ?']['bytes_read'] > 0
+    assert 'READ?' in instrumentation.report(K2100)
+    instrumentation.reset(K2100)
+    assert instrumentation.statistics(K2100) == {}
+    k2100.close()
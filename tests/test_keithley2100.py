@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from pymodaq_plugins_keithley.hardware.keithley2100.keithley2100_VISADriver import Keithley2100VISADriver
+from pymodaq_plugins_keithley.hardware.keithley2110.keithley2110_VISADriver import Keithley2110VISADriver
+
+from conftest import K2100
+
+
+@pytest.fixture
+def k2100(simulator):
+    driver = Keithley2100VISADriver(K2100)
+    driver.init_hardware(simulator)
+    # Covering the integrations of the bursts
+    driver._instr.timeout = 10000
+    driver.reset()
+    driver.set_mode('VDC')
+    yield driver
+    driver.close()
+
+
+def test_read(k2100):
+    assert k2100.read() == pytest.approx(1., abs=1e-3)
+
+
+def test_read_burst(k2100):
+    readings = k2100.read_burst(20)
+    assert readings.shape == (20,)
+    assert np.allclose(readings, 1., atol=1e-3)
+    # The sample count is only sent when it changes
+    assert k2100.read_command(20) == 'READ?'
+    assert k2100.read_command(1) == 'SAMP:COUN 1;:READ?'
+    assert k2100.read() == pytest.approx(1., abs=1e-3)
+
+
+def test_arm_burst(k2100):
+    k2100.arm_burst(10, 'BUS')
+    k2100._instr.write('*TRG')
+    readings = k2100.fetch_burst()
+    assert readings.shape == (10,)
+    assert np.allclose(readings, 1., atol=1e-3)
+    assert k2100.get_error().startswith('0')
+
+
+def test_burst_leaves_monitoring(k2100):
+    k2100.set_monitoring(True)
+    k2100.arm_burst(5, 'BUS')
+    assert not k2100.monitoring
+    k2100._instr.write('*TRG')
+    assert k2100.fetch_burst().shape == (5,)
+
+
+def test_averaging(k2100):
+    k2100.set_filter('MOV', 5)
+    k2100.set_averaging(3)
+    assert k2100._instr.query(':VOLT:DC:AVER:TCON?').strip() == 'REP'
+    assert int(float(k2100._instr.query(':VOLT:DC:AVER:COUN?'))) == 3
+    k2100.set_averaging(1)
+    assert k2100._instr.query(':VOLT:DC:AVER:TCON?').strip() == 'MOV'
+    with pytest.raises(ValueError):
+        k2100.set_averaging(k2100.max_filter_count + 1)
+
+
+def test_repeated_set_mode(k2100):
+    k2100.set_filter('REP', 5)
+    transactions = k2100._instr.transactions
+    for _ in range(3):
+        k2100.set_mode('VDC')
+    assert k2100._instr.transactions == transactions
+    k2100.set_mode('R2W')
+    assert k2100._instr.transactions > transactions
+    assert k2100.read() == pytest.approx(1e3, rel=1e-2)
+
+
+def test_repeated_set_mode_2110(simulator):
+    k2110 = Keithley2110VISADriver('K2110', simulator)
+    k2110.reset()
+    k2110.set_averaging(4)
+    k2110.set_mode('VDC')
+    transactions = k2110._instr.transactions
+    k2110.set_mode('VDC')
+    k2110.set_mode('VDC')
+    assert k2110._instr.transactions == transactions
+    assert int(float(k2110._instr.query(':VOLT:DC:AVER:COUN?'))) == 4
+    k2110.close()
+
+
+def test_monitoring(k2100):
+    k2100.set_monitoring(True)
+    assert k2100.read() == pytest.approx(1., abs=1e-3)
+    transactions = k2100._instr.transactions
+    assert k2100.read() == pytest.approx(1., abs=1e-3)
+    # Latest reading of the free running instrument, in a single query
+    assert k2100._instr.transactions - transactions == 1
+    # Kept by set_mode
+    k2100.set_mode('R2W')
+    assert k2100.monitoring
+    assert k2100._instr.query('INIT:CONT?').strip() in ('1', 'ON')
+    k2100.set_monitoring(False)
+    assert k2100._instr.query('INIT:CONT?').strip() in ('0', 'OFF')
+    assert k2100.read_burst(3).shape == (3,)
+    assert k2100.get_error().startswith('0')
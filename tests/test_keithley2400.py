@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from pymeasure.instruments.keithley import Keithley2400
+
+from pymodaq_plugins_keithley.daq_move_plugins.daq_move_Keithley2400 import DAQ_Move_Keithley2400
+from pymodaq_plugins_keithley.hardware.keithley2400.keithley2400_sweep import (list_sweep, linear_sweep, list_commands,
+                                                                                MAX_POINTS)
+from pymodaq_plugins_keithley.hardware.simulator.pymeasure_adapter import SimulatedAdapter
+
+K2400 = 'GPIB0::24::INSTR'
+# Resistive load of the simulated sourcemeter
+LOAD = 1e3
+
+
+@pytest.fixture
+def k2400(simulator):
+    instrument = Keithley2400(SimulatedAdapter(K2400, realtime=False))
+    instrument.reset()
+    instrument.apply_voltage(voltage_range=20, compliance_current=0.1)
+    instrument.measure_current()
+    instrument.enable_source()
+    yield instrument
+    instrument.shutdown()
+    instrument.adapter.connection.close()
+
+
+def test_list_commands():
+    levels = list(range(150))
+    commands = list_commands('VOLT', levels)
+    assert commands[0] == ':SOUR:VOLT:MODE LIST'
+    assert commands[1].startswith(':SOUR:LIST:VOLT 0,1,2')
+    assert commands[2].startswith(':SOUR:LIST:VOLT:APP 100,101')
+    assert len(commands) == 3
+
+
+def test_list_sweep(k2400):
+    levels = np.linspace(0, 2, 250)
+    voltages, currents = list_sweep(k2400, levels)
+    assert voltages.shape == currents.shape == (250,)
+    assert np.allclose(voltages, levels)
+    assert np.allclose(currents, levels / LOAD, rtol=1e-3)
+    # Back to a fixed source, one reading per trigger
+    assert k2400.ask(':SOUR:VOLT:MODE?').strip() == 'FIX'
+    assert int(float(k2400.ask(':TRIG:COUN?'))) == 1
+
+
+def test_linear_sweep(k2400):
+    voltages, currents = linear_sweep(k2400, -1, 1, 21)
+    assert np.allclose(voltages, np.linspace(-1, 1, 21))
+    assert np.allclose(currents, voltages / LOAD, rtol=1e-3)
+
+
+@pytest.mark.parametrize('auto_delay', [True, False])
+def test_sweep_delay_restored(k2400, auto_delay):
+    k2400.write(':SOUR:DEL:AUTO ON' if auto_delay else ':SOUR:DEL 0.05')
+    list_sweep(k2400, [0., 0.5, 1.], delay=0.01)
+    assert k2400.ask(':SOUR:DEL:AUTO?').strip() in (('1', 'ON') if auto_delay else ('0', 'OFF'))
+    if not auto_delay:
+        assert float(k2400.ask(':SOUR:DEL?')) == pytest.approx(0.05)
+
+
+def test_sweep_points(k2400):
+    with pytest.raises(ValueError):
+        linear_sweep(k2400, 0, 1, MAX_POINTS + 1)
+
+
+def test_mover_sweep(simulator):
+    mover = DAQ_Move_Keithley2400(None, None)
+    mover.settings.child('adapter').setValue('Simulator')
+    mover.settings.child('visa_ressource').setValue(K2400)
+    mover.settings.child('source_mode').setValue('Voltage')
+    assert mover.ini_stage().initialized
+    mover.enable_source(True)
+    positions = np.linspace(0, 1, 11)
+    currents = mover.sweep(positions)
+    assert np.allclose(currents, positions / LOAD, rtol=1e-3)
+    mover.close()
@@ -0,0 +1,209 @@
+import numpy as np
+import pytest
+
+from pymodaq_plugins_keithley.hardware.keithley27XX import keithley27XX_VISADriver
+from pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_VISADriver import (Keithley27XXVISADriver,
+                                                                                     parse_ascii_answer, channel_list)
+from pymodaq_plugins_keithley.utils import SetupCache
+
+from conftest import DictConfig, K2701
+
+
+def test_parse_ascii_answer():
+    answer = ('+1.01000496E+00VDC,+0000000.125SECS,+00001RDNG#,'
+              '-2.50000000E-03VDC,+0000000.250SECS,+00002RDNG#,'
+              '+1.00012000E+02OHM4W,+0000000.375SECS,+00003RDNG#')
+    values, times = parse_ascii_answer(answer)
+    assert np.allclose(values, [1.01000496, -2.5e-3, 100.012])
+    assert np.allclose(times, [0.125, 0.25, 0.375])
+
+
+@pytest.mark.parametrize('unit', ['vdc', '°C', 'Vdc'])
+def test_parse_ascii_answer_unexpected_units(unit):
+    # Units the single pass cannot remove are handled by the per element parser
+    answer = '+2.30000000E+01{0},+0000000.5SECS,+00001RDNG#,-1.5E-01{0},+0000001.0SECS,+00002RDNG#'.format(unit)
+    values, times = parse_ascii_answer(answer)
+    assert np.allclose(values, [23., -0.15])
+    assert np.allclose(times, [0.5, 1.])
+
+
+@pytest.mark.parametrize('channels, expected', [
+    ([101], '101'),
+    ([103, 101, 102, 105], '101:103,105'),
+    ([101, 103, 105], '101,103,105'),
+    ([101, 102, 201, 202, 203], '101:102,201:203'),
+])
+def test_channel_list(channels, expected):
+    assert channel_list(channels) == expected
+
+
+def test_configuration(k2701):
+    assert k2701.configured_modules == {'MODULE01': '7702', 'MODULE02': '7702'}
+    assert k2701.configuration_errors == {}
+    assert k2701.modes_channels_dict['VOLT:DC'] == [101, 102, 103]
+    assert k2701.modes_channels_dict['TEMP'] == [201, 202]
+    assert k2701.channels_scan_list == '101,102,103,110,201,202'
+    assert k2701._instr.query('FUNC? (@110,201)').replace('"', '').split(',') == ['RES', 'TEMP']
+    assert k2701.get_error().startswith('0')
+
+
+def test_data_scan_list(k2701):
+    channels = k2701.set_mode('SCAN_SCAN_LIST')
+    assert channels == '(@101,102,103,110,201,202)'
+    answer, values, times = k2701.data()
+    assert answer.count(',') + 1 == 3 * 6
+    assert values.shape == (6,)
+    assert np.all(np.diff(times) > 0)
+
+
+def test_data_mode(k2701):
+    k2701.set_mode('SCAN_VOLT:DC')
+    assert k2701.scan_channels == [101, 102, 103]
+    _, values, _ = k2701.data(return_answer=False)
+    assert values.shape == (3,)
+    # The simulated channels read about 1 V + channel number / 100
+    assert np.allclose(values, [1.01, 1.02, 1.03], atol=5e-3)
+
+
+@pytest.mark.parametrize('data_format', ['ASCII', 'SREAL', 'DREAL'])
+def test_data_buffered(k2701, data_format):
+    k2701.set_mode('SCAN_VOLT:DC')
+    k2701.set_data_format(data_format)
+    values, times = k2701.data_buffered(5, chunk_size=4, poll_interval=0.)
+    assert values.shape == times.shape == (5, 3)
+    assert np.allclose(values, [1.01, 1.02, 1.03], atol=5e-3)
+    # The scans and the channels of a scan follow each other
+    assert np.all(np.diff(times.ravel()) > 0)
+    # Back to a single scan per trigger
+    k2701.set_mode('SCAN_VOLT:DC')
+    assert k2701.data(return_answer=False)[1].shape == (3,)
+
+
+@pytest.fixture
+def k2700_serial(simulator, monkeypatch):
+    """2700 with a 7700 card on a 19200 bauds serial link, 10 DC voltage channels at 5 NPLC"""
+    channels = {str(101 + index): {'mode': 'volt:dc', 'nplc': 5} for index in range(10)}
+    config = DictConfig({'Keithley': {'27XX': {'INSTRUMENT01': {
+        'rsrc_name': 'ASRL1::INSTR', 'model_name': '2700', 'panel': 'rear', 'setup_slot': -1,
+        'MODULE01': {'module_name': '7700', 'CHANNELS': channels}}}}})
+    monkeypatch.setattr(keithley27XX_VISADriver, 'config', config)
+    driver = Keithley27XXVISADriver('ASRL1::INSTR')
+    driver.init_hardware(simulator)
+    driver._instr.baud_rate = 19200
+    driver.configuration_sequence()
+    yield driver
+    driver.close()
+
+
+def test_data_buffered_serial(k2700_serial):
+    k2700_serial.set_mode('SCAN_VOLT:DC')
+    scan_timeout = k2700_serial._instr.timeout
+    # 1000 ASCII readings last far longer than a scan on the serial link
+    assert k2700_serial.transfer_duration(1000) > scan_timeout / 1000
+    values, times = k2700_serial.data_buffered(100, chunk_size=1000, poll_interval=0.)
+    assert values.shape == (100, 10)
+    assert k2700_serial._instr.timeout == scan_timeout
+
+
+def test_scan_timeout(k2701):
+    k2701.set_mode('SCAN_SCAN_LIST')
+    # 6 channels at 1 NPLC, with the relay settling and the thermocouples overheads
+    assert 6 * 0.02 < k2701.scan_duration < 1.
+    transfer = k2701.transfer_duration(6)
+    assert k2701._instr.timeout == int(1000 * (keithley27XX_VISADriver.TIMEOUT_FACTOR * (k2701.scan_duration + transfer)
+                                               + keithley27XX_VISADriver.TIMEOUT_MARGIN))
+
+
+@pytest.mark.parametrize('poll_interval', [None, 0.001])
+def test_wait_scan(k2701, poll_interval):
+    k2701.set_mode('SCAN_VOLT:DC')
+    k2701._instr.write("INIT")
+    k2701._instr.write("*TRG")
+    k2701.wait_scan(poll_interval)
+    values, _ = parse_ascii_answer(k2701._instr.query("FETCH?"))
+    assert np.allclose(values, [1.01, 1.02, 1.03], atol=5e-3)
+
+
+@pytest.mark.parametrize('poll_interval', [None, 0.001])
+def test_wait_scan_stalled(k2701, poll_interval):
+    k2701.set_mode('SCAN_VOLT:DC')
+    # Waiting for an external trigger that never comes
+    k2701._instr.write("TRIG:SOUR EXT")
+    k2701._instr.timeout = 50
+    k2701._instr.write("INIT")
+    with pytest.raises(TimeoutError):
+        k2701.wait_scan(poll_interval)
+    # The scan is aborted, the next grab is triggered again
+    k2701.set_monitoring(False)
+    k2701.set_mode('SCAN_VOLT:DC')
+    assert np.allclose(k2701.data(return_answer=False)[1], [1.01, 1.02, 1.03], atol=5e-3)
+
+
+@pytest.mark.parametrize('mode, n_channels', [('SCAN_VOLT:DC', 3), ('SCAN_RES', 1)])
+def test_monitoring(k2701, mode, n_channels):
+    k2701.set_mode(mode)
+    k2701.set_monitoring(True)
+    assert k2701._instr.query('INIT:CONT?').strip() in ('1', 'ON')
+    transactions = k2701._instr.transactions
+    values = k2701.data(return_answer=False)[1]
+    # The latest readings are read without triggering, in a single query
+    assert k2701._instr.transactions - transactions == 1
+    assert values.shape == (n_channels,)
+    # Kept by set_mode
+    k2701.set_mode('SCAN_VOLT:DC')
+    assert k2701.monitoring
+    assert np.allclose(k2701.data(return_answer=False)[1], [1.01, 1.02, 1.03], atol=5e-3)
+    k2701.set_monitoring(False)
+    assert k2701._instr.query('INIT:CONT?').strip() in ('0', 'OFF')
+    assert k2701.data(return_answer=False)[1].shape == (3,)
+    assert k2701.get_error().startswith('0')
+
+
+@pytest.fixture
+def connect_2701(simulator, config_27XX, tmp_path):
+    """Connect and configure a 2701 whose setup is saved in the memory slot 2, the setups being recorded in tmp_path"""
+    config_27XX.content['Keithley']['27XX']['INSTRUMENT01']['setup_slot'] = 2
+    drivers = []
+
+    def connect():
+        driver = Keithley27XXVISADriver(K2701)
+        driver.setup_cache = SetupCache(tmp_path / 'setups.json')
+        driver.init_hardware(simulator)
+        driver.configuration_sequence()
+        drivers.append(driver)
+        return driver
+    yield connect
+    for driver in drivers:
+        driver.close()
+
+
+def test_setup_recalled(connect_2701):
+    k2701 = connect_2701()
+    transactions = k2701._instr.transactions
+    k2701.close()
+    k2701 = connect_2701()
+    # The setup is recalled instead of sending the configuration commands
+    assert k2701._instr.transactions < transactions
+    plan = k2701.channel_plan()
+    digest = keithley27XX_VISADriver.plan_digest(plan, k2701.configured_modules)
+    assert k2701.recall_setup(2, digest, plan)
+    assert k2701.check_setup(plan)
+    assert k2701.modes_channels_dict['TEMP'] == [201, 202]
+    k2701.set_mode('SCAN_VOLT:DC')
+    assert np.allclose(k2701.data(return_answer=False)[1], [1.01, 1.02, 1.03], atol=5e-3)
+
+
+def test_setup_overwritten(connect_2701):
+    k2701 = connect_2701()
+    # Overwritten from the front panel
+    k2701._instr.write("FUNC 'RES',(@102)")
+    k2701._instr.write("*SAV 2")
+    plan = k2701.channel_plan()
+    digest = keithley27XX_VISADriver.plan_digest(plan, k2701.configured_modules)
+    assert not k2701.check_setup(plan)
+    assert not k2701.recall_setup(2, digest, plan)
+    k2701.close()
+    # The whole sequence is sent again, and saved
+    k2701 = connect_2701()
+    assert k2701._instr.query('FUNC? (@101:103)').replace('"', '').split(',') == ['VOLT:DC'] * 3
+    assert k2701.recall_setup(2, digest, plan)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from pymodaq_plugins_keithley.hardware.keithley27XX import keithley27XX_VISADriver, keithley27XX_coordinator
+from pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_VISADriver import Keithley27XXVISADriver
+from pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_coordinator import Keithley27XXCoordinator
+
+from conftest import DictConfig, K2701
+
+
+@pytest.fixture
+def coordinator(simulator, monkeypatch):
+    """A 2700 on a serial link (7700 card) and a 2701 on ethernet (7702 card), with 4 DC voltage channels each, and a
+    front panel 2700"""
+    instruments = {}
+    for index, (rsrc_name, model, card) in enumerate([('ASRL1::INSTR', '2700', '7700'), (K2701, '2701', '7702')]):
+        channels = {str(101 + channel): {'mode': 'volt:dc', 'nplc': 1} for channel in range(4)}
+        instruments['INSTRUMENT0{}'.format(index + 1)] = {
+            'rsrc_name': rsrc_name, 'model_name': model, 'panel': 'rear', 'setup_slot': -1,
+            'MODULE01': {'module_name': card, 'CHANNELS': channels}}
+    instruments['INSTRUMENT03'] = {'rsrc_name': 'ASRL2::INSTR', 'model_name': '2700', 'panel': 'front',
+                                   'setup_slot': -1}
+    config = DictConfig({'Keithley': {'27XX': instruments}})
+    monkeypatch.setattr(keithley27XX_VISADriver, 'config', config)
+    monkeypatch.setattr(keithley27XX_coordinator, 'config', config)
+    monkeypatch.setattr(Keithley27XXVISADriver, 'list_instruments',
+                        {instr: settings['rsrc_name'] for instr, settings in instruments.items()})
+    coordinator = Keithley27XXCoordinator.from_config(simulator, mode='VOLT:DC')
+    yield coordinator
+    coordinator.close()
+
+
+def test_from_config(coordinator):
+    # The front panel instrument is skipped
+    assert [driver.rsrc_name for driver in coordinator.drivers] == ['ASRL1::INSTR', K2701]
+    for driver in coordinator.drivers:
+        assert driver.scan_channels == [101, 102, 103, 104]
+        assert driver.get_error().startswith('0')
+
+
+def test_data(coordinator):
+    data = coordinator.data()
+    assert list(data) == ['ASRL1::INSTR', K2701]
+    for values, times in data.values():
+        assert np.allclose(values, [1.01, 1.02, 1.03, 1.04], atol=5e-3)
+        assert np.all(np.diff(times) > 0)
+
+
+def test_data_merged(coordinator):
+    values, times, labels = coordinator.data_merged()
+    assert values.shape == times.shape == (8,)
+    assert labels[0] == 'ASRL1::INSTR/101'
+    assert labels[-1] == K2701 + '/104'
+    assert np.allclose(values, 2 * [1.01, 1.02, 1.03, 1.04], atol=5e-3)
+
+
+def test_map_error(coordinator):
+    def fail(driver):
+        if driver.rsrc_name == K2701:
+            raise RuntimeError(driver.rsrc_name)
+        return driver.rsrc_name
+    with pytest.raises(RuntimeError):
+        coordinator.map(fail)
+    # The other instrument is still usable
+    assert coordinator.map(lambda driver: driver.data(return_answer=False)[1].shape) == [(4,), (4,)]
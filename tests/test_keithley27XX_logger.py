@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import tables
+
+from pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_logger import Keithley27XXHDF5Logger, ScanFile
+
+
+@pytest.fixture
+def k2701_scanning(k2701):
+    k2701.set_data_format('SREAL')
+    k2701.set_mode('SCAN_SCAN_LIST')
+    return k2701
+
+
+def test_logger(k2701_scanning, tmp_path):
+    path = tmp_path / 'scans.h5'
+    logger = Keithley27XXHDF5Logger(k2701_scanning, path, buffer_scans=10, flush_interval=0.)
+    logger.start()
+    # The virtual clock of the simulator lets the scans follow each other as fast as they are fetched
+    while logger.scans < 25:
+        assert logger.buffer.wait(1.)
+        logger.buffer.drain()
+    assert logger.stop(5.)
+    assert logger.error is None
+    n_scans = logger.scans
+    with tables.open_file(str(path)) as file:
+        assert list(file.root.VOLT_DC._v_attrs.channels) == ['101', '102', '103']
+        assert list(file.root.TEMP._v_attrs.channels) == ['201', '202']
+        assert file.root.VOLT_DC.values.shape == file.root.VOLT_DC.timestamps.shape == (n_scans, 3)
+        assert file.root.RES.values.shape == (n_scans, 1)
+        assert file.root.host_time.shape == (n_scans,)
+        assert np.allclose(file.root.VOLT_DC.values[:], [1.01, 1.02, 1.03], atol=5e-3)
+        assert np.all(np.diff(file.root.VOLT_DC.timestamps[:, 0]) > 0)
+
+
+def test_logger_append(k2701_scanning, tmp_path):
+    path = tmp_path / 'scans.h5'
+    scans = 0
+    for _ in range(2):
+        logger = Keithley27XXHDF5Logger(k2701_scanning, path, buffer_scans=10)
+        logger.start()
+        assert logger.buffer.wait(1.)
+        assert logger.stop(5.)
+        scans += logger.scans
+    with tables.open_file(str(path)) as file:
+        assert file.root.TEMP.values.shape == (scans, 2)
+        assert file.root.host_time.shape == (scans,)
+
+
+def test_scan_file_channels_mismatch(k2701_scanning, tmp_path):
+    path = tmp_path / 'scans.h5'
+    ScanFile(path, k2701_scanning.scan_groups()).close()
+    groups = [('VOLT:DC', [101, 102], [0, 1])]
+    with pytest.raises(ValueError):
+        ScanFile(path, groups)
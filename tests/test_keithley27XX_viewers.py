@@ -0,0 +1,152 @@
+import numpy as np
+import pytest
+
+from pymodaq_plugins_keithley.hardware.keithley27XX import keithley27XX_VISADriver
+from pymodaq_plugins_keithley.daq_viewer_plugins.plugins_0D import daq_0Dviewer_Keithley27XX
+from pymodaq_plugins_keithley.daq_viewer_plugins.plugins_2D import daq_2Dviewer_Keithley27XX
+from pymodaq_plugins_keithley.daq_viewer_plugins.plugins_0D.daq_0Dviewer_Keithley27XX import DAQ_0DViewer_Keithley27XX
+from pymodaq_plugins_keithley.daq_viewer_plugins.plugins_2D.daq_2Dviewer_Keithley27XX import DAQ_2DViewer_Keithley27XX
+from pymodaq_plugins_keithley.hardware.keithley27XX.keithley27XX_worker import Keithley27XXScanWorker
+
+from conftest import DictConfig, K2701
+
+
+@pytest.fixture
+def viewer_0D(simulated_plugins, config_27XX, monkeypatch):
+    monkeypatch.setattr(daq_0Dviewer_Keithley27XX, 'config', config_27XX)
+    viewer = DAQ_0DViewer_Keithley27XX(None, None)
+    viewer.settings.child('resources').setValue(K2701)
+    assert viewer.ini_detector().initialized
+    exported = []
+    viewer.dte_signal.connect(exported.append)
+    yield viewer, exported
+    viewer.close()
+
+
+def set_setting(viewer, *path, value):
+    # Setting changed from the interface
+    viewer.settings.child('Keithley_Params', *path).setValue(value)
+    viewer.commit_settings(viewer.settings.child('Keithley_Params', *path))
+
+
+def test_grab(viewer_0D):
+    viewer, exported = viewer_0D
+    viewer.grab_data()
+    assert [dwa.name for dwa in exported[-1]] == ['Voltage', 'Resistance', 'Temperature']
+    voltages = exported[-1][0]
+    assert voltages.labels == ['Channel 101', 'Channel 102', 'Channel 103']
+    assert np.allclose([data[0] for data in voltages.data], [1.01, 1.02, 1.03], atol=5e-3)
+    set_setting(viewer, 'rearpanel', 'rearmode', value='TEMP')
+    viewer.grab_data()
+    assert [dwa.name for dwa in exported[-1]] == ['Temperature']
+    assert exported[-1][0].labels == ['Channel 201', 'Channel 202']
+
+
+def test_grab_averaging(viewer_0D):
+    viewer, exported = viewer_0D
+    viewer.grab_data(Naverage=4)
+    assert viewer.controller.averaging == 4
+    assert int(float(viewer.controller._instr.query('VOLT:DC:AVER:COUN? (@101)'))) == 4
+    # Limited to the count of the repeating filter
+    viewer.grab_data(Naverage=1000)
+    assert viewer.controller.averaging == viewer.controller.max_filter_count
+    viewer.grab_data()
+    assert viewer.controller.averaging == 1
+    assert viewer.controller.get_error().startswith('0')
+
+
+def test_grab_continuous(viewer_0D):
+    viewer, exported = viewer_0D
+    set_setting(viewer, 'continuous', 'continuous_enabled', value=True)
+    for _ in range(3):
+        viewer.grab_data()
+    assert isinstance(viewer.worker, Keithley27XXScanWorker)
+    assert len(exported) == 3
+    assert np.allclose([data[0] for data in exported[-1][0].data], [1.01, 1.02, 1.03], atol=5e-3)
+    # The worker is stopped by a setting change, and the instrument is available again
+    set_setting(viewer, 'continuous', 'continuous_enabled', value=False)
+    assert viewer.worker is None
+    viewer.grab_data()
+    assert len(exported) == 4
+
+
+def test_grab_logging(viewer_0D, tmp_path):
+    viewer, exported = viewer_0D
+    set_setting(viewer, 'logging', 'logging_path', value=str(tmp_path / 'scans.h5'))
+    set_setting(viewer, 'logging', 'logging_enabled', value=True)
+    viewer.grab_data()
+    viewer.grab_data()
+    assert viewer.settings['Keithley_Params', 'logging', 'logged_scans'] > 0
+    assert exported[-1][2].name == 'Temperature'
+    viewer.stop()
+    assert viewer.worker is None
+    assert (tmp_path / 'scans.h5').exists()
+
+
+def test_grab_monitoring(viewer_0D):
+    viewer, exported = viewer_0D
+    set_setting(viewer, 'monitoring', value=True)
+    assert viewer.controller.monitoring
+    transactions = viewer.controller._instr.transactions
+    viewer.grab_data()
+    assert viewer.controller._instr.transactions - transactions == 1
+    assert len(exported[-1]) == 3
+    set_setting(viewer, 'monitoring', value=False)
+    assert not viewer.controller.monitoring
+
+
+@pytest.fixture
+def viewer_2D(simulated_plugins, monkeypatch):
+    """2D viewer of a 2701 scanning a 4 x 3 grid of thermocouples, and a DC voltage channel out of the grid"""
+    channels = {str(101 + index): {'mode': 'temp', 'transducer': 'tc', 'type': 'K', 'ref_junc': 'int', 'nplc': 0.1,
+                                   'x': index % 4, 'y': index // 4} for index in range(12)}
+    channels['113'] = {'mode': 'volt:dc', 'nplc': 0.1}
+    config = DictConfig({'Keithley': {'27XX': {'INSTRUMENT01': {
+        'rsrc_name': K2701, 'model_name': '2701', 'panel': 'rear', 'setup_slot': -1,
+        'MODULE01': {'module_name': '7702', 'CHANNELS': channels}}}}})
+    for module in (keithley27XX_VISADriver, daq_0Dviewer_Keithley27XX, daq_2Dviewer_Keithley27XX):
+        monkeypatch.setattr(module, 'config', config)
+    viewer = DAQ_2DViewer_Keithley27XX(None, None)
+    viewer.settings.child('resources').setValue(K2701)
+    viewer.settings.child('image', 'window').setValue(20)
+    viewer.settings.child('buffered', 'n_scans').setValue(5)
+    # The virtual clock of the simulator only runs with the queries
+    viewer.settings.child('buffered', 'poll_interval').setValue(0.)
+    assert viewer.ini_detector().initialized
+    exported = []
+    viewer.dte_signal.connect(exported.append)
+    yield viewer, exported
+    viewer.close()
+
+
+def test_rolling_window(viewer_2D):
+    viewer, exported = viewer_2D
+    for _ in range(3):
+        viewer.grab_data()
+    assert [dwa.name for dwa in exported[-1]] == ['Voltage', 'Temperature']
+    voltages, temperatures = exported[-1]
+    # Only the acquired scans are exported until the window is filled
+    assert [dte[1].shape for dte in exported] == [(12, 5), (12, 10), (12, 15)]
+    assert voltages.shape == (1, 15)
+    assert np.allclose(voltages.axes[0].get_data(), [113])
+    assert not np.any(np.isnan(temperatures.data[0]))
+    assert np.all(np.diff(temperatures.get_axis_from_index(1)[0].get_data()) > 0)
+    # The emitted images are copies of the windows, updated in place by the next grabs
+    first = exported[0][1].data[0].copy()
+    viewer.grab_data()
+    viewer.grab_data()
+    assert exported[-1][1].shape == (12, 20)
+    assert np.array_equal(exported[0][1].data[0], first)
+
+
+def test_spatial_grid(viewer_2D):
+    viewer, exported = viewer_2D
+    viewer.settings.child('image', 'layout').setValue('Spatial grid')
+    viewer.commit_settings(viewer.settings.child('image', 'layout'))
+    viewer.grab_data()
+    voltages, temperatures = exported[-1]
+    assert temperatures.shape == (3, 4)
+    assert not np.any(np.isnan(temperatures.data[0]))
+    # No position given to the voltage channel
+    assert np.all(np.isnan(voltages.data[0]))
+    assert temperatures.data[0] is not viewer.images[1][0]
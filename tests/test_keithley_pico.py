@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from pymodaq_plugins_keithley.daq_viewer_plugins.plugins_0D.daq_0Dviewer_Keithley_Pico import \
+    DAQ_0DViewer_Keithley_Pico
+from pymodaq_plugins_keithley.daq_viewer_plugins.plugins_1D.daq_1Dviewer_Keithley_Pico import \
+    DAQ_1DViewer_Keithley_Pico
+
+PICO = 'GPIB0::14::INSTR'
+
+
+def connect(plugin_class):
+    plugin = plugin_class(None, None)
+    plugin.settings.child('VISA_ressources').setValue(PICO)
+    assert plugin.ini_detector().initialized
+    exported = []
+    plugin.dte_signal.connect(exported.append)
+    return plugin, exported
+
+
+@pytest.fixture
+def pico_0D(simulated_plugins):
+    plugin, exported = connect(DAQ_0DViewer_Keithley_Pico)
+    yield plugin, exported
+    plugin.close()
+
+
+@pytest.fixture
+def pico_1D(simulated_plugins):
+    plugin, exported = connect(DAQ_1DViewer_Keithley_Pico)
+    plugin.settings.child('buffered', 'n_points').setValue(50)
+    yield plugin, exported
+    plugin.close()
+
+
+def test_read(pico_0D):
+    plugin, exported = pico_0D
+    assert 'MODEL 6485' in plugin.settings['id']
+    plugin.grab_data(Naverage=5)
+    assert exported[-1][0].data[0][0] == pytest.approx(1e-9, rel=1e-2)
+    # The trigger count is only sent when it changes: a single READ? per grab
+    plugin.grab_data(Naverage=5)
+    assert plugin.settings['transactions'] == 1
+    assert plugin.read(3) == pytest.approx([1e-9] * 3, rel=1e-2)
+
+
+def test_trace(pico_1D):
+    plugin, exported = pico_1D
+    plugin.grab_data()
+    dwa = exported[-1][0]
+    assert dwa.dim.name == 'Data1D'
+    values = dwa.data[0]
+    times = dwa.axes[0].get_data()
+    assert values.shape == times.shape == (50,)
+    assert np.allclose(values, 1e-9, rtol=1e-2)
+    assert times[0] == 0.
+    assert np.all(np.diff(times) > 0)
+    assert plugin.controller.query(':FORM:DATA?').strip().startswith('SRE')
+
+
+def test_statistics(pico_1D):
+    plugin, exported = pico_1D
+    plugin.settings.child('buffered', 'statistics').setValue(True)
+    plugin.commit_settings(plugin.settings.child('buffered', 'statistics'))
+    plugin.grab_data()
+    mean, std = exported[-1][0].data
+    assert mean[0] == pytest.approx(1e-9, rel=1e-2)
+    assert 0 < std[0] < 1e-11
+    # Only the statistics are transferred, in ASCII
+    assert plugin.controller.query(':FORM:DATA?').strip().startswith('ASC')
+    assert exported[-1][0].labels == ['CURR', 'CURR std']
+
+
+def test_trace_then_read(pico_1D):
+    # The 0D plugin and the trace share the session of the instrument
+    plugin_1D, exported_1D = pico_1D
+    plugin_0D, exported_0D = connect(DAQ_0DViewer_Keithley_Pico)
+    plugin_1D.grab_data()
+    plugin_0D.grab_data(Naverage=2)
+    assert exported_0D[-1][0].data[0][0] == pytest.approx(1e-9, rel=1e-2)
+    plugin_1D.grab_data()
+    assert exported_1D[-1][0].data[0].shape == (50,)
+    assert plugin_0D.controller.query('SYST:ERR?').startswith('0')
+    plugin_0D.close()
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from pymodaq_plugins_keithley.hardware import visa_resources
+from pymodaq_plugins_keithley.hardware.keithley2100.keithley2100_VISADriver import Keithley2100VISADriver
+from pymodaq_plugins_keithley.hardware.trigger_link import (TriggerLinkGroup, Keithley27XXLinkMember,
+                                                            Keithley2100LinkMember, KeithleyPicoLinkMember,
+                                                            trigger_times)
+
+from conftest import DictConfig, K2100
+
+# Readings of the simulated instruments at 1 NPLC (50 Hz line): integration and firmware time (s)
+K2100_READING = 1 / 50 + .0005
+PICO = 'GPIB0::14::INSTR'
+
+
+@pytest.fixture
+def realtime(simulator, monkeypatch):
+    # The 2100 burst is timed by the host: the simulated instruments follow the wall clock
+    monkeypatch.setattr(visa_resources, 'config',
+                        DictConfig({'Keithley': {'simulator': {'enabled': False, 'realtime': True}}}))
+    return simulator
+
+
+@pytest.fixture
+def group(realtime, k2701):
+    k2701.set_mode('SCAN_VOLT:DC')
+    k2100 = Keithley2100VISADriver(K2100)
+    k2100.init_hardware(realtime)
+    k2100._instr.timeout = 10000
+    k2100.set_mode('VDC')
+    k2100._instr.write(':VOLT:DC:NPLC 1')
+    pico = visa_resources.open_session(PICO, realtime, read_termination='\r', timeout=10000)
+    pico.write('*RST;:CONF:CURR;:CURR:NPLC 1;:FORM:ELEM READ;:TRIG:COUN 3')
+    group = TriggerLinkGroup([Keithley27XXLinkMember(k2701), Keithley2100LinkMember(k2100),
+                              KeithleyPicoLinkMember(pico)])
+    yield group
+    group.close()
+    k2100.close()
+    pico.close()
+
+
+def test_trigger_times():
+    assert np.allclose(trigger_times([10., 10.5, 11.]), [.5, 1., 1.5])
+    assert np.allclose(trigger_times([[1., 1.1], [1.2, 1.3]]), [[.1, .2], [.3, .4]])
+
+
+def test_acquire(group):
+    k2701, k2100, pico = group.members[0].driver, group.members[1].driver, group.members[2].session
+    readings = group.acquire(20)
+    values, times = readings[k2701.rsrc_name]
+    assert values.shape == times.shape[:1] + (3,) == (20, 3)
+    assert np.allclose(values, [1.01, 1.02, 1.03], atol=5e-3)
+    delay = times[0]
+
+    # The 2100 starts at the end of the first reading of the master, its readings evenly spaced
+    values, times = readings[K2100]
+    assert values.shape == (20, 1)
+    assert np.allclose(values, 1., atol=1e-3)
+    expected = delay + K2100_READING * np.arange(1, 21)
+    assert np.allclose(times, expected, atol=.01)
+
+    values, times = readings[PICO]
+    assert values.shape == (20, 1)
+    assert np.all(np.diff(times) > 0) and times[0] > delay
+
+    merged, merged_times, labels = group.merged(readings)
+    assert merged.shape == (20, 5)
+    assert labels == ['{}/{}'.format(k2701.rsrc_name, channel) for channel in (101, 102, 103)] + \
+        ['{}/reading'.format(K2100), '{}/reading'.format(PICO)]
+    assert np.array_equal(merged_times, readings[k2701.rsrc_name][1])
+
+
+def test_disarm(group):
+    k2701, k2100, pico = group.members[0].driver, group.members[1].driver, group.members[2].session
+    k2100.set_monitoring(True)
+    group.acquire(5)
+    # Every instrument is back in its mode and settings
+    assert k2701.mode == 'SCAN_VOLT:DC'
+    assert k2701.data(return_answer=False)[1].shape == (3,)
+    assert k2100.monitoring
+    assert pico.query(':FORM:ELEM?').strip() == 'READ'
+    assert int(float(pico.query(':TRIG:COUN?'))) == 3
+    assert pico.query(':ARM:SOUR?').strip() == 'IMM'
+    for error in (k2701.get_error(), k2100.get_error(), pico.query('SYST:ERR?')):
+        assert error.startswith('0')
@@ -0,0 +1,93 @@
+import threading
+
+import numpy as np
+import pytest
+
+from pymodaq_plugins_keithley.utils import RingBuffer, RollingWindow
+from pymodaq_plugins_keithley.hardware.visa_resources import SettingsShadow
+
+
+def test_ring_buffer_drain():
+    buffer = RingBuffer(4, 2)
+    for index in range(3):
+        buffer.push([index, 10 * index])
+    assert len(buffer) == 3
+    assert np.array_equal(buffer.drain(), [[0, 0], [1, 10], [2, 20]])
+    assert len(buffer) == 0
+    assert buffer.drain().shape == (0, 2)
+
+
+def test_ring_buffer_overrun():
+    buffer = RingBuffer(3, 1)
+    for index in range(5):
+        buffer.push([index])
+    assert buffer.overruns == 2
+    assert np.array_equal(buffer.drain()[:, 0], [2, 3, 4])
+
+
+def test_ring_buffer_wait():
+    buffer = RingBuffer(2, 1)
+    assert not buffer.wait(timeout=0.01)
+    threading.Timer(0.01, buffer.push, ([1.],)).start()
+    assert buffer.wait(timeout=5)
+
+
+def test_rolling_window():
+    window = RollingWindow(2, 4)
+    assert np.isnan(window.window).all()
+    assert window.filled.shape == (2, 0)
+    window.append(np.array([[0, 1], [10, 11]]))
+    assert np.array_equal(window.filled, [[0, 1], [10, 11]])
+    assert np.isnan(window.window[:, :2]).all()
+    window.append(np.array([[2, 3, 4], [12, 13, 14]]))
+    assert np.array_equal(window.window, [[1, 2, 3, 4], [11, 12, 13, 14]])
+    assert np.array_equal(window.filled, window.window)
+    # More columns than the window: the last ones only are kept
+    window.append(np.arange(12).reshape(2, 6))
+    assert np.array_equal(window.window, [[2, 3, 4, 5], [8, 9, 10, 11]])
+
+
+def test_shadow_changed():
+    shadow = SettingsShadow()
+    shadow.observe('TRIG:SOUR BUS;:SAMP:COUN 3')
+    assert shadow.changed('TRIG:SOUR BUS', 'SAMP:COUN 4', 'TRIG:COUN 1') == ['SAMP:COUN 4', 'TRIG:COUN 1']
+    # Headers and arguments are compared regardless of the case and of the leading colon
+    assert shadow.changed(':trig:sour bus') == []
+    # Queries are always sent
+    assert shadow.changed('SAMP:COUN?') == ['SAMP:COUN?']
+
+
+def test_shadow_cleared():
+    shadow = SettingsShadow()
+    shadow.observe('TRIG:SOUR BUS')
+    shadow.observe('*RST')
+    assert len(shadow) == 0
+    shadow.observe('TRIG:SOUR BUS;SAMP:COUN 3')
+    assert len(shadow) == 0, 'A relative header cannot be resolved'
+    shadow.observe('TRIG:SOUR BUS')
+    shadow.observe_error('0,"No error"')
+    assert len(shadow) == 1
+    shadow.observe_error('-113,"Undefined header"')
+    assert len(shadow) == 0
+
+
+@pytest.mark.parametrize('command', [':CONF:VOLT:DC', 'CONF:VOLT:DC'])
+def test_shadow_configure(command):
+    shadow = SettingsShadow()
+    shadow.observe('TRIG:COUN 5')
+    shadow.observe(command)
+    assert shadow.changed(':CONF:VOLT:DC', 'TRIG:COUN 5') == ['TRIG:COUN 5']
+    # The configuration no longer holds once a setting is written
+    shadow.observe('VOLT:DC:NPLC 1')
+    assert shadow.changed(':CONF:VOLT:DC') == [':CONF:VOLT:DC']
+
+
+def test_shadow_configure_filter():
+    shadow = SettingsShadow()
+    shadow.observe(':CONF:VOLT:DC')
+    shadow.observe(':VOLT:DC:AVER:COUN 10')
+    shadow.observe(':VOLT:DC:AVER:STAT ON')
+    # The filter of the configured function does not end the configuration, the filter of another function does
+    assert shadow.changed(':CONF:VOLT:DC', ':VOLT:DC:AVER:COUN 10') == []
+    shadow.observe(':RES:AVER:STAT OFF')
+    assert shadow.changed(':CONF:VOLT:DC') == [':CONF:VOLT:DC']